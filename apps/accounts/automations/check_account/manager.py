@@ -118,15 +118,26 @@ class CheckRepeatHandler(BaseCheckHandler):
         return hashlib.md5(secret.encode()).hexdigest()
 
     def add_password_for_check_repeat(self):
-        accounts = Account.objects.all().only('id', '_secret', 'secret_type')
+        accounts = Account.objects.all() \
+            .only('id', 'org_id', 'asset_id', '_secret', 'secret_type') \
+            .order_by('id')
         sql = "INSERT INTO accounts (digest) VALUES (?)"
 
-        for account in accounts:
-            secret = account.secret
-            if not secret:
-                continue
-            digest = self.digest(secret)
-            self.cursor.execute(sql, [digest])
+        # 按 id 分批从 vault 批量读取 secret, 不用 offset, 越往后越慢
+        batch_size = 1000
+        last_id = None
+        while True:
+            batch = accounts if last_id is None else accounts.filter(id__gt=last_id)
+            batch = list(batch[:batch_size].prefetch_secrets())
+            if not batch:
+                break
+            last_id = batch[-1].id
+            for account in batch:
+                secret = account.secret
+                if not secret:
+                    continue
+                digest = self.digest(secret)
+                self.cursor.execute(sql, [digest])
         self.conn.commit()
 
     def clean(self):
@@ -230,7 +241,7 @@ class CheckAccountManager(BaseManager):
         print("Engine: {}".format(handler.__class__.__name__))
         for i in range(0, len(self.assets), self.batch_size):
             _assets = self.assets[i: i + self.batch_size]
-            accounts = Account.objects.filter(asset__in=_assets)
+            accounts = Account.objects.filter(asset__in=_assets).prefetch_secrets()
 
             print("Start to check accounts: {}".format(len(accounts)))
 
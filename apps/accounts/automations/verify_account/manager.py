@@ -43,7 +43,7 @@ class VerifyAccountManager(AccountBasePlaybookManager):
             return host
 
         accounts = asset.all_accounts.all()
-        accounts = self.get_accounts(account, accounts)
+        accounts = self.get_accounts(account, accounts).prefetch_secrets()
         inventory_hosts = []
 
         for account in accounts:
@@ -1,8 +1,11 @@
+from common.utils import get_logger
 from .service import AmazonSecretsManagerClient
 from ..base.vault import BaseVault
 from ..utils.mixins import GeneralVaultMixin
 from ...const import VaultTypeChoices
 
+logger = get_logger(__name__)
+
 
 class Vault(GeneralVaultMixin, BaseVault):
     type = VaultTypeChoices.aws
@@ -14,3 +17,15 @@ class Vault(GeneralVaultMixin, BaseVault):
             access_key_id=kwargs.get('VAULT_AWS_ACCESS_KEY_ID'),
             secret_key=kwargs.get('VAULT_AWS_ACCESS_SECRET_KEY'),
         )
+
+    def _get_many(self, entries):
+        names = [entry.full_path for entry in entries]
+        try:
+            secrets = self.client.get_many(names)
+        except Exception as e:
+            logger.warning(f'Batch get secret value error, fallback to get one by one: {e}')
+            return super()._get_many(entries)
+        return {
+            entry.instance.pk: entry.get_decrypt_secret(secrets.get(entry.full_path))
+            for entry in entries
+        }
@@ -39,6 +39,16 @@ class AmazonSecretsManagerClient(object):
         except Exception: # noqa
             return ''
 
+    def get_many(self, names):
+        """ BatchGetSecretValue 每次最多 20 个, 不存在的 secret 不返回 """
+        secrets = {}
+        for i in range(0, len(names), 20):
+            response = self.client.batch_get_secret_value(SecretIdList=names[i:i + 20])
+            for item in response.get('SecretValues', []):
+                secret = item.get('SecretString', '')
+                secrets[item['Name']] = secret if secret != self.empty_secret else ''
+        return secrets
+
     def create(self, name, secret):
         self.client.create_secret(Name=name, SecretString=secret or self.empty_secret)
 
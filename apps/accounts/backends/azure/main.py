@@ -6,6 +6,8 @@ from ...const import VaultTypeChoices
 
 class Vault(GeneralVaultMixin, BaseVault):
     type = VaultTypeChoices.azure
+    # Key Vault 没有批量读取, 并发太高容易被限流
+    max_workers = 4
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -1,19 +1,81 @@
 import importlib
 import inspect
-
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
+from django.conf import settings
 from django.forms.models import model_to_dict
 
+from common.utils import get_logger
+from common.utils.crypto import crypto
 from .entries import BaseEntry
 from ...const import VaultTypeChoices
 
+logger = get_logger(__name__)
+
+
+class SecretCache:
+    """
+    进程内短时间缓存从 vault 读取的 secret, 加密后保存
+    VAULT_SECRET_CACHE_TTL 为 0 时不缓存, 本进程更新或删除时清除, 其它进程依赖过期时间
+    """
+    max_size = 10000
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        if not self.enabled:
+            return 0
+        return settings.VAULT_SECRET_CACHE_TTL
+
+    @staticmethod
+    def get_key(instance):
+        return instance._meta.label, str(instance.pk)
+
+    def get(self, instance):
+        if not self.ttl:
+            return None
+        item = self._data.get(self.get_key(instance))
+        if not item or item[0] < time.time():
+            return None
+        return crypto.decrypt(item[1])
+
+    def set(self, instance, secret):
+        if not self.ttl or not secret:
+            return
+        value = (time.time() + self.ttl, crypto.encrypt(secret))
+        with self._lock:
+            key = self.get_key(instance)
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, instance):
+        with self._lock:
+            self._data.pop(self.get_key(instance), None)
+
 
 class BaseVault(ABC):
+    # get_many 没有批量接口时的并发数
+    max_workers = 10
+    metadata_fields = [
+        'name', 'username', 'secret_type',
+        'connectivity', 'su_from', 'privileged'
+    ]
+
     def __init__(self, *args, **kwargs):
         self.enabled = kwargs.get('VAULT_ENABLED')
         self._entry_classes = {}
         self._load_entries()
+        self.secret_cache = SecretCache(enabled=self.type != VaultTypeChoices.local)
 
     def _load_entries_import_module(self, module_name):
         module = importlib.import_module(module_name)
@@ -37,16 +99,59 @@ class BaseVault(ABC):
 
     def get(self, instance):
         """ 返回 secret 值 """
-        return self._get(self.build_entry(instance))
-
-    def create(self, instance):
+        secret = self.secret_cache.get(instance)
+        if secret is not None:
+            return secret
+        secret = self._get(self.build_entry(instance))
+        self.secret_cache.set(instance, secret)
+        return secret
+
+    def get_many(self, instances):
+        """ 批量返回 secret 值, {instance.pk: secret} """
+        secrets, entries = {}, []
+        for instance in instances:
+            secret = self.secret_cache.get(instance)
+            if secret is not None:
+                secrets[instance.pk] = secret
+            else:
+                entries.append(self.build_entry(instance))
+        if not entries:
+            return secrets
+
+        fetched = self._get_many(entries)
+        for entry in entries:
+            secret = fetched.get(entry.instance.pk)
+            self.secret_cache.set(entry.instance, secret)
+            secrets[entry.instance.pk] = secret
+        return secrets
+
+    def _get_many(self, entries):
+        """ 后端没有批量读取的接口, 用有限的并发逐个读取 """
+
+        def get(entry):
+            try:
+                return self._get(entry)
+            except Exception as e:
+                logger.error(f'Get secret error: {entry.full_path} {e}')
+                return None
+
+        workers = min(self.max_workers, len(entries))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            secrets = list(executor.map(get, entries))
+        return {entry.instance.pk: secret for entry, secret in zip(entries, secrets)}
+
+    def create(self, instance, clean_db_secret=True):
+        """ clean_db_secret=False 时由调用方批量清除数据库中的 secret """
         if not instance.secret_has_save_to_vault:
             entry = self.build_entry(instance)
             self._create(entry)
-            self._clean_db_secret(instance)
+            self.secret_cache.delete(instance)
+            if clean_db_secret:
+                self._clean_db_secret(instance)
             self.save_metadata(entry)
 
     def update(self, instance):
+        self.secret_cache.delete(instance)
         entry = self.build_entry(instance)
         if not instance.secret_has_save_to_vault:
             self._update(entry)
@@ -57,17 +162,31 @@ class BaseVault(ABC):
             self.save_metadata(entry)
 
     def delete(self, instance):
+        self.secret_cache.delete(instance)
         entry = self.build_entry(instance)
         self._delete(entry)
 
     def save_metadata(self, entry):
-        metadata = model_to_dict(entry.instance, fields=[
-            'name', 'username', 'secret_type',
-            'connectivity', 'su_from', 'privileged'
-        ])
+        metadata = model_to_dict(entry.instance, fields=self.metadata_fields)
         metadata = {k: str(v)[:500] for k, v in metadata.items() if v}
         return self._save_metadata(entry, metadata)
 
+    def save_metadata_many(self, instances):
+        """ 批量修改后同步 metadata, 用有限的并发逐个保存 """
+        if self.type == VaultTypeChoices.local or not instances:
+            return
+
+        def save(entry):
+            try:
+                self.save_metadata(entry)
+            except Exception as e:
+                logger.error(f'Save metadata error: {entry.full_path} {e}')
+
+        entries = [self.build_entry(instance) for instance in instances]
+        workers = min(self.max_workers, len(entries))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(save, entries))
+
     def build_entry(self, instance):
         if self.type == VaultTypeChoices.local:
             return BaseEntry(instance)
@@ -0,0 +1,57 @@
+import time
+from collections import Counter
+
+from ..base.vault import BaseVault
+
+__all__ = ['Vault']
+
+
+class Vault(BaseVault):
+    """
+    保存在内存中的 vault, 用于离线测试和压测批量读取, 不要在生产环境使用
+    VAULT_FAKE_LATENCY 模拟每次请求的网络延迟 (秒)
+    """
+    type = 'fake'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latency = kwargs.get('VAULT_FAKE_LATENCY') or 0
+        self.data = {}
+        self.calls = Counter()
+
+    def request(self, method):
+        self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def is_active(self):
+        return True, ''
+
+    def _get(self, entry):
+        self.request('get')
+        return entry.get_decrypt_secret(self.data.get(entry.full_path))
+
+    def _get_many(self, entries):
+        self.request('get_many')
+        return {
+            entry.instance.pk: entry.get_decrypt_secret(self.data.get(entry.full_path))
+            for entry in entries
+        }
+
+    def _create(self, entry):
+        self.request('create')
+        self.data[entry.full_path] = entry.get_encrypt_secret()
+
+    def _update(self, entry):
+        self.request('update')
+        self.data[entry.full_path] = entry.get_encrypt_secret()
+
+    def _delete(self, entry):
+        self.request('delete')
+        self.data.pop(entry.full_path, None)
+
+    def _clean_db_secret(self, instance):
+        pass
+
+    def _save_metadata(self, entry, metadata):
+        pass
@@ -17,6 +17,9 @@ class Vault(BaseVault):
         secret = getattr(entry.instance, '_secret', None)
         return secret
 
+    def _get_many(self, entries):
+        return {entry.instance.pk: self._get(entry) for entry in entries}
+
     def _create(self, entry):
         """ Ignore """
         pass
@@ -0,0 +1,37 @@
+# Generated by Django 4.1.13 on 2026-10-18 10:00
+
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('accounts', '0007_alter_account_connectivity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VaultSyncCheckpoint',
+            fields=[
+                ('created_by', models.CharField(blank=True, max_length=128, null=True, verbose_name='Created by')),
+                ('updated_by', models.CharField(blank=True, max_length=128, null=True, verbose_name='Updated by')),
+                ('date_created', models.DateTimeField(auto_now_add=True, null=True, verbose_name='Date created')),
+                ('date_updated', models.DateTimeField(auto_now=True, verbose_name='Date updated')),
+                ('comment', models.TextField(blank=True, default='', verbose_name='Comment')),
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('vault_type', models.CharField(max_length=16, verbose_name='Vault type')),
+                ('model', models.CharField(max_length=128, verbose_name='Model')),
+                ('cursor', models.CharField(blank=True, default='', max_length=128, verbose_name='Cursor')),
+                ('total', models.IntegerField(default=0, verbose_name='Total')),
+                ('succeeded', models.IntegerField(default=0, verbose_name='Succeeded')),
+                ('failed', models.IntegerField(default=0, verbose_name='Failed')),
+                ('skipped', models.IntegerField(default=0, verbose_name='Skipped')),
+                ('is_finished', models.BooleanField(default=False, verbose_name='Finished')),
+            ],
+            options={
+                'verbose_name': 'Vault sync checkpoint',
+                'unique_together': {('vault_type', 'model')},
+            },
+        ),
+    ]
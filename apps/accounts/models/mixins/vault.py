@@ -8,6 +8,27 @@ __all__ = ['VaultQuerySetMixin', 'VaultManagerMixin', 'VaultModelMixin']
 
 
 class VaultQuerySetMixin(models.QuerySet):
+    _prefetch_secrets = False
+
+    def prefetch_secrets(self):
+        """ 取出结果时一次从 vault 批量读取 secret, 避免循环中逐个请求 """
+        clone = self._chain()
+        clone._prefetch_secrets = True
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._prefetch_secrets = self._prefetch_secrets
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is not None
+        super()._fetch_all()
+        if fetched or not self._prefetch_secrets:
+            return
+        instances = [obj for obj in self._result_cache if isinstance(obj, VaultModelMixin)]
+        if instances:
+            self.model.prefetch_secrets(instances)
 
     def update(self, **kwargs):
         """
@@ -60,12 +81,25 @@ class VaultModelMixin(models.Model):
         if self.__secret:
             return self.__secret
         from accounts.backends import vault_client
-        secret = vault_client.get(self)
+        self.__secret = self._resolve_secret(vault_client.get(self))
+        return self.__secret
+
+    def _resolve_secret(self, secret):
         if not secret and not self.secret_has_save_to_vault:
             # vault_client 获取不到, 并且 secret 没有保存到 vault, 就从 self._secret 获取
             secret = self._secret
-        self.__secret = secret
-        return self.__secret
+        return secret
+
+    @classmethod
+    def prefetch_secrets(cls, instances):
+        """ 批量读取 secret 并缓存到实例上 """
+        from accounts.backends import vault_client
+        instances = [i for i in instances if not i.__secret]
+        if not instances:
+            return
+        secrets = vault_client.get_many(instances)
+        for instance in instances:
+            instance.__secret = instance._resolve_secret(secrets.get(instance.pk))
 
     @secret.setter
     def secret(self, value):
@@ -83,6 +117,12 @@ class VaultModelMixin(models.Model):
         self.skip_history_when_saving = True
         self.save()
 
+    @classmethod
+    def bulk_mark_secret_save_to_vault(cls, pks):
+        """ 批量标记, 不触发 post_save 信号, 也不产生历史记录 """
+        mark = cls._secret_save_to_vault_mark
+        return cls._base_manager.filter(pk__in=pks).update(_secret=mark)
+
     @property
     def secret_has_save_to_vault(self):
         return self._secret == self._secret_save_to_vault_mark
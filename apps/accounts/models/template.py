@@ -3,6 +3,7 @@ from django.db.models import Count, Q
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from common.signals import pre_bulk_update, post_bulk_update
 from labels.mixins import LabeledMixin
 from .account import Account
 from .base import BaseAccount, SecretWithRandomMixin
@@ -49,9 +50,54 @@ class AccountTemplate(LabeledMixin, BaseAccount, SecretWithRandomMixin):
             ).first()
             return account
 
+    def get_sync_conflict_account_ids(self, accounts):
+        """
+        同步名称, 用户名, 密钥类型后会违反唯一约束的账号, 只查询一次:
+        资产上已有其它同名或同用户名的账号, 或者同一个资产上有多个该模板的账号
+        """
+        template_asset_ids = Account.objects.filter(source_id=self.id).values('asset_id')
+        conflict_asset_ids = set(
+            Account.objects.filter(asset_id__in=template_asset_ids)
+            .exclude(source_id=self.id)
+            .filter(Q(name=self.name) | Q(username=self.username, secret_type=self.secret_type))
+            .values_list('asset_id', flat=True)
+        )
+        conflict_ids, seen_asset_ids = set(), set()
+        for account in sorted(accounts, key=lambda a: str(a.id)):
+            if account.asset_id in conflict_asset_ids or account.asset_id in seen_asset_ids:
+                conflict_ids.add(account.id)
+            seen_asset_ids.add(account.asset_id)
+        return conflict_ids
+
+    def bulk_sync_related_accounts(self, conflict_ids, user=None):
+        """
+        冲突的账号解除关联, 其它的账号一次 UPDATE 同步名称, 用户名, 密钥类型, 再同步密钥
+        不逐个发送 post_save, 前后发送 pre_bulk_update / post_bulk_update, 由 user 记录操作日志
+        """
+        if conflict_ids:
+            Account._base_manager.filter(id__in=conflict_ids).update(source_id=None)
+        accounts = list(Account.objects.filter(source_id=self.id))
+        if not accounts:
+            return accounts
+
+        pre_bulk_update.send(Account, instances=accounts, user=user)
+        fields = {'name': self.name, 'username': self.username, 'secret_type': self.secret_type}
+        Account._base_manager.filter(id__in=[a.id for a in accounts]).update(**fields)
+        for account in accounts:
+            for attr, value in fields.items():
+                setattr(account, attr, value)
+        self.bulk_sync_account_secret(accounts, user.id if user else None)
+        post_bulk_update.send(
+            Account, instances=accounts, fields={*fields, 'version', '_secret'}, user=user
+        )
+        return accounts
+
     def bulk_update_accounts(self, accounts):
+        from accounts.backends import vault_client
+        from accounts.const import VaultTypeChoices
+
         history_model = Account.history.model
-        account_ids = accounts.values_list('id', flat=True)
+        account_ids = [account.id for account in accounts]
         history_accounts = history_model.objects.filter(id__in=account_ids)
         account_id_count_map = {
             str(i['id']): i['count']
@@ -61,9 +107,13 @@ class AccountTemplate(LabeledMixin, BaseAccount, SecretWithRandomMixin):
 
         for account in accounts:
             account_id = str(account.id)
-            account.version = account_id_count_map.get(account_id) + 1
+            account.version = account_id_count_map.get(account_id, 0) + 1
             account.secret = self.get_secret()
-        Account.objects.bulk_update(accounts, ['version', 'secret'])
+        # 不逐个发送 post_save, 历史记录由 bulk_create_history_accounts 批量创建
+        Account._base_manager.bulk_update(accounts, ['version', '_secret'], batch_size=1000)
+        if vault_client.type != VaultTypeChoices.local:
+            for account in accounts:
+                vault_client.update(account)
 
     @staticmethod
     def bulk_create_history_accounts(accounts, user_id):
@@ -0,0 +1,34 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+from common.db.models import JMSBaseModel
+
+__all__ = ['VaultSyncCheckpoint']
+
+
+class VaultSyncCheckpoint(JMSBaseModel):
+    """ 同步 secret 到 vault 的进度, 每个 model 一条, 任务中断后从 cursor 继续 """
+    vault_type = models.CharField(max_length=16, verbose_name=_('Vault type'))
+    model = models.CharField(max_length=128, verbose_name=_('Model'))
+    cursor = models.CharField(max_length=128, default='', blank=True, verbose_name=_('Cursor'))
+    total = models.IntegerField(default=0, verbose_name=_('Total'))
+    succeeded = models.IntegerField(default=0, verbose_name=_('Succeeded'))
+    failed = models.IntegerField(default=0, verbose_name=_('Failed'))
+    skipped = models.IntegerField(default=0, verbose_name=_('Skipped'))
+    is_finished = models.BooleanField(default=False, verbose_name=_('Finished'))
+
+    class Meta:
+        verbose_name = _('Vault sync checkpoint')
+        unique_together = ('vault_type', 'model')
+
+    def __str__(self):
+        return f'{self.vault_type}:{self.model}'
+
+    @property
+    def processed(self):
+        return self.succeeded + self.failed + self.skipped
+
+    def reset(self):
+        self.cursor = ''
+        self.succeeded = self.failed = self.skipped = 0
+        self.is_finished = False
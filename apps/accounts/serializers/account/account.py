@@ -189,6 +189,12 @@ class AccountCreateUpdateSerializerMixin(serializers.Serializer):
             self.push_account_if_need(instance, push_now, params, stat)
         return instance
 
+    def clean_bulk_update_attrs(self, instance, attrs):
+        attrs.pop('username', None)
+        attrs.pop('on_invalid', None)
+        attrs['source_id'] = None
+        return attrs
+
     def update(self, instance, validated_data):
         # account cannot be modified
         validated_data.pop('username', None)
@@ -255,6 +261,12 @@ class AccountSerializer(AccountCreateUpdateSerializerMixin, BaseAccountSerialize
         fields_unimport_template = ['params']
         # 手动判断唯一性校验
         validators = []
+        # 不修改密文时直接 bulk_update, 密文需要逐个保存到 vault 和历史中
+        use_model_bulk_update = True
+        bulk_update_fields = [
+            'name', 'username', 'privileged', 'is_active', 'comment',
+            'su_from', 'secret_reset', 'on_invalid',
+        ]
 
     @classmethod
     def setup_eager_loading(cls, queryset):
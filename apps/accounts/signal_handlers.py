@@ -11,7 +11,7 @@ from accounts.const import Source
 from audits.const import ActivityChoices
 from audits.signal_handlers import create_activities
 from common.decorators import merge_delay_run
-from common.signals import django_ready
+from common.signals import django_ready, post_bulk_update
 from common.utils import get_logger, i18n_fmt
 from common.utils.connection import RedisPubSub
 from .exceptions import VaultException
@@ -68,6 +68,14 @@ def on_account_delete(sender, instance, **kwargs):
     create_accounts_activities(instance, action='delete')
 
 
+@receiver(post_bulk_update, sender=Account)
+def on_accounts_bulk_update_save_metadata(sender, instances=(), fields=(), **kwargs):
+    # bulk_update 不发送 post_save, metadata 相关字段变化时一次同步到 vault
+    if not set(fields or ()) & set(vault_client.metadata_fields):
+        return
+    vault_client.save_metadata_many(instances)
+
+
 class VaultSignalHandler(object):
     """ 处理 Vault 相关的信号 """
 
@@ -2,8 +2,9 @@ from datetime import datetime
 
 from celery import shared_task
 from django.shortcuts import get_object_or_404
-from django.utils.translation import gettext_lazy as _
+from django.utils.translation import gettext_lazy as _, gettext_noop
 
+from common.utils import i18n_fmt
 from orgs.utils import tmp_to_root_org, tmp_to_org
 
 
@@ -17,43 +18,40 @@ from orgs.utils import tmp_to_root_org, tmp_to_org
 )
 def template_sync_related_accounts(template_id, user_id=None):
     from accounts.models import Account, AccountTemplate
+    from audits.const import ActivityChoices
+    from audits.signal_handlers import create_activities
+    from users.models import User
+
     with tmp_to_root_org():
         template = get_object_or_404(AccountTemplate, id=template_id)
     org_id = template.org_id
 
     with tmp_to_org(org_id):
-        accounts = Account.objects.filter(source_id=template_id)
+        accounts = list(Account.objects.filter(source_id=template_id).select_related('asset'))
     if not accounts:
         print('\033[35m>>> 没有需要同步的账号, 结束任务')
         print('\033[0m')
         return
 
-    failed, succeeded = 0, 0
-    succeeded_account_ids = []
-    name = template.name
-    username = template.username
-    secret_type = template.secret_type
     print(
         f'\033[32m>>> 开始同步模板名称、用户名、密钥类型到相关联的账号 ({datetime.now().strftime("%Y-%m-%d %H:%M:%S")})')
     with tmp_to_org(org_id):
+        conflict_ids = template.get_sync_conflict_account_ids(accounts)
         for account in accounts:
-            account.name = name
-            account.username = username
-            account.secret_type = secret_type
-            try:
-                account.save(update_fields=['name', 'username', 'secret_type'])
-                succeeded += 1
-                succeeded_account_ids.append(account.id)
-            except Exception as e:
-                account.source_id = None
-                account.save(update_fields=['source_id'])
-                print(f'\033[31m- 同步失败: [{account}] 原因: [{e}]')
-                failed += 1
-        accounts = Account.objects.filter(id__in=succeeded_account_ids)
-        if accounts:
-            print(f'\033[33m>>> 批量更新账号密文 ({datetime.now().strftime("%Y-%m-%d %H:%M:%S")})')
-            template.bulk_sync_account_secret(accounts, user_id)
+            if account.id in conflict_ids:
+                print(f'\033[31m- 同步失败: [{account}] 原因: [资产上已存在同名或同用户名的账号]')
+
+        print(f'\033[33m>>> 批量更新账号信息和密文 ({datetime.now().strftime("%Y-%m-%d %H:%M:%S")})')
+        # 后台任务中没有 request, 操作日志记录为发起同步的用户
+        user = User.objects.filter(id=user_id).first() if user_id else None
+        synced = template.bulk_sync_related_accounts(conflict_ids, user)
+        asset_ids = list({account.asset_id for account in accounts})
+
+    detail = i18n_fmt(gettext_noop('Sync account template to related accounts: %s'), template.name)
+    create_activities(asset_ids, detail, None, ActivityChoices.operate_log, org_id)
 
+    failed = len(conflict_ids)
+    succeeded = len(synced)
     total = succeeded + failed
     print(
         f'\033[33m>>> 同步完成:, '
@@ -1,4 +1,5 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from celery import shared_task
@@ -6,27 +7,106 @@ from django.utils.translation import gettext_lazy as _
 
 from accounts.backends import vault_client
 from accounts.const import VaultTypeChoices
-from accounts.models import Account, AccountTemplate
+from accounts.models import Account, AccountTemplate, VaultSyncCheckpoint
 from common.utils import get_logger
 from orgs.utils import tmp_to_root_org
 
 logger = get_logger(__name__)
 
+CHUNK_SIZE = 500
+
 
 def sync_instance(instance):
-    instance_desc = f'[{instance._meta.verbose_name}-{instance.id}-{instance}]'
+    """ 只写入 vault, 数据库中的 secret 由调用方按批次清除 """
+    instance_desc = f'[{instance._meta.verbose_name}-{instance.pk}-{instance}]'
     if instance.secret_has_save_to_vault:
-        msg = f'\033[32m- 跳过同步: {instance_desc}, 原因: [已同步]'
-        return "skipped", msg
+        return "skipped", None
 
     try:
-        vault_client.create(instance)
+        vault_client.create(instance, clean_db_secret=False)
     except Exception as e:
         msg = f'\033[31m- 同步失败: {instance_desc}, 原因: [{e}]'
         return "failed", msg
     else:
-        msg = f'\033[32m- 同步成功: {instance_desc}'
-        return "succeeded", msg
+        return "succeeded", None
+
+
+def iter_chunks(model, cursor=None):
+    """ 按主键顺序分批读取, 内存中最多保留一批 """
+    queryset = model.objects.all().order_by('pk')
+    while True:
+        qs = queryset.filter(pk__gt=cursor) if cursor else queryset
+        chunk = list(qs[:CHUNK_SIZE])
+        if not chunk:
+            return
+        yield chunk
+        cursor = chunk[-1].pk
+
+
+def get_checkpoints(models):
+    """ 上一次全部同步完成时重新开始, 否则继续未完成的 """
+    checkpoints = VaultSyncCheckpoint.objects.filter(vault_type=vault_client.type)
+    if checkpoints and all(c.is_finished for c in checkpoints):
+        checkpoints.delete()
+
+    result = {}
+    for model in models:
+        checkpoint, __ = VaultSyncCheckpoint.objects.get_or_create(
+            vault_type=vault_client.type, model=model._meta.label
+        )
+        result[model] = checkpoint
+    return result
+
+
+def sync_model(model, checkpoint, executor):
+    label = model._meta.label
+    if checkpoint.is_finished:
+        print(f'\033[32m>>> 跳过: {label}, 上次已完成')
+        return checkpoint
+    checkpoint.total = model.objects.count()
+    if checkpoint.cursor:
+        print(f'\033[33m>>> 继续同步: {label}, 从 {checkpoint.cursor} 开始, 已处理: {checkpoint.processed}')
+
+    start = time.time()
+    processed = 0
+    for chunk in iter_chunks(model, checkpoint.cursor or None):
+        # 每次最多提交一批, 处理完再读取下一批
+        succeeded_pks = []
+        for instance, (status, msg) in zip(chunk, executor.map(sync_instance, chunk)):
+            if msg:
+                print(msg)
+            if status == "succeeded":
+                succeeded_pks.append(instance.pk)
+            elif status == "failed":
+                checkpoint.failed += 1
+            else:
+                checkpoint.skipped += 1
+
+        if succeeded_pks:
+            model.bulk_mark_secret_save_to_vault(succeeded_pks)
+        checkpoint.succeeded += len(succeeded_pks)
+        checkpoint.cursor = str(chunk[-1].pk)
+        checkpoint.save()
+
+        processed += len(chunk)
+        rate = processed / max(time.time() - start, 0.001)
+        print(
+            f'\033[33m>>> {label}: {checkpoint.processed}/{checkpoint.total}, '
+            f'成功: {checkpoint.succeeded}, 失败: {checkpoint.failed}, '
+            f'跳过: {checkpoint.skipped}, 速度: {rate:.1f}/s'
+        )
+
+    checkpoint.is_finished = True
+    checkpoint.save()
+    print(
+        f'\033[33m>>> 同步完成: {label}, '
+        f'共计: {checkpoint.processed}, '
+        f'成功: {checkpoint.succeeded}, '
+        f'失败: {checkpoint.failed}, '
+        f'跳过: {checkpoint.skipped}, '
+        f'耗时: {time.time() - start:.1f}s'
+    )
+    return checkpoint
 
 
 @shared_task(
@@ -44,35 +124,13 @@ def sync_secret_to_vault():
         print('\033[31m>>> 当前第三方 Vault 客户端初始化失败，数据存储在本地数据库')
         return
 
-    failed, skipped, succeeded = 0, 0, 0
     to_sync_models = [Account, AccountTemplate, Account.history.model]
     print(f'\033[33m>>> 开始同步密钥数据到 Vault ({datetime.now().strftime("%Y-%m-%d %H:%M:%S")})')
-    with tmp_to_root_org():
-        instances = []
+    max_workers = 1 if VaultTypeChoices.azure == vault_client.type else 10
+    with tmp_to_root_org(), ThreadPoolExecutor(max_workers=max_workers) as executor:
+        checkpoints = get_checkpoints(to_sync_models)
         for model in to_sync_models:
-            instances += list(model.objects.all())
+            sync_model(model, checkpoints[model], executor)
 
-        max_workers = 1 if VaultTypeChoices.azure == vault_client.type else 10
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            tasks = [executor.submit(sync_instance, instance) for instance in instances]
-
-            for future in as_completed(tasks):
-                status, msg = future.result()
-                print(msg)
-                if status == "succeeded":
-                    succeeded += 1
-                elif status == "failed":
-                    failed += 1
-                elif status == "skipped":
-                    skipped += 1
-
-    total = succeeded + failed + skipped
-    print(
-        f'\033[33m>>> 同步完成: {model.__module__}, '
-        f'共计: {total}, '
-        f'成功: {succeeded}, '
-        f'失败: {failed}, '
-        f'跳过: {skipped}'
-    )
     print(f'\033[33m>>> 全部同步完成 ({datetime.now().strftime("%Y-%m-%d %H:%M:%S")})')
     print('\033[0m')
@@ -1,3 +1,189 @@
-from django.test import TestCase
+import uuid
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from accounts.backends.fake.main import Vault as FakeVault
+from accounts.models import Account, AccountTemplate, VaultSyncCheckpoint
+from common.utils import random_string
+
+
+class VaultGetManyTests(SimpleTestCase):
+    def setUp(self):
+        self.vault = FakeVault(VAULT_ENABLED=True)
+        self.accounts = []
+        for i in range(20):
+            account = Account(
+                id=uuid.uuid4(), asset_id=uuid.uuid4(),
+                org_id=uuid.uuid4(), _secret=f'secret-{i}'
+            )
+            self.vault.create(account)
+            self.accounts.append(account)
+        self.vault.calls.clear()
+
+    def test_get_many(self):
+        secrets = self.vault.get_many(self.accounts)
+        self.assertEqual(self.vault.calls['get_many'], 1)
+        self.assertEqual(self.vault.calls['get'], 0)
+        for account in self.accounts:
+            self.assertEqual(secrets[account.pk], account._secret)
+
+    def test_default_get_many_use_get(self):
+        secrets = super(FakeVault, self.vault)._get_many(
+            [self.vault.build_entry(a) for a in self.accounts]
+        )
+        self.assertEqual(self.vault.calls['get'], len(self.accounts))
+        self.assertEqual(secrets[self.accounts[0].pk], 'secret-0')
+
+    @override_settings(VAULT_SECRET_CACHE_TTL=60)
+    def test_secret_cache(self):
+        self.vault.get_many(self.accounts)
+        self.vault.get_many(self.accounts)
+        self.vault.get(self.accounts[0])
+        self.assertEqual(self.vault.calls['get_many'], 1)
+        self.assertEqual(self.vault.calls['get'], 0)
+
+        account = self.accounts[0]
+        account._secret = 'changed'
+        self.vault.update(account)
+        self.assertEqual(self.vault.get(account), 'changed')
+
+    def test_secret_cache_disabled(self):
+        self.vault.get_many(self.accounts)
+        self.vault.get_many(self.accounts)
+        self.assertEqual(self.vault.calls['get_many'], 2)
+
+
+class TemplateSyncRelatedAccountsTests(TestCase):
+    def setUp(self):
+        from assets.models import Host, Platform
+        from orgs.models import Organization
+        from orgs.utils import set_current_org
+        from users.models import User
+
+        set_current_org(Organization.default())
+        name = random_string(8)
+        self.user = User.objects.create(username=name, name=name, email=name + '@example.com')
+        self.template = AccountTemplate.objects.create(
+            name='tpl-' + name, username='root', secret_type='password', secret='old-secret'
+        )
+        platform = Platform.objects.get(name='Linux')
+        self.accounts = []
+        for i in range(3):
+            host = Host.objects.create(name=f'host-{name}-{i}', address='127.0.0.1', platform=platform)
+            self.accounts.append(Account.objects.create(
+                asset=host, name=self.template.name, username='root',
+                secret_type='password', secret='old-secret', source_id=str(self.template.id)
+            ))
+        # 同一个资产上已有同名的账号, 同步时解除关联
+        self.conflict = self.accounts[0]
+        Account.objects.create(asset=self.conflict.asset, name='tpl-new', username='admin', secret='x')
+
+    def test_sync(self):
+        from accounts.tasks.template import template_sync_related_accounts
+        from audits.models import OperateLog
+        from orgs.utils import tmp_to_root_org
+
+        self.template.name = 'tpl-new'
+        self.template.secret = 'new-secret'
+        self.template.save()
+        template_sync_related_accounts(str(self.template.id), str(self.user.id))
+
+        self.conflict.refresh_from_db()
+        self.assertIsNone(self.conflict.source_id)
+        synced = self.accounts[1:]
+        for account in synced:
+            account.refresh_from_db()
+            self.assertEqual(account.name, 'tpl-new')
+            self.assertEqual(account.secret, 'new-secret')
+            self.assertEqual(account.history.count(), 2)
+
+        # 后台任务中没有 request, 操作日志记录为发起同步的用户
+        with tmp_to_root_org():
+            logs = OperateLog.objects.filter(resource_id__in=[str(a.id) for a in synced])
+            self.assertEqual(logs.count(), len(synced))
+            self.assertEqual(set(logs.values_list('user', flat=True)), {str(self.user)})
+
+
+class SyncSecretToVaultTests(TestCase):
+    amount = 5
+
+    def setUp(self):
+        from orgs.models import Organization
+        from orgs.utils import set_current_org
+
+        set_current_org(Organization.default())
+        name = random_string(6)
+        self.templates = [
+            AccountTemplate.objects.create(
+                name=f'tpl-{name}-{i}', username='root', secret_type='password', secret=f'secret-{i}'
+            )
+            for i in range(self.amount)
+        ]
+        self.templates.sort(key=lambda t: t.pk)
+        self.secrets = {t.pk: t._secret for t in self.templates}
+        self.vault = FakeVault(VAULT_ENABLED=True)
+        for patcher in (
+                mock.patch('accounts.tasks.vault.vault_client', self.vault),
+                mock.patch('accounts.tasks.vault.CHUNK_SIZE', 2),
+                mock.patch('builtins.print'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def sync(self):
+        from accounts.tasks.vault import get_checkpoints, sync_model
+
+        checkpoint = get_checkpoints([AccountTemplate])[AccountTemplate]
+        # 同步执行, 不用线程池
+        return sync_model(AccountTemplate, checkpoint, SimpleNamespace(map=map))
+
+    def assert_all_saved_to_vault(self):
+        for template in self.templates:
+            template.refresh_from_db()
+            self.assertTrue(template.secret_has_save_to_vault)
+            self.assertEqual(self.vault.get(template), self.secrets[template.pk])
+
+    def test_sync(self):
+        checkpoint = self.sync()
+        self.assertTrue(checkpoint.is_finished)
+        self.assertEqual((checkpoint.total, checkpoint.succeeded), (self.amount, self.amount))
+        self.assertEqual(self.vault.calls['create'], self.amount)
+        self.assert_all_saved_to_vault()
+
+    def test_resume_after_interrupted(self):
+        mark = AccountTemplate.bulk_mark_secret_save_to_vault
+        calls = []
+
+        def mark_then_crash(pks):
+            calls.append(pks)
+            if len(calls) > 1:
+                raise RuntimeError('crash')
+            return mark(pks)
+
+        with mock.patch.object(AccountTemplate, 'bulk_mark_secret_save_to_vault', side_effect=mark_then_crash):
+            with self.assertRaises(RuntimeError):
+                self.sync()
+
+        checkpoint = VaultSyncCheckpoint.objects.get(vault_type=self.vault.type, model=AccountTemplate._meta.label)
+        self.assertEqual(checkpoint.cursor, str(self.templates[1].pk))
+        self.assertFalse(checkpoint.is_finished)
+
+        # 从第一批之后继续, 已经完成的不再写入 vault
+        self.vault.calls.clear()
+        checkpoint = self.sync()
+        self.assertTrue(checkpoint.is_finished)
+        self.assertEqual(checkpoint.succeeded, self.amount)
+        self.assertEqual(self.vault.calls['create'], self.amount - 2)
+        self.assert_all_saved_to_vault()
+
+    def test_restart_after_finished(self):
+        self.sync()
+        self.vault.calls.clear()
+
+        checkpoint = self.sync()
+        self.assertTrue(checkpoint.is_finished)
+        self.assertEqual((checkpoint.skipped, checkpoint.succeeded), (self.amount, 0))
+        self.assertEqual(self.vault.calls['create'], 0)
 
-# Create your tests here.
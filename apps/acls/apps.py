@@ -5,3 +5,7 @@ from django.utils.translation import gettext_lazy as _
 class AclsConfig(AppConfig):
     name = 'acls'
     verbose_name = _('App Acls')
+
+    def ready(self):
+        from . import signal_handlers  # noqa
+        super().ready()
@@ -0,0 +1,270 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from ipaddress import ip_address, ip_network
+
+from common.cache import CacheNamespace
+from common.utils import get_logger
+from common.utils.timezone import local_now
+from orgs.utils import current_org
+from .const import ActionChoices
+
+logger = get_logger(__name__)
+
+__all__ = ['IPIntervalTable', 'WeeklyTimeBitmap', 'CompiledACL', 'LoginACLMatcher']
+
+MINUTES_OF_DAY = 24 * 60
+
+
+class IPIntervalTable:
+    """
+    ip 组预先解析为合并后按起点排序的区间, 查找时二分, 和 contains_ip 的规则一致:
+    单个 ip, 网段 (192.168.1.0/24), 范围 (10.1.1.1-10.1.1.20), 其他值 (主机名) 精确匹配
+    """
+
+    def __init__(self, ip_group):
+        self.match_all = '*' in ip_group
+        self.others = set()
+        intervals = {4: [], 6: []}
+        for item in ip_group:
+            interval = self.parse(item)
+            if interval:
+                version, start, end = interval
+                intervals[version].append((start, end))
+            else:
+                self.others.add(item)
+        self.tables = {v: self.merge(items) for v, items in intervals.items()}
+
+    @staticmethod
+    def parse(item):
+        try:
+            address = ip_address(item)
+            return address.version, int(address), int(address)
+        except ValueError:
+            pass
+        try:
+            network = ip_network(item)
+            return network.version, int(network.network_address), int(network.broadcast_address)
+        except ValueError:
+            pass
+        if '-' not in item:
+            return None
+        try:
+            start, end = [ip_address(i) for i in item.split('-')]
+        except ValueError:
+            return None
+        if start.version != end.version:
+            return None
+        low, high = sorted([int(start), int(end)])
+        return start.version, low, high
+
+    @staticmethod
+    def merge(intervals):
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return [s for s, __ in merged], [e for __, e in merged]
+
+    def contains(self, ip):
+        if self.match_all or ip in self.others:
+            return True
+        try:
+            address = ip_address(ip)
+        except ValueError:
+            return False
+        starts, ends = self.tables[address.version]
+        value = int(address)
+        i = bisect.bisect_right(starts, value) - 1
+        return i >= 0 and value <= ends[i]
+
+
+class WeeklyTimeBitmap:
+    """
+    时间段预先解析为一周按分钟的位图, 第 weekday * 1440 + minute 位为 1 表示允许,
+    和 contains_time_period 的规则一致: 首尾分钟都包含, 结束时间 00:00 表示 24:00
+    """
+
+    def __init__(self, time_periods):
+        bitmap = 0
+        for item in time_periods:
+            try:
+                weekday = int(item['id']) % 7
+            except (KeyError, TypeError, ValueError):
+                continue
+            for period in (item.get('value') or '').split('、'):
+                minutes = self.parse_period(period)
+                if not minutes:
+                    continue
+                start, end = minutes
+                offset = weekday * MINUTES_OF_DAY
+                bitmap |= ((1 << (end - start + 1)) - 1) << (offset + start)
+        self.bitmap = bitmap
+
+    @staticmethod
+    def parse_minute(value):
+        hour, minute = value.strip().split(':')
+        return int(hour) * 60 + int(minute)
+
+    @classmethod
+    def parse_period(cls, period):
+        if '~' not in period:
+            return None
+        try:
+            start, end = [cls.parse_minute(i) for i in period.split('~')]
+        except ValueError:
+            logger.error('Invalid time period: {}'.format(period))
+            return None
+        if end == 0:
+            end = MINUTES_OF_DAY
+        end = min(end, MINUTES_OF_DAY - 1)
+        if start > end:
+            return None
+        return start, end
+
+    def contains(self, dt):
+        weekday = dt.isoweekday() % 7
+        index = weekday * MINUTES_OF_DAY + dt.hour * 60 + dt.minute
+        return bool(self.bitmap >> index & 1)
+
+
+class CompiledACL:
+    """
+    编译后的 ACL, 只保留匹配和处理用到的字段, 匹配时不访问数据库
+    """
+    ActionChoices = ActionChoices
+    __slots__ = ('id', 'name', 'action', 'users', 'ip_table', 'time_bitmap', 'has_reviewers')
+
+    def __init__(self, acl, has_reviewers):
+        self.id = acl.id
+        self.name = acl.name
+        self.action = acl.action
+        self.users = acl.users.value
+        self.has_reviewers = has_reviewers
+        rules = acl.rules or {}
+        ip_group = rules.get('ip_group')
+        time_periods = rules.get('time_period')
+        self.ip_table = IPIntervalTable(ip_group) if ip_group else None
+        if time_periods and not all(item.get('value') == '' for item in time_periods):
+            self.time_bitmap = WeeklyTimeBitmap(time_periods)
+        else:
+            self.time_bitmap = None
+
+    def __str__(self):
+        return self.name
+
+    def is_action(self, action):
+        return self.action == action
+
+    def is_match(self, ip, now):
+        if self.is_action(ActionChoices.review) and not self.has_reviewers:
+            return False
+        if self.ip_table and not self.ip_table.contains(ip):
+            return False
+        if self.time_bitmap and not self.time_bitmap.contains(now):
+            return False
+        return True
+
+
+class LoginACLMatcher:
+    """
+    进程内编译好的登录 ACL, 登录时只在内存中匹配, 不查询数据库
+
+    - 所有有效的 ACL 按优先级编译为 CompiledACL 列表, 以全局版本号为准, ACL 变化时增加
+    - 用户属于哪些 ACL 以 (用户, 组织) 缓存, 用户或角色变化时增加该用户的版本号
+    - 每次匹配只从 Redis 读取一次版本号
+    - 版本号的 key 过期后会读到 0, 本地缓存最多保留 cache.timeout, 避免旧的版本号重新匹配
+    """
+    cache = CacheNamespace('acls:login-acl', timeout=60 * 60 * 24)
+    max_size = 10000
+    _rules = (None, [], 0)
+    _user_acl_ids = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def expire(cls, user_ids=None):
+        if user_ids is None:
+            cls.cache.expire()
+        else:
+            cls.cache.expire_many(str(i) for i in user_ids)
+
+    @classmethod
+    def compile(cls):
+        from .models import LoginACL
+
+        acls = list(LoginACL.objects.filter(is_active=True))
+        through = LoginACL.reviewers.through
+        reviewed_ids = set(
+            through.objects.filter(loginacl_id__in=[acl.id for acl in acls])
+            .values_list('loginacl_id', flat=True)
+        )
+        return [CompiledACL(acl, acl.id in reviewed_ids) for acl in acls]
+
+    @classmethod
+    def get_expired_at(cls):
+        return time.monotonic() + cls.cache.timeout
+
+    @classmethod
+    def get_rules(cls, generation):
+        rules_generation, rules, expired_at = cls._rules
+        if rules_generation == generation and expired_at > time.monotonic():
+            return rules
+        rules = cls.compile()
+        cls._rules = (generation, rules, cls.get_expired_at())
+        logger.debug('Compile login acls: generation={} count={}'.format(generation, len(rules)))
+        return rules
+
+    @classmethod
+    def user_in_acl(cls, user, rule):
+        from .models import LoginACL
+
+        # 和 JSONManyToManyDescriptor.get_filter_q 的规则一致
+        value = rule.users
+        if not isinstance(value, dict):
+            return False
+        tp = value.get('type')
+        if tp == 'all':
+            return True
+        if tp == 'ids' and isinstance(value.get('ids'), list):
+            return str(user.id) in map(str, value['ids'])
+        if tp == 'attrs' and isinstance(value.get('attrs'), list):
+            return LoginACL.users.is_match(user, value['attrs'])
+        return False
+
+    @classmethod
+    def get_user_acl_ids(cls, user, rules, generations):
+        key = (str(user.id), str(current_org.id))
+        item = cls._user_acl_ids.get(key)
+        if item and item[0] == generations and item[2] > time.monotonic():
+            return item[1]
+
+        acl_ids = frozenset(rule.id for rule in rules if cls.user_in_acl(user, rule))
+        with cls._lock:
+            cls._user_acl_ids[key] = (generations, acl_ids, cls.get_expired_at())
+            cls._user_acl_ids.move_to_end(key)
+            while len(cls._user_acl_ids) > cls.max_size:
+                cls._user_acl_ids.popitem(last=False)
+        return acl_ids
+
+    @classmethod
+    def get_user_rules(cls, user):
+        generations = cls.cache.get_generations(scope=str(user.id))
+        rules = cls.get_rules(generations[0])
+        acl_ids = cls.get_user_acl_ids(user, rules, tuple(generations))
+        return [rule for rule in rules if rule.id in acl_ids]
+
+    @classmethod
+    def match(cls, user, ip, now=None):
+        """ 返回第一个匹配的 CompiledACL, 没有时返回 None """
+        now = now or local_now()
+        for rule in cls.get_user_rules(user):
+            if rule.is_match(ip, now):
+                return rule
+        return None
+
+    @classmethod
+    def has_acl(cls, user, acl_id):
+        return any(str(rule.id) == str(acl_id) for rule in cls.get_user_rules(user))
@@ -0,0 +1,55 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from common.decorators import on_transaction_commit
+from rbac.models import RoleBinding, OrgRoleBinding, SystemRoleBinding
+from users.models import User
+from .matcher import LoginACLMatcher
+from .models import LoginACL
+
+
+@receiver([post_save, post_delete], sender=LoginACL)
+@receiver(m2m_changed, sender=LoginACL.reviewers.through)
+@on_transaction_commit
+def on_login_acl_change(sender, **kwargs):
+    LoginACLMatcher.expire()
+
+
+# 登录时会更新这些字段, 和 ACL 的用户属性无关
+USER_IGNORE_FIELDS = {'last_login', 'date_updated', 'date_api_key_last_used'}
+
+
+@receiver(post_save, sender=User)
+@on_transaction_commit
+def on_user_change(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= USER_IGNORE_FIELDS:
+        return
+    LoginACLMatcher.expire(user_ids=[instance.id])
+
+
+@receiver(post_delete, sender=User)
+@on_transaction_commit
+def on_user_delete(sender, instance, **kwargs):
+    # 用户可能是审批人
+    LoginACLMatcher.expire()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@on_transaction_commit
+def on_user_groups_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post'):
+        return
+    if not reverse:
+        LoginACLMatcher.expire(user_ids=[instance.id])
+    elif pk_set:
+        LoginACLMatcher.expire(user_ids=pk_set)
+    else:
+        LoginACLMatcher.expire()
+
+
+@receiver([post_save, post_delete], sender=RoleBinding)
+@receiver([post_save, post_delete], sender=OrgRoleBinding)
+@receiver([post_save, post_delete], sender=SystemRoleBinding)
+@on_transaction_commit
+def on_role_binding_change(sender, instance, **kwargs):
+    LoginACLMatcher.expire(user_ids=[instance.user_id])
@@ -1,3 +1,124 @@
-from django.test import TestCase
+import datetime
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+
+from common.utils import contains_ip, random_string
+from orgs.models import Organization
+from orgs.utils import set_current_org
+from users.models import User, UserGroup
+from .const import ActionChoices
+from .matcher import IPIntervalTable, WeeklyTimeBitmap, LoginACLMatcher
+from .models import LoginACL
+
+
+class IPIntervalTableTests(SimpleTestCase):
+    ip_group = [
+        '192.168.1.0/24', '10.1.1.20-10.1.1.1', '1.1.1.1',
+        'host.local', '2001:db8::/64',
+    ]
+
+    def test_same_as_contains_ip(self):
+        table = IPIntervalTable(self.ip_group)
+        ips = [
+            '192.168.1.77', '192.168.2.1', '10.1.1.5', '10.1.1.21',
+            '1.1.1.1', 'host.local', '2001:db8::5', '2001:db9::1', 'unknown',
+        ]
+        for ip in ips:
+            self.assertEqual(table.contains(ip), contains_ip(ip, self.ip_group), ip)
+
+    def test_match_all(self):
+        self.assertTrue(IPIntervalTable(['*']).contains('8.8.8.8'))
+
+
+class WeeklyTimeBitmapTests(SimpleTestCase):
+    def test_contains(self):
+        bitmap = WeeklyTimeBitmap([
+            {'id': 0, 'value': '00:00~00:00'},
+            {'id': 1, 'value': '00:00~07:30、10:00~13:00'},
+            {'id': 2, 'value': ''},
+        ])
+        monday = datetime.datetime(2026, 10, 19, 7, 30)
+        self.assertTrue(bitmap.contains(monday))
+        self.assertFalse(bitmap.contains(monday.replace(minute=31)))
+        self.assertTrue(bitmap.contains(monday.replace(hour=13, minute=0)))
+        self.assertTrue(bitmap.contains(datetime.datetime(2026, 10, 18, 23, 59)))
+        self.assertFalse(bitmap.contains(datetime.datetime(2026, 10, 20, 12, 0)))
+
+
+class LoginACLMatcherTests(TestCase):
+    ips = ['10.1.1.1', '192.168.1.1', '8.8.8.8']
+
+    def setUp(self):
+        set_current_org(Organization.default())
+        self.users = [self.create_user('acl-a'), self.create_user('acl-b'), self.create_user('other')]
+        self.create_acl(
+            {'type': 'ids', 'ids': [str(self.users[0].id)]},
+            ['10.0.0.0/8'], ActionChoices.reject, priority=10
+        )
+        self.create_acl(
+            {'type': 'attrs', 'attrs': [{'name': 'username', 'match': 'startswith', 'value': 'acl-'}]},
+            ['192.168.1.0/24'], ActionChoices.notice, priority=20
+        )
+        self.create_acl({'type': 'all'}, ['8.8.8.8'], ActionChoices.warning, priority=30)
+        LoginACLMatcher.expire()
+
+    @staticmethod
+    def create_user(prefix):
+        name = '{}-{}'.format(prefix, random_string(6).lower())
+        return User.objects.create(username=name, name=name, email=name + '@example.com')
+
+    @staticmethod
+    def create_acl(users, ip_group, action, priority=50):
+        return LoginACL.objects.create(
+            name='acl-' + random_string(8), users=users, action=action,
+            priority=priority, rules={'ip_group': ip_group}
+        )
+
+    @staticmethod
+    def match_id(user, ip):
+        rule = LoginACLMatcher.match(user, ip)
+        return rule.id if rule else None
+
+    def test_same_as_get_match_rule_acls(self):
+        for user in self.users:
+            for ip in self.ips:
+                acl = LoginACL.get_match_rule_acls(user, ip)
+                self.assertEqual(self.match_id(user, ip), acl.id if acl else None, (user.username, ip))
+
+    def test_recompile_after_acl_saved(self):
+        user = self.users[2]
+        self.assertIsNone(self.match_id(user, '10.1.1.1'))
+        with self.captureOnCommitCallbacks(execute=True):
+            acl = self.create_acl({'type': 'all'}, ['10.1.1.1'], ActionChoices.reject, priority=1)
+        self.assertEqual(self.match_id(user, '10.1.1.1'), acl.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            acl.is_active = False
+            acl.save()
+        self.assertIsNone(self.match_id(user, '10.1.1.1'))
+
+    def test_recompile_after_user_groups_changed(self):
+        user = self.users[2]
+        group = UserGroup.objects.create(name='group-' + random_string(6))
+        acl = self.create_acl(
+            {'type': 'attrs', 'attrs': [{'name': 'groups', 'match': 'm2m', 'value': [str(group.id)]}]},
+            ['10.1.1.1'], ActionChoices.reject, priority=1
+        )
+        LoginACLMatcher.expire()
+        self.assertIsNone(self.match_id(user, '10.1.1.1'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.groups.add(group)
+        self.assertEqual(self.match_id(user, '10.1.1.1'), acl.id)
+
+    def test_local_cache_timeout(self):
+        user = self.users[2]
+        self.match_id(user, '8.8.8.8')
+        # 版本号没变, 超过 timeout 后也要重新编译
+        later = time.monotonic() + LoginACLMatcher.cache.timeout + 1
+        with mock.patch.object(LoginACLMatcher, 'compile', wraps=LoginACLMatcher.compile) as compile_acls, \
+                mock.patch('acls.matcher.time.monotonic', return_value=later):
+            self.match_id(user, '8.8.8.8')
+        compile_acls.assert_called_once()
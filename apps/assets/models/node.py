@@ -12,6 +12,7 @@ from django.db.models import F, Q, Manager
 from django.db.transaction import atomic
 from django.utils.translation import gettext_lazy as _, gettext
 
+from common.metrics import metrics
 from common.utils import get_logger, timeit
 from common.utils.lock import DistributedLock
 from orgs.mixins.models import OrgManager, JMSOrgBaseModel
@@ -279,7 +280,9 @@ class NodeAllAssetsMappingMixin:
     def get_node_all_asset_ids_mapping(cls, org_id):
         _mapping = cls.get_node_all_asset_ids_mapping_from_memory(org_id)
         if _mapping:
+            metrics.inc('jumpserver_cache_requests_total', cache='node_asset_mapping_memory', result='hit')
             return _mapping
+        metrics.inc('jumpserver_cache_requests_total', cache='node_asset_mapping_memory', result='miss')
 
         with cls.get_lock(org_id):
             _mapping = cls.get_node_all_asset_ids_mapping_from_cache_or_generate_to_cache(org_id)
@@ -314,6 +317,8 @@ class NodeAllAssetsMappingMixin:
     @classmethod
     def get_node_all_asset_ids_mapping_from_cache_or_generate_to_cache(cls, org_id):
         mapping = cls.get_node_all_asset_ids_mapping_from_cache(org_id)
+        result = 'hit' if mapping else 'miss'
+        metrics.inc('jumpserver_cache_requests_total', cache='node_asset_mapping', result=result)
         if mapping:
             return mapping
 
@@ -328,7 +333,7 @@ class NodeAllAssetsMappingMixin:
 
             _mapping = cls.generate_node_all_asset_ids_mapping(org_id)
             cache_key = cls._get_cache_key_for_node_all_asset_ids_mapping(org_id)
-            cache.set(cache_key, mapping, timeout=None)
+            cache.set(cache_key, _mapping, timeout=None)
             return _mapping
 
     @classmethod
@@ -169,6 +169,9 @@ class AssetSerializer(BulkOrgResourceModelSerializer, ResourceLabelsMixin, Writa
         ]
         fields = fields_small + fields_fk + fields_m2m + read_only_fields
         fields_unexport = ['auto_config']
+        # 批量修改这些字段时直接 bulk_update, 平台、协议、账号等仍然逐个 update
+        use_model_bulk_update = True
+        bulk_update_fields = ['name', 'address', 'is_active', 'comment', 'zone', 'nodes']
         extra_kwargs = {
             'auto_config': {'label': _('Auto info')},
             'name': {'label': _("Name"), 'initial': 'Asset name'},
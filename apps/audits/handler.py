@@ -163,13 +163,15 @@ class OperatorLogHandler(metaclass=Singleton):
     def create_or_update_operate_log(
             self, action, resource_type, resource=None, resource_display=None,
             force=False, log_id=None, before=None, after=None,
-            object_name=None
+            object_name=None, user=None
     ):
-        user = current_request.user if current_request else None
+        # 后台任务中没有 request, 由调用者传入操作的用户
+        if user is None:
+            user = current_request.user if current_request else None
         if not user or not user.is_authenticated:
             return
 
-        remote_addr = get_request_ip(current_request)
+        remote_addr = get_request_ip(current_request) if current_request else ''
         if resource_display is None:
             resource_display = self.get_resource_display(resource)
         resource_id = getattr(resource, 'pk', '')
@@ -206,3 +208,4 @@ create_or_update_operate_log = op_handler.create_or_update_operate_log
 cache_instance_before_data = op_handler.cache_instance_before_data
 get_instance_current_with_cache_diff = op_handler.get_instance_current_with_cache_diff
 get_instance_dict_from_cache = op_handler.get_instance_dict_from_cache
+look_for_two_dict_change = op_handler._look_for_two_dict_change
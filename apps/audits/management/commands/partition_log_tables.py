@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Partition command and audit log tables by month'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert', action='store_true',
+            help='Convert tables not partitioned yet, MySQL rebuilds the whole table, stop services first'
+        )
+
+    def handle(self, *args, **options):
+        from audits.partition import get_log_table_partitions
+
+        partitions = get_log_table_partitions()
+        if not partitions:
+            self.stdout.write('Database not support partition, only PostgreSQL and MySQL')
+            return
+
+        months_ahead = settings.LOG_TABLE_PARTITION_MONTHS_AHEAD
+        for partition in partitions:
+            if partition.is_partitioned():
+                partition.ensure_partitions(months_ahead)
+            elif options['convert']:
+                self.stdout.write(f'Convert table: {partition}')
+                partition.convert(months_ahead)
+            else:
+                self.stdout.write(f'Table not partitioned: {partition}, use --convert')
+                continue
+            months = partition.get_partition_months()
+            self.stdout.write(f'{partition}: {len(months)} partitions')
@@ -0,0 +1,372 @@
+import datetime
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from common.utils import get_logger
+
+logger = get_logger(__name__)
+
+__all__ = [
+    'get_log_table_partitions', 'create_log_table_partitions',
+    'drop_expired_partitions',
+]
+
+
+def month_start(dt):
+    dt = dt.astimezone(datetime.timezone.utc)
+    return datetime.datetime(dt.year, dt.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def add_months(dt, months):
+    month = dt.month - 1 + months
+    return dt.replace(year=dt.year + month // 12, month=month % 12 + 1, day=1)
+
+
+class LogTablePartition:
+    """
+    日志表按月的 range 分区, 分区名带上月份 (UTC), 如 p202601
+
+    分区需要手动执行 `python manage.py partition_log_tables --convert` 转换,
+    之后每天的清理任务会提前创建分区, 并直接删除整月过期的分区
+    """
+    partition_prefix = 'p'
+
+    def __init__(self, model, field):
+        self.model = model
+        self.field = field
+        self.table = model._meta.db_table
+        model_field = model._meta.get_field(field)
+        self.column = model_field.column
+        self.is_timestamp = isinstance(model_field, models.IntegerField)
+
+    def __str__(self):
+        return self.table
+
+    @staticmethod
+    def quote(name):
+        return connection.ops.quote_name(name)
+
+    def execute(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            if cursor.description:
+                return cursor.fetchall()
+        return []
+
+    def partition_name(self, month):
+        return f'{self.partition_prefix}{month:%Y%m}'
+
+    def parse_partition_month(self, name):
+        if not name.startswith(self.partition_prefix):
+            return None
+        try:
+            month = datetime.datetime.strptime(name[len(self.partition_prefix):], '%Y%m')
+        except ValueError:
+            return None
+        return month.replace(tzinfo=datetime.timezone.utc)
+
+    def get_partition_months(self):
+        months = [self.parse_partition_month(name) for name in self.get_partition_names()]
+        return sorted(m for m in months if m)
+
+    def get_data_start_month(self):
+        column, table = self.quote(self.column), self.quote(self.table)
+        value = self.execute(f'SELECT MIN({column}) FROM {table}')[0][0]
+        if value is None:
+            return month_start(timezone.now())
+        if self.is_timestamp:
+            value = datetime.datetime.fromtimestamp(value, tz=datetime.timezone.utc)
+        elif timezone.is_naive(value):
+            value = timezone.make_aware(value, datetime.timezone.utc)
+        return month_start(value)
+
+    def get_months_to(self, start, months_ahead):
+        end = add_months(month_start(timezone.now()), months_ahead)
+        months = []
+        while start <= end:
+            months.append(start)
+            start = add_months(start, 1)
+        return months
+
+    def ensure_partitions(self, months_ahead):
+        """ 只在最后一个分区之后追加, 避免和默认分区中已有的数据冲突 """
+        existed = self.get_partition_months()
+        if not existed:
+            return []
+        start = add_months(existed[-1], 1)
+        months = self.get_months_to(start, months_ahead)
+        for month in months:
+            self.create_partition(month)
+        if months:
+            logger.info(f'Create partitions for {self.table}: {[self.partition_name(m) for m in months]}')
+        return months
+
+    def drop_partitions_before(self, expired):
+        """ 只删除整月都过期的分区, 剩下的由 RetentionCleaner 分批删除 """
+        dropped = []
+        for month in self.get_partition_months():
+            if add_months(month, 1) > expired:
+                break
+            name = self.partition_name(month)
+            self.drop_partition(name)
+            dropped.append(name)
+        if dropped:
+            logger.info(f'Drop expired partitions of {self.table}: {dropped}')
+        return dropped
+
+    def get_partition_names(self):
+        raise NotImplementedError
+
+    def is_partitioned(self):
+        raise NotImplementedError
+
+    def create_partition(self, month):
+        raise NotImplementedError
+
+    def drop_partition(self, name):
+        raise NotImplementedError
+
+    def convert(self, months_ahead):
+        raise NotImplementedError
+
+
+class PostgreSQLLogTablePartition(LogTablePartition):
+    def __init__(self, model, field):
+        super().__init__(model, field)
+        self.partition_prefix = f'{self.table}_p'
+
+    def bound(self, month):
+        if self.is_timestamp:
+            return str(int(month.timestamp()))
+        return f"'{month.isoformat()}'"
+
+    def get_partition_names(self):
+        sql = """
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = %s
+        """
+        return [row[0] for row in self.execute(sql, [self.table])]
+
+    def is_partitioned(self):
+        sql = """
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = %s
+        """
+        return bool(self.execute(sql, [self.table]))
+
+    def create_partition(self, month):
+        name, table = self.quote(self.partition_name(month)), self.quote(self.table)
+        lower, upper = self.bound(month), self.bound(add_months(month, 1))
+        self.execute(
+            f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} '
+            f'FOR VALUES FROM ({lower}) TO ({upper})'
+        )
+
+    def drop_partition(self, name):
+        self.execute(f'DROP TABLE IF EXISTS {self.quote(name)}')
+
+    @property
+    def legacy_table(self):
+        return f'{self.table}_legacy'
+
+    def get_unique_indexes(self):
+        """ :return: [(index name, is primary key, [column])] """
+        sql = """
+            SELECT ic.relname, ix.indisprimary, array_agg(a.attname ORDER BY k.ord)
+            FROM pg_index ix
+            JOIN pg_class t ON t.oid = ix.indrelid
+            JOIN pg_class ic ON ic.oid = ix.indexrelid
+            CROSS JOIN LATERAL unnest(ix.indkey) WITH ORDINALITY AS k(attnum, ord)
+            JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+            WHERE t.relname = %s AND ix.indisunique
+            GROUP BY ic.relname, ix.indisprimary
+        """
+        return [(name, primary, list(columns)) for name, primary, columns in self.execute(sql, [self.table])]
+
+    def get_indexes(self):
+        sql = """
+            SELECT i.indexname, i.indexdef FROM pg_indexes i
+            JOIN pg_class ic ON ic.relname = i.indexname
+            JOIN pg_index ix ON ix.indexrelid = ic.oid
+            WHERE i.tablename = %s AND NOT ix.indisunique
+        """
+        return self.execute(sql, [self.table])
+
+    def drop_partitions_before(self, expired):
+        months = self.get_partition_months()
+        dropped = super().drop_partitions_before(expired)
+        # 转换前的数据都在 legacy 分区中, 第一个按月的分区之前的数据都过期时删除
+        if months and months[0] <= expired and self.legacy_table in self.get_partition_names():
+            self.drop_partition(self.legacy_table)
+            dropped.append(self.legacy_table)
+        return dropped
+
+    def convert(self, months_ahead):
+        """
+        分区键需要在所有的唯一索引中, 已有的表不复制数据, 而是作为 legacy 分区挂载到新的分区表上,
+        包含下个月之前的所有数据, 之后的数据写到按月的分区
+
+        耗时的操作 (创建索引, 检查约束) 不锁表, 在切换之前执行, 切换只需要修改元数据
+        """
+        table, column = self.quote(self.table), self.quote(self.column)
+        legacy_end = add_months(month_start(timezone.now()), 1)
+        months = self.get_months_to(legacy_end, max(months_ahead, 1))
+        check = self.quote(f'{self.table}_legacy_check')
+
+        # 唯一索引加上分区键, 和分区表上的唯一索引对应
+        unique_indexes = []
+        for name, primary, columns in self.get_unique_indexes():
+            if self.column not in columns:
+                columns.append(self.column)
+            quoted = ', '.join(self.quote(c) for c in columns)
+            new_name = f'{name[:50]}_partition'
+            self.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {self.quote(new_name)}')
+            self.execute(f'CREATE UNIQUE INDEX CONCURRENTLY {self.quote(new_name)} ON {table} ({quoted})')
+            unique_indexes.append((name, primary, new_name, quoted))
+        indexes = self.get_indexes()
+
+        # 有校验过的 check 约束, 挂载分区和设置 NOT NULL 时不需要再扫描全表
+        self.execute(f'ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check}')
+        self.execute(
+            f'ALTER TABLE {table} ADD CONSTRAINT {check} '
+            f'CHECK ({column} IS NOT NULL AND {column} < {self.bound(legacy_end)}) NOT VALID'
+        )
+        self.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {check}')
+
+        legacy = self.quote(self.legacy_table)
+        with transaction.atomic():
+            self.execute(f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE')
+            self.execute(f'ALTER TABLE {table} RENAME TO {legacy}')
+            # 索引名保留给分区表, Django 的迁移会用到
+            for name, __ in indexes:
+                self.execute(f'ALTER INDEX {self.quote(name)} RENAME TO {self.quote(name[:50] + "_legacy")}')
+            for name, primary, new_name, __ in unique_indexes:
+                self.execute(f'ALTER TABLE {legacy} DROP CONSTRAINT IF EXISTS {self.quote(name)}')
+                self.execute(f'DROP INDEX IF EXISTS {self.quote(name)}')
+                if primary:
+                    self.execute(
+                        f'ALTER TABLE {legacy} ADD CONSTRAINT {self.quote(self.legacy_table + "_pkey")} '
+                        f'PRIMARY KEY USING INDEX {self.quote(new_name)}'
+                    )
+
+            self.execute(
+                f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) '
+                f'PARTITION BY RANGE ({column})'
+            )
+            for name, primary, __, quoted in unique_indexes:
+                if primary:
+                    self.execute(f'ALTER TABLE {table} ADD PRIMARY KEY ({quoted})')
+                else:
+                    self.execute(f'CREATE UNIQUE INDEX {self.quote(name)} ON {table} ({quoted})')
+            for __, definition in indexes:
+                self.execute(definition)
+
+            for month in months:
+                self.create_partition(month)
+            default = self.quote(f'{self.table}_default')
+            self.execute(f'CREATE TABLE {default} PARTITION OF {table} DEFAULT')
+            self.execute(
+                f'ALTER TABLE {table} ATTACH PARTITION {legacy} '
+                f'FOR VALUES FROM (MINVALUE) TO ({self.bound(legacy_end)})'
+            )
+            self.execute(f'ALTER TABLE {legacy} DROP CONSTRAINT {check}')
+
+
+class MySQLLogTablePartition(LogTablePartition):
+    max_partition = 'pmax'
+
+    def bound(self, month):
+        if self.is_timestamp:
+            return str(int(month.timestamp()))
+        return f"TO_DAYS('{month:%Y-%m-%d}')"
+
+    @property
+    def partition_expr(self):
+        column = self.quote(self.column)
+        if self.is_timestamp:
+            return column
+        return f'TO_DAYS({column})'
+
+    def partition_clause(self, month):
+        name = self.quote(self.partition_name(month))
+        return f'PARTITION {name} VALUES LESS THAN ({self.bound(add_months(month, 1))})'
+
+    def get_partition_names(self):
+        sql = """
+            SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            AND PARTITION_NAME IS NOT NULL
+        """
+        return [row[0] for row in self.execute(sql, [self.table])]
+
+    def is_partitioned(self):
+        return bool(self.get_partition_names())
+
+    def create_partition(self, month):
+        table, pmax = self.quote(self.table), self.quote(self.max_partition)
+        self.execute(
+            f'ALTER TABLE {table} REORGANIZE PARTITION {pmax} INTO '
+            f'({self.partition_clause(month)}, PARTITION {pmax} VALUES LESS THAN MAXVALUE)'
+        )
+
+    def drop_partition(self, name):
+        self.execute(f'ALTER TABLE {self.quote(self.table)} DROP PARTITION {self.quote(name)}')
+
+    def convert(self, months_ahead):
+        """
+        MySQL 的分区键需要在所有的唯一键中, 先修改主键, 再原地分区
+        第一个分区同时包含更早的数据
+        """
+        table, column = self.quote(self.table), self.quote(self.column)
+        months = self.get_months_to(self.get_data_start_month(), months_ahead)
+        partitions = [self.partition_clause(month) for month in months]
+        partitions.append(f'PARTITION {self.quote(self.max_partition)} VALUES LESS THAN MAXVALUE')
+
+        self.execute(f'ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, {column})')
+        self.execute(
+            f'ALTER TABLE {table} PARTITION BY RANGE ({self.partition_expr}) '
+            f'({", ".join(partitions)})'
+        )
+
+
+def get_log_table_partitions():
+    from terminal.models import Command
+    from .models import UserLoginLog, OperateLog, FTPLog, ActivityLog
+
+    partition_cls = {
+        'postgresql': PostgreSQLLogTablePartition,
+        'mysql': MySQLLogTablePartition,
+    }.get(connection.vendor)
+    if not partition_cls:
+        return []
+    tables = [
+        (Command, 'timestamp'),
+        (UserLoginLog, 'datetime'),
+        (OperateLog, 'datetime'),
+        (FTPLog, 'date_start'),
+        (ActivityLog, 'datetime'),
+    ]
+    return [partition_cls(model, field) for model, field in tables]
+
+
+def create_log_table_partitions():
+    if not settings.LOG_TABLE_PARTITION_ENABLED:
+        return
+    for partition in get_log_table_partitions():
+        if not partition.is_partitioned():
+            continue
+        partition.ensure_partitions(settings.LOG_TABLE_PARTITION_MONTHS_AHEAD)
+
+
+def drop_expired_partitions(model, expired):
+    if not settings.LOG_TABLE_PARTITION_ENABLED:
+        return
+    for partition in get_log_table_partitions():
+        if partition.model is not model or not partition.is_partitioned():
+            continue
+        partition.drop_partitions_before(expired)
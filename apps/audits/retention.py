@@ -0,0 +1,94 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from common.utils import get_logger
+
+logger = get_logger(__name__)
+
+__all__ = ['RetentionCleaner']
+
+
+class RetentionCleaner:
+    """
+    按时间 (或主键) 范围分批删除过期的记录
+
+    - 每次取剩下的最早的一批, 按主键删除, 不会因为 offset 移动漏删
+    - 每批一个短事务, 不长时间持有锁
+    - 删除到的位置保存在缓存中, 中断后从该位置继续, 跳过已经删除的索引范围
+    - 按 LOG_CLEAN_ROWS_PER_SECOND 限速, 避免影响线上业务
+    """
+    progress_key_tmpl = 'audits:retention:progress:{}'
+    progress_ttl = 60 * 60 * 24 * 7
+    log_interval = 60
+
+    def __init__(self, name, queryset, field, batch_size=None, rows_per_second=None):
+        self.name = name
+        self.queryset = queryset
+        self.model = queryset.model
+        self.field = field
+        self.batch_size = batch_size or settings.LOG_CLEAN_BATCH_SIZE
+        if rows_per_second is None:
+            rows_per_second = settings.LOG_CLEAN_ROWS_PER_SECOND
+        self.rows_per_second = rows_per_second
+        self.progress_key = self.progress_key_tmpl.format(name)
+
+    def get_progress(self):
+        return cache.get(self.progress_key) or {}
+
+    def save_progress(self, cursor, deleted):
+        progress = {'cursor': cursor, 'deleted': deleted}
+        cache.set(self.progress_key, progress, self.progress_ttl)
+
+    def clear_progress(self):
+        cache.delete(self.progress_key)
+
+    def next_batch(self, cursor):
+        queryset = self.queryset
+        if cursor is not None:
+            queryset = queryset.filter(**{f'{self.field}__gte': cursor})
+        rows = queryset.order_by(self.field).values_list('pk', self.field)[:self.batch_size]
+        return list(rows)
+
+    def throttle(self, amount, cost):
+        if not self.rows_per_second:
+            return
+        wait = amount / self.rows_per_second - cost
+        if wait > 0:
+            time.sleep(wait)
+
+    def run(self):
+        progress = self.get_progress()
+        cursor = progress.get('cursor')
+        deleted = progress.get('deleted', 0)
+        if cursor is not None:
+            logger.info(f'Resume clean {self.name} from {cursor}, deleted: {deleted}')
+
+        amount = 0
+        last_log_time = start = time.time()
+        while True:
+            batch_start = time.time()
+            rows = self.next_batch(cursor)
+            if not rows:
+                break
+            pks = [pk for pk, __ in rows]
+            with transaction.atomic():
+                self.model.objects.filter(pk__in=pks).delete()
+
+            amount += len(pks)
+            deleted += len(pks)
+            cursor = rows[-1][1]
+            self.save_progress(cursor, deleted)
+
+            now = time.time()
+            if now - last_log_time > self.log_interval:
+                last_log_time = now
+                rate = amount / max(now - start, 1)
+                logger.info(f'Clean {self.name}: deleted {deleted}, cursor {cursor}, {rate:.0f} rows/s')
+            self.throttle(len(pks), time.time() - batch_start)
+
+        self.clear_progress()
+        logger.info(f'Clean {self.name} done, deleted: {deleted}, cost: {time.time() - start:.1f}s')
+        return deleted
@@ -11,11 +11,14 @@ from django.utils import translation
 
 from audits.handler import (
     get_instance_current_with_cache_diff, cache_instance_before_data,
-    create_or_update_operate_log, get_instance_dict_from_cache
+    create_or_update_operate_log, get_instance_dict_from_cache,
+    look_for_two_dict_change
 )
 from audits.utils import model_to_dict_for_operate_log as model_to_dict
 from common.const.signals import POST_ADD, POST_REMOVE, POST_CLEAR, OP_LOG_SKIP_SIGNAL
-from common.signals import django_ready
+from common.signals import (
+    django_ready, pre_bulk_update, post_bulk_update, post_bulk_create
+)
 from jumpserver.utils import current_request
 from ..const import MODELS_NEED_RECORD, ActionChoices
 
@@ -73,7 +76,7 @@ def on_m2m_changed(sender, action, instance, reverse, model, pk_set, **kwargs):
 
 
 def signal_of_operate_log_whether_continue(
-        sender, instance, created, update_fields=None
+        sender, instance, created, update_fields=None, user=None
 ):
     condition = True
     if not instance:
@@ -81,7 +84,8 @@ def signal_of_operate_log_whether_continue(
     if instance and getattr(instance, OP_LOG_SKIP_SIGNAL, False):
         condition = False
     # 不记录组件的操作日志
-    user = current_request.user if current_request else None
+    if user is None:
+        user = current_request.user if current_request else None
     if not user or getattr(user, 'is_service_account', False):
         condition = False
     # 终端模型的 create 事件由系统产生，不记录
@@ -121,6 +125,55 @@ def on_object_pre_create_or_update(
         cache_instance_before_data(instance_before_data)
 
 
+@receiver(pre_bulk_update)
+def on_objects_pre_bulk_update(sender, instances=(), user=None, **kwargs):
+    """
+    批量更新前对象还在内存中, 直接记录修改前的数据, 不再逐个查询
+    后台任务中没有 request, 发送信号时传入操作的 user
+    """
+    if not instances or not signal_of_operate_log_whether_continue(
+            sender, instances[0], False, user=user
+    ):
+        return
+    with translation.override('en'):
+        for instance in instances:
+            instance._operate_log_before = model_to_dict(instance)
+
+
+@receiver(post_bulk_update)
+def on_objects_post_bulk_update(sender, instances=(), user=None, **kwargs):
+    if not instances or not signal_of_operate_log_whether_continue(
+            sender, instances[0], False, user=user
+    ):
+        return
+    resource_type = sender._meta.verbose_name
+    object_name = sender._meta.object_name
+    with translation.override('en'):
+        for instance in instances:
+            before_data = getattr(instance, '_operate_log_before', None)
+            if before_data is None:
+                continue
+            before, after = look_for_two_dict_change(before_data, model_to_dict(instance))
+            create_or_update_operate_log(
+                ActionChoices.update, resource_type, resource=instance,
+                before=before, after=after, object_name=object_name, user=user
+            )
+
+
+@receiver(post_bulk_create)
+def on_objects_post_bulk_create(sender, instances=(), **kwargs):
+    if not instances or not signal_of_operate_log_whether_continue(sender, instances[0], True):
+        return
+    resource_type = sender._meta.verbose_name
+    object_name = sender._meta.object_name
+    with translation.override('en'):
+        for instance in instances:
+            create_or_update_operate_log(
+                ActionChoices.create, resource_type, resource=instance,
+                after=model_to_dict(instance), object_name=object_name
+            )
+
+
 @receiver(post_save)
 def on_object_created_or_update(
         sender, instance=None, created=False, update_fields=None, **kwargs
@@ -6,7 +6,6 @@ import os
 from celery import shared_task
 from django.conf import settings
 from django.core.files.storage import default_storage
-from django.db import transaction
 from django.utils import timezone
 from django.utils._os import safe_join
 from django.utils.translation import gettext_lazy as _
@@ -21,6 +20,8 @@ from orgs.utils import tmp_to_root_org
 from terminal.backends import server_replay_storage
 from terminal.models import Session, Command
 from .models import UserLoginLog, OperateLog, FTPLog, ActivityLog, PasswordChangeLog
+from .partition import create_log_table_partitions, drop_expired_partitions
+from .retention import RetentionCleaner
 
 logger = get_logger(__name__)
 
@@ -29,21 +30,26 @@ def clean_login_log_period():
     now = timezone.now()
     days = get_log_keep_day('LOGIN_LOG_KEEP_DAYS')
     expired_day = now - datetime.timedelta(days=days)
-    UserLoginLog.objects.filter(datetime__lt=expired_day).delete()
+    drop_expired_partitions(UserLoginLog, expired_day)
+    queryset = UserLoginLog.objects.filter(datetime__lt=expired_day)
+    RetentionCleaner('login_log', queryset, 'datetime').run()
 
 
 def clean_operation_log_period():
     now = timezone.now()
     days = get_log_keep_day('OPERATE_LOG_KEEP_DAYS')
     expired_day = now - datetime.timedelta(days=days)
-    OperateLog.objects.filter(datetime__lt=expired_day).delete()
+    drop_expired_partitions(OperateLog, expired_day)
+    queryset = OperateLog.objects.filter(datetime__lt=expired_day)
+    RetentionCleaner('operate_log', queryset, 'datetime').run()
 
 
 def clean_password_change_log_period():
     now = timezone.now()
     days = get_log_keep_day('PASSWORD_CHANGE_LOG_KEEP_DAYS')
     expired_day = now - datetime.timedelta(days=days)
-    PasswordChangeLog.objects.filter(datetime__lt=expired_day).delete()
+    queryset = PasswordChangeLog.objects.filter(datetime__lt=expired_day)
+    RetentionCleaner('password_change_log', queryset, 'datetime').run()
     logger.info("Clean password change log done")
 
 
@@ -51,7 +57,9 @@ def clean_activity_log_period():
     now = timezone.now()
     days = get_log_keep_day('ACTIVITY_LOG_KEEP_DAYS')
     expired_day = now - datetime.timedelta(days=days)
-    ActivityLog.objects.filter(datetime__lt=expired_day).delete()
+    drop_expired_partitions(ActivityLog, expired_day)
+    queryset = ActivityLog.objects.filter(datetime__lt=expired_day)
+    RetentionCleaner('activity_log', queryset, 'datetime').run()
 
 
 def clean_ftp_log_period():
@@ -59,7 +67,9 @@ def clean_ftp_log_period():
     days = get_log_keep_day('FTP_LOG_KEEP_DAYS')
     expired_day = now - datetime.timedelta(days=days)
     file_store_dir = safe_join(default_storage.base_location, FTPLog.upload_to)
-    FTPLog.objects.filter(date_start__lt=expired_day).delete()
+    drop_expired_partitions(FTPLog, expired_day)
+    queryset = FTPLog.objects.filter(date_start__lt=expired_day)
+    RetentionCleaner('ftp_log', queryset, 'date_start').run()
     command = "find %s -mtime +%s -type f -exec rm -f {} \\;"
     safe_run_cmd(command, (file_store_dir, days))
     command = "find %s -type d -empty -delete;"
@@ -72,9 +82,9 @@ def clean_celery_tasks_period():
     expire_days = get_log_keep_day('TASK_LOG_KEEP_DAYS')
     days_ago = timezone.now() - timezone.timedelta(days=expire_days)
     tasks = CeleryTaskExecution.objects.filter(date_start__lt=days_ago)
-    tasks.delete()
+    RetentionCleaner('celery_task', tasks, 'date_start').run()
     tasks = CeleryTaskExecution.objects.filter(date_start__isnull=True)
-    tasks.delete()
+    RetentionCleaner('celery_task_not_start', tasks, 'pk').run()
     command = "find %s -mtime +%s -name '*.log' -type f -exec rm -f {} \\;"
     safe_run_cmd(command, (settings.CELERY_LOG_DIR, expire_days))
     celery_log_path = safe_join(settings.LOG_DIR, 'celery.log')
@@ -82,15 +92,6 @@ def clean_celery_tasks_period():
     safe_run_cmd(command, (celery_log_path,))
 
 
-def batch_delete(queryset, batch_size=3000):
-    model = queryset.model
-    count = queryset.count()
-    with transaction.atomic():
-        for i in range(0, count, batch_size):
-            pks = queryset[i:i + batch_size].values_list('id', flat=True)
-            model.objects.filter(id__in=list(pks)).delete()
-
-
 def remove_files_by_days(root_path, days, file_types=None):
     if file_types is None:
         file_types = ['.json', '.tar', '.gz', '.mp4']
@@ -119,9 +120,10 @@ def clean_expired_session_period():
     expired_commands = Command.objects.filter(timestamp__lt=timestamp)
     replay_dir = safe_join(default_storage.base_location, 'replay')
 
-    batch_delete(expired_sessions)
+    RetentionCleaner('session', expired_sessions, 'date_start').run()
     logger.info("Clean session item done")
-    batch_delete(expired_commands)
+    drop_expired_partitions(Command, expire_date)
+    RetentionCleaner('command', expired_commands, 'timestamp').run()
     logger.info("Clean session command done")
     remove_files_by_days(replay_dir, days)
     command = "find %s -type d -empty -delete;"
@@ -142,6 +144,7 @@ def clean_expired_session_period():
 def clean_audits_log_period():
     print("Start clean audit session task log")
     with tmp_to_root_org():
+        create_log_table_partitions()
         clean_login_log_period()
         clean_operation_log_period()
         clean_ftp_log_period()
@@ -1,3 +1,172 @@
-from django.test import TestCase
+import datetime
+import unittest
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection, models, IntegrityError, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from audits.models import UserLoginLog
+from audits.partition import PostgreSQLLogTablePartition, add_months, month_start
+from audits.retention import RetentionCleaner
+from audits.tasks import clean_login_log_period
+
+
+class PartitionTestLog(models.Model):
+    id = models.UUIDField(default=uuid.uuid4, primary_key=True)
+    name = models.CharField(max_length=64, unique=True)
+    datetime = models.DateTimeField(db_index=True)
+
+    class Meta:
+        app_label = 'audits'
+        managed = False
+        db_table = 'audits_partition_test_log'
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+class PostgreSQLLogTablePartitionTests(TransactionTestCase):
+    def setUp(self):
+        with connection.schema_editor() as editor:
+            editor.create_model(PartitionTestLog)
+        now = timezone.now()
+        PartitionTestLog.objects.bulk_create([
+            PartitionTestLog(name='old', datetime=now - datetime.timedelta(days=90)),
+            PartitionTestLog(name='now', datetime=now),
+        ])
+        self.partition = PostgreSQLLogTablePartition(PartitionTestLog, 'datetime')
+        self.next_month = add_months(month_start(now), 1)
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {PartitionTestLog._meta.db_table} CASCADE')
+
+    def get_row_partition(self, name):
+        sql = f'SELECT tableoid::regclass::text FROM {self.partition.table} WHERE name = %s'
+        return self.partition.execute(sql, [name])[0][0]
+
+    def test_convert_attach_legacy(self):
+        self.partition.convert(months_ahead=2)
+
+        self.assertTrue(self.partition.is_partitioned())
+        self.assertEqual(PartitionTestLog.objects.count(), 2)
+        # 已有的数据没有复制, 整个表作为 legacy 分区
+        self.assertEqual(self.get_row_partition('old'), self.partition.legacy_table)
+        self.assertEqual(self.partition.get_partition_months()[0], self.next_month)
+
+        PartitionTestLog.objects.create(name='next', datetime=self.next_month)
+        self.assertEqual(self.get_row_partition('next'), self.partition.partition_name(self.next_month))
+
+    def test_convert_keep_unique_indexes(self):
+        self.partition.convert(months_ahead=1)
+
+        unique_indexes = {
+            tuple(columns): primary for __, primary, columns in self.partition.get_unique_indexes()
+        }
+        self.assertEqual(unique_indexes, {('id', 'datetime'): True, ('name', 'datetime'): False})
+        self.assertTrue(self.partition.get_indexes())
+
+        row = PartitionTestLog.objects.get(name='now')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PartitionTestLog.objects.create(name=row.name, datetime=row.datetime)
+
+    def test_drop_legacy_partition(self):
+        self.partition.convert(months_ahead=1)
+
+        expired = self.next_month - datetime.timedelta(days=1)
+        self.assertEqual(self.partition.drop_partitions_before(expired), [])
+        dropped = self.partition.drop_partitions_before(add_months(self.next_month, 1))
+        self.assertEqual(
+            dropped, [self.partition.partition_name(self.next_month), self.partition.legacy_table]
+        )
+        self.assertEqual(PartitionTestLog.objects.count(), 0)
+
+
+@override_settings(LOG_TABLE_PARTITION_ENABLED=False)
+class RetentionCleanerTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.logs = self.create_logs('expired', [self.now - datetime.timedelta(days=i) for i in range(10, 15)])
+        self.keep = self.create_logs('keep', [self.now])
+        self.queryset = UserLoginLog.objects.filter(datetime__lt=self.now - datetime.timedelta(days=1))
+
+    def tearDown(self):
+        self.get_cleaner().clear_progress()
+
+    @staticmethod
+    def create_logs(username, datetimes):
+        return UserLoginLog.objects.bulk_create([
+            UserLoginLog(username=username, type='W', ip='127.0.0.1', datetime=dt)
+            for dt in datetimes
+        ])
+
+    def get_cleaner(self, **kwargs):
+        kwargs.setdefault('batch_size', 2)
+        kwargs.setdefault('rows_per_second', 0)
+        return RetentionCleaner('test_login_log', self.queryset, 'datetime', **kwargs)
+
+    def test_delete_in_batches_by_field(self):
+        cleaner = self.get_cleaner()
+        with mock.patch.object(cleaner, 'next_batch', wraps=cleaner.next_batch) as next_batch:
+            self.assertEqual(cleaner.run(), 5)
+
+        # 3 批 + 最后一次没有数据
+        self.assertEqual(next_batch.call_count, 4)
+        oldest = min(log.datetime for log in self.logs)
+        self.assertEqual(next_batch.call_args_list[0].args, (None,))
+        self.assertGreater(next_batch.call_args_list[1].args[0], oldest)
+        self.assertEqual(
+            list(UserLoginLog.objects.values_list('username', flat=True)), ['keep']
+        )
+        self.assertEqual(cleaner.get_progress(), {})
+
+    def test_resume_after_interrupted(self):
+        cleaner = self.get_cleaner()
+        next_batch = cleaner.next_batch
+        calls = []
+
+        def interrupt(cursor):
+            calls.append(cursor)
+            if len(calls) > 1:
+                raise KeyboardInterrupt
+            return next_batch(cursor)
+
+        with mock.patch.object(cleaner, 'next_batch', side_effect=interrupt), \
+                self.assertRaises(KeyboardInterrupt):
+            cleaner.run()
+        progress = cleaner.get_progress()
+        self.assertEqual(progress['deleted'], 2)
+        self.assertEqual(UserLoginLog.objects.count(), 4)
+
+        cleaner = self.get_cleaner()
+        with mock.patch.object(cleaner, 'next_batch', wraps=cleaner.next_batch) as resumed:
+            self.assertEqual(cleaner.run(), 5)
+        self.assertEqual(resumed.call_args_list[0].args, (progress['cursor'],))
+        self.assertEqual(cleaner.get_progress(), {})
+        self.assertEqual(UserLoginLog.objects.count(), 1)
+
+    def test_throttle(self):
+        cleaner = self.get_cleaner(rows_per_second=2)
+        with mock.patch('audits.retention.time.sleep') as sleep:
+            cleaner.run()
+        # 每批 2, 2, 1 条, 按每秒 2 条限速
+        self.assertEqual(sleep.call_count, 3)
+        waits = [c.args[0] for c in sleep.call_args_list]
+        for wait, expected in zip(waits, [1, 1, 0.5]):
+            self.assertLessEqual(wait, expected)
+            self.assertGreater(wait, expected - 0.5)
+
+    def test_no_throttle(self):
+        with mock.patch('audits.retention.time.sleep') as sleep:
+            self.get_cleaner().run()
+        sleep.assert_not_called()
+
+    @override_settings(LOGIN_LOG_KEEP_DAYS=7, LOG_CLEAN_BATCH_SIZE=2, LOG_CLEAN_ROWS_PER_SECOND=0)
+    def test_clean_login_log_task(self):
+        with mock.patch('audits.tasks.RetentionCleaner', wraps=RetentionCleaner) as cleaner:
+            clean_login_log_period()
+        self.assertEqual(cleaner.call_args.args[0], 'login_log')
+        self.assertEqual(cleaner.call_args.args[2], 'datetime')
+        self.assertEqual(
+            list(UserLoginLog.objects.values_list('username', flat=True)), ['keep']
+        )
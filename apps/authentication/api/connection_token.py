@@ -18,12 +18,13 @@ from accounts.const import AliasAccount
 from acls.notifications import AssetLoginReminderMsg
 from common.api import JMSModelViewSet
 from common.exceptions import JMSException
-from common.utils import random_string, get_logger, get_request_ip_or_data
+from common.utils import random_string, get_logger, get_request_ip_or_data, is_uuid
 from common.utils.django import get_request_os
 from common.utils.http import is_true, is_false
 from orgs.mixins.api import RootOrgViewMixin
 from orgs.utils import tmp_to_org
 from perms.models import ActionChoices
+from perms.utils import PermAssetDetailUtil
 from terminal.connect_methods import NativeClient, ConnectMethodUtil, WebMethod
 from terminal.models import EndpointRule, Endpoint
 from users.const import FileNameConflictResolution
@@ -449,13 +450,17 @@ class ConnectionTokenViewSet(AuthFaceMixin, ExtraActionApiMixin, RootOrgViewMixi
 
     def _validate_perm(self, user, asset, account_alias, protocol):
         account = self.get_permed_account(user, asset, account_alias, protocol)
-        if not account or not account.actions:
+        self._check_permed_access(account)
+        return account
+
+    @staticmethod
+    def _check_permed_access(access):
+        if not access or not access.actions:
             msg = _('Account not found')
             raise JMSException(code='perm_account_invalid', detail=msg)
-        if account.date_expired < timezone.now():
+        if access.date_expired < timezone.now():
             msg = _('Permission expired')
             raise JMSException(code='perm_expired', detail=msg)
-        return account
 
     def _record_operate_log(self, acl, asset):
         from audits.handler import create_or_update_operate_log
@@ -567,6 +572,7 @@ class SuperConnectionTokenViewSet(ConnectionTokenViewSet):
         'renewal': 'authentication.add_superconnectiontoken',
         'list': 'authentication.view_superconnectiontoken',
         'check': 'authentication.view_superconnectiontoken',
+        'batch_check': 'authentication.view_superconnectiontoken',
         'retrieve': 'authentication.view_superconnectiontoken',
         'get_secret_detail': 'authentication.view_superconnectiontokensecret',
         'get_applet_info': 'authentication.view_superconnectiontoken',
@@ -594,12 +600,10 @@ class SuperConnectionTokenViewSet(ConnectionTokenViewSet):
             "expired": instance.is_expired
         }
         try:
-            self._validate_perm(
-                instance.user,
-                instance.asset,
-                instance.account,
-                instance.protocol
-            )
+            # 会话周期性的校验权限, 只读取授权决策缓存, 不用查询账号
+            util = PermAssetDetailUtil(instance.user, instance.asset)
+            access = util.get_account_access(instance.account, instance.protocol)
+            self._check_permed_access(access)
         except JMSException as e:
             data['code'] = e.detail.code
             data['detail'] = str(e.detail)
@@ -607,6 +611,48 @@ class SuperConnectionTokenViewSet(ConnectionTokenViewSet):
 
         return Response(data=data, status=status.HTTP_200_OK)
 
+    @action(methods=['POST'], detail=False, url_path='batch-check')
+    def batch_check(self, request, *args, **kwargs):
+        """
+        组件一次校验多个会话的 token, 避免每个会话一个请求
+        请求: {"token_ids": [...]}
+        返回: [{"id": "", "code": "perm_ok", "detail": "OK", "expired": false}, ...]
+        """
+        token_ids = request.data.get('token_ids') or []
+        if not isinstance(token_ids, list):
+            raise ValidationError({'token_ids': 'Should be a list'})
+        token_ids = [i for i in token_ids if is_uuid(i)]
+
+        tokens = ConnectionToken.objects.filter(id__in=token_ids) \
+            .select_related('user', 'asset')
+        tokens_mapper = {str(token.id): token for token in tokens}
+        pairs = [(t.user, t.asset) for t in tokens if t.user and t.asset]
+        decisions = PermAssetDetailUtil.get_access_decisions(pairs)
+
+        results = []
+        for token_id in token_ids:
+            token = tokens_mapper.get(str(token_id))
+            item = {'id': token_id, 'detail': 'OK', 'code': 'perm_ok'}
+            if not token:
+                item.update({'code': 'token_invalid', 'detail': str(_('Token not found')), 'expired': True})
+                results.append(item)
+                continue
+
+            item['expired'] = token.is_expired
+            decision = decisions.get((token.user_id, token.asset_id))
+            try:
+                if not decision:
+                    raise JMSException(code='perm_account_invalid', detail=_('Account not found'))
+                access = PermAssetDetailUtil.get_decision_account_access(
+                    decision, token.account, token.protocol
+                )
+                self._check_permed_access(access)
+            except JMSException as e:
+                item['code'] = e.detail.code
+                item['detail'] = str(e.detail)
+            results.append(item)
+        return Response(data=results, status=status.HTTP_200_OK)
+
     @action(methods=['PATCH'], detail=False)
     def renewal(self, request, *args, **kwargs):
         from common.utils.timezone import as_current_tz
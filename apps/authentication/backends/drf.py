@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 #
 
+import hashlib
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.utils import timezone
@@ -9,8 +12,13 @@ from rest_framework import authentication, exceptions
 
 from accounts.models import IntegrationApplication
 from common.auth import signature
+from common.cache import CacheNamespace
+from common.db.fields import EncryptMixin
 from common.decorators import merge_delay_run
-from common.utils import get_object_or_none, get_request_ip_or_data, contains_ip, get_request_ip
+from common.utils import (
+    get_request_ip_or_data, contains_ip, get_request_ip, is_uuid
+)
+from common.utils.crypto import crypto
 from users.models import User
 from ..models import AccessKey, PrivateToken
 
@@ -47,6 +55,129 @@ def after_authenticate_update_date(user, token=None):
         update_token_last_used.delay(tokens=(token,))
 
 
+class CredentialCache:
+    """
+    API 认证凭证的缓存, 签名和 Private Token 认证不用每个请求都查询数据库
+
+    缓存密钥 (加密后), IP 白名单, 是否启用和用户快照, 凭证或用户变化时增加版本号失效,
+    不存在的凭证也会缓存, 避免无效的 key 一直查询数据库
+    """
+    namespace = CacheNamespace('auth:credentials')
+
+    @classmethod
+    def get_or_compute(cls, scope, compute_func):
+        return cls.namespace.get_or_set(
+            'credential', lambda: compute_func() or {},
+            scope=scope, timeout=settings.AUTH_CREDENTIAL_CACHE_TTL
+        )
+
+    @staticmethod
+    def get_snapshot(model, **kwargs):
+        # 加密字段和密码不放到缓存中, 用到时再从数据库加载
+        fields = [
+            f.name for f in model._meta.concrete_fields
+            if isinstance(f, EncryptMixin) or f.name == 'password'
+        ]
+        return model.objects.defer(*fields).filter(**kwargs).first()
+
+    @staticmethod
+    def get_access_key_scope(key_id):
+        return f'access_key:{key_id}'
+
+    @staticmethod
+    def get_private_token_scope(key):
+        digest = hashlib.sha256(str(key).encode()).hexdigest()
+        return f'private_token:{digest}'
+
+    @staticmethod
+    def get_service_scope(key_id):
+        return f'service:{key_id}'
+
+    @staticmethod
+    def get_user_scope(user_id):
+        return f'user:{user_id}'
+
+    @classmethod
+    def get_access_key(cls, key_id):
+        def compute():
+            key = AccessKey.objects.filter(id=key_id).first()
+            if not key:
+                return None
+            return {
+                'secret': crypto.encrypt(str(key.secret)),
+                'ip_group': key.ip_group,
+                'is_active': key.is_active,
+                'user': cls.get_snapshot(User, id=key.user_id),
+            }
+
+        if not is_uuid(key_id):
+            return {}
+        return cls.get_or_compute(cls.get_access_key_scope(key_id), compute)
+
+    @classmethod
+    def get_private_token(cls, key):
+        def compute():
+            token = PrivateToken.objects.filter(key=key).first()
+            if not token:
+                return None
+            return {'user': cls.get_snapshot(User, id=token.user_id)}
+
+        return cls.get_or_compute(cls.get_private_token_scope(key), compute)
+
+    @classmethod
+    def get_user(cls, user_id):
+        def compute():
+            user = cls.get_snapshot(User, id=user_id)
+            return {'user': user} if user else None
+
+        if not is_uuid(user_id):
+            return {}
+        return cls.get_or_compute(cls.get_user_scope(user_id), compute)
+
+    @classmethod
+    def get_service(cls, key_id):
+        def compute():
+            app = cls.get_snapshot(IntegrationApplication, id=key_id, is_active=True)
+            if not app:
+                return None
+            secret = IntegrationApplication.objects.filter(id=app.id) \
+                .values_list('secret', flat=True).first()
+            return {'app': app, 'secret': crypto.encrypt(secret or '')}
+
+        if not is_uuid(key_id):
+            return {}
+        return cls.get_or_compute(cls.get_service_scope(key_id), compute)
+
+    @classmethod
+    def expire_access_keys(cls, key_ids):
+        cls.namespace.expire_many([cls.get_access_key_scope(i) for i in key_ids])
+
+    @classmethod
+    def expire_private_tokens(cls, keys):
+        cls.namespace.expire_many([cls.get_private_token_scope(k) for k in keys])
+
+    @classmethod
+    def expire_services(cls, key_ids):
+        cls.namespace.expire_many([cls.get_service_scope(i) for i in key_ids])
+
+    @classmethod
+    def expire_user(cls, user_id):
+        cls.expire_users([user_id])
+
+    @classmethod
+    def expire_users(cls, user_ids):
+        """ queryset.update 批量禁用用户时不发信号, 需要主动调用 """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        key_ids = AccessKey.objects.filter(user_id__in=user_ids).values_list('id', flat=True)
+        token_keys = PrivateToken.objects.filter(user_id__in=user_ids).values_list('key', flat=True)
+        scopes = [cls.get_access_key_scope(i) for i in key_ids]
+        scopes += [cls.get_private_token_scope(k) for k in token_keys]
+        scopes += [cls.get_user_scope(i) for i in user_ids]
+        cls.namespace.expire_many(scopes)
+
+
 class AccessTokenAuthentication(authentication.BaseAuthentication):
     keyword = 'Bearer'
     model = get_user_model()
@@ -74,9 +205,8 @@ class AccessTokenAuthentication(authentication.BaseAuthentication):
 
     @staticmethod
     def authenticate_credentials(token):
-        model = get_user_model()
         user_id = cache.get(token)
-        user = get_object_or_none(model, id=user_id)
+        user = CredentialCache.get_user(user_id).get('user') if user_id else None
 
         if not user:
             msg = _('Invalid token or cache refreshed.')
@@ -98,6 +228,15 @@ class PrivateTokenAuthentication(authentication.TokenAuthentication):
         after_authenticate_update_date(user, token)
         return user, token
 
+    def authenticate_credentials(self, key):
+        credential = CredentialCache.get_private_token(key)
+        user = credential.get('user')
+        if not user:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return user, PrivateToken(key=key, user_id=user.id)
+
 
 class SessionAuthentication(authentication.SessionAuthentication):
     def authenticate(self, request):
@@ -132,52 +271,36 @@ class SignatureAuthentication(signature.SignatureAuthentication):
     model = get_user_model()
 
     def fetch_user_data(self, key_id, algorithm="hmac-sha256"):
-        # ...
-        # example implementation:
-        try:
-            key = AccessKey.objects.get(id=key_id)
-            if not key.is_valid:
-                return None, None
-            user, secret = key.user, str(key.secret)
-            after_authenticate_update_date(user, key)
-            return user, secret
-        except (AccessKey.DoesNotExist, exceptions.ValidationError):
+        credential = CredentialCache.get_access_key(key_id)
+        user = credential.get('user')
+        if not user or not credential['is_active'] or not user.is_valid:
             return None, None
+        secret = crypto.decrypt(credential['secret'])
+        after_authenticate_update_date(user, AccessKey(id=key_id, user_id=user.id))
+        return user, secret
 
     def is_ip_allow(self, key_id, request):
-        try:
-            ak = AccessKey.objects.get(id=key_id)
-            ip_group = ak.ip_group
-            ip = get_request_ip_or_data(request)
-            if not contains_ip(ip, ip_group):
-                return False
-            return True
-        except (AccessKey.DoesNotExist, exceptions.ValidationError):
+        credential = CredentialCache.get_access_key(key_id)
+        if not credential:
             return False
+        ip = get_request_ip_or_data(request)
+        return contains_ip(ip, credential['ip_group'])
 
 
 class ServiceAuthentication(signature.SignatureAuthentication):
-    __instance = None
     source = 'jms-pam'
 
-    def get_object(self, key_id):
-        if not self.__instance:
-            self.__instance = IntegrationApplication.objects.filter(
-                id=key_id, is_active=True,
-            ).first()
-        return self.__instance
-
     def fetch_user_data(self, key_id, algorithm=None):
-        obj = self.get_object(key_id)
-        if not obj:
+        credential = CredentialCache.get_service(key_id)
+        if not credential:
             return None, None
-        return obj, obj.secret
+        return credential['app'], crypto.decrypt(credential['secret'])
 
     def is_ip_allow(self, key_id, request):
-        obj = self.get_object(key_id)
-        if not contains_ip(get_request_ip(request), obj.ip_group):
+        credential = CredentialCache.get_service(key_id)
+        if not credential:
             return False
-        return True
+        return contains_ip(get_request_ip(request), credential['app'].ip_group)
 
     def after_authenticate_update_date(self, user):
         update_service_integration_last_used.delay((user.id,))
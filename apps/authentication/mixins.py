@@ -21,6 +21,7 @@ from django.utils.http import urlencode
 from django.utils.translation import gettext as _
 from rest_framework.request import Request
 
+from acls.matcher import LoginACLMatcher
 from acls.models import LoginACL
 from apps.jumpserver.settings.auth import AUTHENTICATION_BACKENDS_THIRD_PARTY
 from common.utils import get_request_ip_or_data, get_request_ip, get_logger, bulk_get, FlashMessageUtil
@@ -393,7 +394,7 @@ class AuthACLMixin:
 
     def _check_login_acl(self, user, ip):
         # ACL 限制用户登录
-        acl = LoginACL.get_match_rule_acls(user, ip)
+        acl = LoginACLMatcher.match(user, ip)
         if not acl:
             return
 
@@ -427,7 +428,9 @@ class AuthACLMixin:
         if not acl_id:
             return
 
-        acl = LoginACL.get_user_acls(user).filter(id=acl_id).first()
+        if not LoginACLMatcher.has_acl(user, acl_id):
+            return
+        acl = LoginACL.objects.filter(id=acl_id).first()
         if not acl:
             return
         if not acl.is_action(acl.ActionChoices.review):
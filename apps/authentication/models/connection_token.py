@@ -274,9 +274,12 @@ class ConnectionToken(JMSOrgBaseModel):
 
     @staticmethod
     def release_applet_account(lock_key):
-        if lock_key:
-            cache.delete(lock_key)
+        if not lock_key:
+            return False
+        if Applet.release_host_account(lock_key):
             return True
+        # 兼容升级前使用 cache key 占用的账号
+        return bool(cache.delete(lock_key))
 
     def set_ad_domain_if_need(self, account):
         if not self.protocol == 'rdp':
@@ -1,12 +1,18 @@
 from django.conf import settings
 from django.contrib.auth import user_logged_in, BACKEND_SESSION_KEY
 from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django_cas_ng.signals import cas_user_authenticated
 
+from accounts.models import IntegrationApplication
 from apps.jumpserver.settings.auth import AUTHENTICATION_BACKENDS_THIRD_PARTY
 from audits.models import UserSession
 from common.sessions.cache import user_session_manager
+from common.signals import post_bulk_update
+from users.models import User
+from .backends.drf import CredentialCache
+from .models import AccessKey, PrivateToken
 from .signals import post_auth_success, post_auth_failed, user_auth_failed, user_auth_success
 
 
@@ -57,3 +63,30 @@ def on_user_login_success(sender, request, user, backend, create=False, **kwargs
 def on_user_login_failed(sender, username, request, reason, backend, **kwargs):
     request.session['auth_backend'] = backend
     post_auth_failed.send(sender, username=username, request=request, reason=reason)
+
+
+@receiver([post_save, post_delete], sender=AccessKey)
+def on_access_key_changed(sender, instance, **kwargs):
+    CredentialCache.expire_access_keys([instance.id])
+
+
+@receiver([post_save, post_delete], sender=PrivateToken)
+def on_private_token_changed(sender, instance, **kwargs):
+    CredentialCache.expire_private_tokens([instance.key])
+
+
+@receiver([post_save, post_delete], sender=IntegrationApplication)
+def on_integration_application_changed(sender, instance, **kwargs):
+    CredentialCache.expire_services([instance.id])
+
+
+@receiver([post_save, pre_delete], sender=User)
+def on_user_changed_expire_credentials(sender, instance, **kwargs):
+    # 删除用户时 AccessKey 级联删除不发信号, 需要在删除前查询
+    CredentialCache.expire_user(instance.id)
+
+
+@receiver(post_bulk_update, sender=User)
+def on_users_bulk_update_expire_credentials(sender, instances=(), **kwargs):
+    CredentialCache.expire_users([i.id for i in instances])
+
@@ -0,0 +1,91 @@
+import uuid
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from accounts.models import Account
+from assets.models import Host, Platform
+from authentication.models import ConnectionToken
+from common.utils import random_string
+from orgs.models import Organization
+from orgs.utils import set_current_org
+from perms.models import AssetPermission
+from perms.utils import PermAssetDetailUtil
+from users.models import User
+
+
+class SuperConnectionTokenBatchCheckTests(APITestCase):
+    def setUp(self):
+        org = Organization.default()
+        set_current_org(org)
+        self.admin = self.create_user('admin')
+        self.admin.is_superuser = True
+        self.client.force_authenticate(user=self.admin)
+        self.client.credentials(HTTP_X_JMS_ORG=org.id)
+
+        self.user = self.create_user('user')
+        self.perm = AssetPermission.objects.create(name='perm-' + random_string(8), accounts=['root'])
+        self.perm.users.add(self.user)
+        self.url = reverse('api-auth:super-connection-token-batch-check')
+
+    def tearDown(self):
+        PermAssetDetailUtil.expire_access_decisions(user_ids=[self.user.id])
+
+    @staticmethod
+    def create_user(prefix):
+        name = '{}-{}'.format(prefix, random_string(6).lower())
+        return User.objects.create(username=name, name=name, email=name + '@example.com')
+
+    def create_host(self, permed=True):
+        platform = Platform.objects.get(name='Linux')
+        host = Host.objects.create(name='host-' + random_string(8), address='127.0.0.1', platform=platform)
+        host.protocols.create(name='ssh', port=22)
+        if permed:
+            self.perm.assets.add(host)
+        return host
+
+    def create_token(self, asset, username='root'):
+        account = Account.objects.filter(asset=asset, username=username).first() \
+            or Account.objects.create(asset=asset, username=username, name=username)
+        return ConnectionToken.objects.create(
+            user=self.user, asset=asset, account=account.alias,
+            protocol='ssh', connect_method='ssh_client'
+        )
+
+    def batch_check(self, token_ids):
+        response = self.client.post(self.url, {'token_ids': token_ids}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return {item['id']: item for item in response.data}
+
+    def test_mixed_tokens(self):
+        host = self.create_host()
+        allowed = self.create_token(host)
+        not_permed_account = self.create_token(host, username='admin')
+        not_permed_asset = self.create_token(self.create_host(permed=False))
+        not_exist = str(uuid.uuid4())
+
+        tokens = [allowed, not_permed_account, not_permed_asset]
+        results = self.batch_check([str(t.id) for t in tokens] + [not_exist])
+        codes = {token_id: item['code'] for token_id, item in results.items()}
+        self.assertEqual(codes, {
+            str(allowed.id): 'perm_ok',
+            str(not_permed_account.id): 'perm_account_invalid',
+            str(not_permed_asset.id): 'perm_account_invalid',
+            not_exist: 'token_invalid',
+        })
+        self.assertFalse(results[str(allowed.id)]['expired'])
+        self.assertTrue(results[not_exist]['expired'])
+
+    def test_queries_independent_of_tokens_count(self):
+        def count_queries(amount):
+            token_ids = [str(self.create_token(self.create_host()).id) for __ in range(amount)]
+            # 第一次请求计算并缓存授权决策
+            self.batch_check(token_ids)
+            with CaptureQueriesContext(connection) as ctx:
+                results = self.batch_check(token_ids)
+            self.assertEqual({item['code'] for item in results.values()}, {'perm_ok'})
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count_queries(2), count_queries(6))
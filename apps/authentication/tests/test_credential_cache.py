@@ -0,0 +1,23 @@
+from django.test import TestCase
+
+from authentication.backends.drf import CredentialCache
+from authentication.models import AccessKey
+from users.models import User
+
+
+class CredentialCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='cred-cache', name='cred-cache', email='cred-cache@example.com')
+        self.key = AccessKey.objects.create(user=self.user)
+
+    def test_expire_users_after_bulk_disable(self):
+        credential = CredentialCache.get_access_key(self.key.id)
+        self.assertTrue(credential['user'].is_active)
+
+        # queryset.update 不发信号, 缓存还是旧的
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        self.assertTrue(CredentialCache.get_access_key(self.key.id)['user'].is_active)
+
+        CredentialCache.expire_users([self.user.id])
+        self.assertFalse(CredentialCache.get_access_key(self.key.id)['user'].is_active)
+        self.assertFalse(CredentialCache.get_user(self.user.id)['user'].is_active)
@@ -1,12 +1,12 @@
 # -*- coding: utf-8 -*-
 #
 from collections import defaultdict
-from contextlib import nullcontext
 from itertools import chain
 from typing import Callable
 
 from django.conf import settings
 from django.db import models
+from django.db.models import prefetch_related_objects
 from django.db.models.signals import m2m_changed
 from rest_framework.request import Request
 from rest_framework.response import Response
@@ -18,7 +18,6 @@ from common.drf.filters import (
 )
 from common.utils import get_logger, lazyproperty
 from common.utils import is_uuid
-from orgs.utils import tmp_to_org, tmp_to_root_org
 from .action import RenderToJsonMixin
 from .serializer import SerializerMixin
 
@@ -98,6 +97,7 @@ class QuerySetMixin:
     get_serializer_class: Callable
     get_queryset: Callable
     slug_field = 'name'
+    paginate_count_queryset = None
 
     def get_object(self):
         pk = self.kwargs.get(self.lookup_field)
@@ -136,10 +136,10 @@ class QuerySetMixin:
         return queryset
 
     def setup_eager_loading(self, queryset, is_paginated=False):
-        is_export_request = self.request.query_params.get('format') in ['csv', 'xlsx']
         no_request_page = self.request.query_params.get('limit') is None
-        # 不分页不走一般这个，是因为会消耗多余的 sql 查询, 不如分页的时候查询一次
-        if not is_export_request and not is_paginated and not no_request_page:
+        # 分页的请求在 paginate_queryset 中处理，只对当前页执行一次 annotate 和 prefetch，
+        # 避免 count 查询带上 annotate，也避免重复查询
+        if not is_paginated and not no_request_page:
             return queryset
 
         serializer_class = self.get_serializer_class()
@@ -154,39 +154,26 @@ class QuerySetMixin:
         return queryset
 
     def paginate_queryset(self, queryset):
-        page = super().paginate_queryset(queryset)
         model = getattr(queryset, 'model', None)
         if not model or hasattr(queryset, 'custom'):
-            return page
-
-        serializer_class = self.get_serializer_class()
-        if page and serializer_class:
-            # 必须要返回 ids，用于排序
-            queryset, ids = self._get_page_again(page, model)
-            page = self.setup_eager_loading(queryset, is_paginated=True)
-            page_mapper = {str(obj.id): obj for obj in page}
-            page = [page_mapper.get(_id) for _id in ids if _id in page_mapper]
+            self.paginate_count_queryset = None
+            return super().paginate_queryset(queryset)
+
+        # count 使用原始的 queryset, 带 annotate 的 queryset 只切片查询一次当前页,
+        # prefetch 只对取出的这一页对象执行
+        self.paginate_count_queryset = queryset
+        queryset = self.setup_eager_loading(queryset, is_paginated=True)
+        lookups = getattr(queryset, '_prefetch_related_lookups', ())
+        if lookups:
+            queryset = queryset.prefetch_related(None)
+        page = super().paginate_queryset(queryset)
+        if page is None:
+            return None
+        page = list(page)
+        if lookups:
+            prefetch_related_objects(page, *lookups)
         return page
 
-    def _get_page_again(self, page, model):
-        """
-        因为 setup_eager_loading 需要是 queryset 结构, 所以必须要重新构造
-        """
-        id_org_mapper = {str(obj.id): getattr(obj, 'org_id', None) for obj in page}
-        ids = list(id_org_mapper.keys())
-        org_ids = list(set(id_org_mapper.values()) - {None})
-
-        if not org_ids:
-            context = nullcontext()
-        elif len(org_ids) == 1:
-            context = tmp_to_org(org_ids[0])
-        else:
-            context = tmp_to_root_org()
-
-        with context:
-            page = model.objects.filter(id__in=ids)
-        return page, ids
-
 
 class ExtraFilterFieldsMixin:
     """
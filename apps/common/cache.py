@@ -1,7 +1,9 @@
 import time
 
 from channels_redis.core import RedisChannelLayer as _RedisChannelLayer
+from django.core.cache import cache
 
+from common.metrics import metrics
 from common.utils.lock import DistributedLock
 from common.utils.connection import get_redis_client
 from common.utils import lazyproperty
@@ -220,6 +222,178 @@ class CacheValueDesc:
         return self.field_type.field_type(value)
 
 
+class CacheNamespace:
+    """
+    带版本号的缓存命名空间
+
+    缓存的值带上全局版本号和 scope (用户, 组织等) 的版本号,
+    失效时只需要增加对应的版本号, 不用 keys/delete_pattern 扫描整个 Redis,
+    读取时版本号和值一次 get_many 取回, 版本号不一致视为没有缓存
+
+    版本号的 key 也有过期时间 (比缓存的 timeout 长), 过期后重新生成的版本号
+    以当前时间开始, 不会和还没过期的旧缓存的版本号相同
+
+    需要计算的值用 get_or_set (或 lookup 之后 set 时传入 generations),
+    保存在计算前读取的版本号下, 计算期间的失效不会被旧的值覆盖
+    """
+    GLOBAL_SCOPE = '*'
+    _missing = object()
+
+    def __init__(self, name, timeout=60 * 60, generation_timeout=None):
+        self.name = name
+        self.timeout = timeout
+        self.generation_timeout = generation_timeout or timeout * 2
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self.name}>'
+
+    def get_generation_key(self, scope=None):
+        if scope is None:
+            scope = self.GLOBAL_SCOPE
+        return f'cache.generation.{self.name}.{scope}'
+
+    @staticmethod
+    def get_scopes(scope):
+        """
+        scope 可以是多个, 比如 (用户, 资产), 任意一个版本号变化缓存都失效
+        """
+        if scope is None:
+            return []
+        if isinstance(scope, (list, tuple)):
+            return list(scope)
+        return [scope]
+
+    def get_generation_keys(self, scope=None):
+        keys = [self.get_generation_key()]
+        keys += [self.get_generation_key(s) for s in self.get_scopes(scope)]
+        return keys
+
+    @staticmethod
+    def _get_generations(values, gen_keys):
+        return [values.get(k, 0) for k in gen_keys]
+
+    def get_generations(self, scope=None):
+        keys = self.get_generation_keys(scope)
+        return self._get_generations(cache.get_many(keys), keys)
+
+    def _format_key(self, key, scope, generations):
+        generations = '.'.join(str(g) for g in generations)
+        scope = ','.join(str(s) for s in self.get_scopes(scope))
+        return f'cache.ns.{self.name}.{generations}:{scope}:{key}'
+
+    def make_key(self, key, scope=None):
+        """ key 中带上版本号, 用于需要自己读写 Redis 的场景 """
+        return self._format_key(key, scope, self.get_generations(scope))
+
+    def _value_key(self, key, scope):
+        scope = ','.join(str(s) for s in self.get_scopes(scope))
+        return f'cache.ns.{self.name}:{scope}:{key}'
+
+    def record_lookups(self, hits, misses):
+        if hits:
+            metrics.inc('jumpserver_cache_requests_total', hits, cache=self.name, result='hit')
+        if misses:
+            metrics.inc('jumpserver_cache_requests_total', misses, cache=self.name, result='miss')
+
+    def _lookup(self, key, scopes):
+        """
+        版本号和值一次 get_many 取回
+        :return: [(value or _missing, generations)], 和 scopes 的顺序一致
+        """
+        scopes_keys = [(self.get_generation_keys(scope), self._value_key(key, scope)) for scope in scopes]
+        all_keys = set()
+        for gen_keys, value_key in scopes_keys:
+            all_keys.update(gen_keys)
+            all_keys.add(value_key)
+        values = cache.get_many(list(all_keys))
+
+        items = []
+        for gen_keys, value_key in scopes_keys:
+            generations = self._get_generations(values, gen_keys)
+            item = values.get(value_key, self._missing)
+            value = self._missing
+            if item is not self._missing and item[0] == generations:
+                value = item[1]
+            items.append((value, generations))
+        hits = len([value for value, __ in items if value is not self._missing])
+        self.record_lookups(hits, len(items) - hits)
+        return items
+
+    def lookup(self, key, scope=None, default=None):
+        """
+        :return: (value, generations), 没有缓存时计算出的值用这里的 generations 保存,
+        计算期间发生的失效不会被覆盖
+        """
+        value, generations = self._lookup(key, [scope])[0]
+        if value is self._missing:
+            value = default
+        return value, generations
+
+    def get(self, key, scope=None, default=None):
+        return self.lookup(key, scope=scope, default=default)[0]
+
+    def get_many(self, key, scopes):
+        """
+        :return: {scope: value}, 没有缓存或版本号已变化的 scope 不返回
+        """
+        scopes = list(scopes)
+        items = self._lookup(key, scopes)
+        return {
+            scope: value
+            for scope, (value, __) in zip(scopes, items)
+            if value is not self._missing
+        }
+
+    def get_or_set(self, key, func, scope=None, timeout=None):
+        """ 先读取版本号再计算, 保存到计算前的版本号下 """
+        value, generations = self.lookup(key, scope=scope, default=self._missing)
+        if value is self._missing:
+            value = func()
+            self.set(key, value, scope=scope, timeout=timeout, generations=generations)
+        return value
+
+    def set(self, key, value, scope=None, timeout=None, generations=None):
+        """
+        :param generations: 计算值之前读取的版本号 (lookup 返回), 不传时读取当前的版本号
+        """
+        # 缓存不能比版本号活得久, 否则版本号过期重建后可能读到失效前的值
+        if timeout is None or timeout > self.timeout:
+            timeout = self.timeout
+        if generations is None:
+            generations = self.get_generations(scope)
+        cache.set(self._value_key(key, scope), (generations, value), timeout)
+
+    def delete(self, key, scope=None):
+        cache.delete(self._value_key(key, scope))
+
+    def expire(self, scope=None):
+        """
+        scope 为 None 时增加全局版本号, 命名空间下所有的缓存都失效
+        """
+        generation = self.expire_many([scope])[0]
+        logger.debug(f'Expire cache namespace: name={self.name} scope={scope} generation={generation}')
+        return generation
+
+    def expire_many(self, scopes):
+        """
+        一次 pipeline 增加多个 scope 的版本号
+        版本号不存在时以当前毫秒时间开始, 并设置过期时间, 事务中执行保证 key 总有过期时间
+        """
+        scopes = list(scopes)
+        if not scopes:
+            return []
+        initial = int(time.time() * 1000)
+        client = get_redis_client()
+        with client.pipeline(transaction=True) as p:
+            for scope in scopes:
+                key = cache.make_key(self.get_generation_key(scope))
+                p.set(key, initial, ex=self.generation_timeout, nx=True)
+                p.incr(key)
+            generations = p.execute()[1::2]
+        logger.debug(f'Expire cache namespace: name={self.name} scopes={len(scopes)}')
+        return generations
+
+
 class RedisChannelLayer(_RedisChannelLayer):
     async def _brpop_with_clean(self, index, channel, timeout):
         cleanup_script = """
@@ -1,16 +1,21 @@
-from django.db.models import Aggregate
+from django.db import connection
+from django.db.models import Aggregate, CharField
 
 
 class GroupConcat(Aggregate):
+    """
+    分组内的值拼接为字符串, MySQL 为 GROUP_CONCAT, PostgreSQL 为 STRING_AGG
+    """
     function = 'GROUP_CONCAT'
-    template = '%(function)s(%(expressions)s %(order_by)s %(separator)s)'
-    allow_distinct = False
+    template = '%(function)s(%(distinct)s%(expressions)s %(order_by)s %(separator)s)'
+    allow_distinct = True
+    output_field = CharField()
 
     def __init__(self, expression, order_by=None, separator=',', **extra):
         order_by_clause = ''
         if order_by is not None:
             order = 'ASC'
-            prefix, body = order_by[1], order_by[1:]
+            prefix, body = order_by[0], order_by[1:]
             if prefix == '-':
                 order = 'DESC'
             elif prefix == '+':
@@ -19,9 +24,37 @@ class GroupConcat(Aggregate):
                 body = order_by
             order_by_clause = f'ORDER BY {body} {order}'
 
+        self.separator = separator
         super().__init__(
             expression,
             order_by=order_by_clause,
             separator=f"SEPARATOR '{separator}'",
             **extra
         )
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            function='STRING_AGG',
+            template="%(function)s(%(distinct)s(%(expressions)s)::text, %(separator)s %(order_by)s)",
+            separator=f"'{self.separator}'",
+            **extra_context
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # sqlite 的 GROUP_CONCAT 不支持 ORDER BY, DISTINCT 时不能指定分隔符
+        template = "%(function)s(%(distinct)s%(expressions)s)" if self.distinct \
+            else "%(function)s(%(expressions)s, %(separator)s)"
+        return super().as_sql(
+            compiler, connection, template=template,
+            separator=f"'{self.separator}'",
+            **extra_context
+        )
+
+
+def set_group_concat_max_len(length=1024 * 1024):
+    """ MySQL 默认的 group_concat_max_len 只有 1024, 超出的部分会被截断 """
+    if connection.vendor != 'mysql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SET SESSION group_concat_max_len = %s', [length])
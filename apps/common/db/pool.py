@@ -0,0 +1,205 @@
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+
+from common.utils import get_logger
+
+logger = get_logger(__file__)
+
+__all__ = ['ConnectionPool', 'PooledDatabaseWrapperMixin', 'get_pool_metrics']
+
+
+class ConnectionPool:
+    """
+    进程内的数据库连接池, Django 关闭连接时放回池中, 下次连接时复用
+
+    - 同时使用的连接数不超过 DB_POOL_SIZE, 超过时最多等待 DB_POOL_TIMEOUT 秒,
+      还等不到就临时创建一个, 归还时直接关闭 (overflow)
+    - 空闲超过 DB_POOL_HEALTH_CHECK_INTERVAL 秒的连接取出时先 SELECT 1 检查
+    - 连接使用超过 DB_POOL_RECYCLE 秒后关闭重建
+    - fork 后的子进程不复用父进程的连接
+    """
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.pid = os.getpid()
+        self.size = settings.DB_POOL_SIZE
+        self.timeout = settings.DB_POOL_TIMEOUT
+        self.recycle = settings.DB_POOL_RECYCLE
+        self.health_check_interval = settings.DB_POOL_HEALTH_CHECK_INTERVAL
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(self.size)
+        # id(conn) -> [created_time, last_used_time, is_overflow], 读写时需要加锁
+        self.conn_info = {}
+        self.lock = threading.Lock()
+        self.metrics = {
+            'checkouts': 0, 'created': 0, 'reused': 0, 'closed': 0,
+            'waits': 0, 'wait_seconds': 0.0, 'overflow': 0,
+            'health_check_failures': 0,
+        }
+
+    @classmethod
+    def get_pool(cls, alias):
+        pool = cls._pools.get(alias)
+        if pool and pool.pid == os.getpid():
+            return pool
+        with cls._pools_lock:
+            pool = cls._pools.get(alias)
+            if not pool or pool.pid != os.getpid():
+                # 父进程的连接 socket 不能在子进程中使用, 也不能关闭, 直接丢弃
+                pool = cls(alias)
+                cls._pools[alias] = pool
+        return pool
+
+    @classmethod
+    def get_all_metrics(cls):
+        return {alias: pool.get_metrics() for alias, pool in cls._pools.items()}
+
+    def incr(self, key, amount=1):
+        with self.lock:
+            self.metrics[key] += amount
+
+    def acquire_slot(self):
+        if self.slots.acquire(blocking=False):
+            return True
+        start = time.time()
+        acquired = self.slots.acquire(timeout=self.timeout)
+        with self.lock:
+            self.metrics['waits'] += 1
+            self.metrics['wait_seconds'] += time.time() - start
+        if not acquired:
+            logger.warning(f'DB pool {self.alias} exhausted, size: {self.size}, create overflow connection')
+        return acquired
+
+    @staticmethod
+    def ping(conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+
+    def is_healthy(self, conn, info):
+        now = time.time()
+        if self.recycle and now - info[0] > self.recycle:
+            return False
+        if now - info[1] < self.health_check_interval:
+            return True
+        try:
+            self.ping(conn)
+            return True
+        except Exception as e:
+            self.incr('health_check_failures')
+            logger.warning(f'DB pool {self.alias} health check failed: {e}')
+            return False
+
+    def get_idle(self):
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                return None
+            with self.lock:
+                info = list(self.conn_info[id(conn)])
+            if self.is_healthy(conn, info):
+                return conn
+            self.close(conn)
+
+    def checkout(self, create_func):
+        in_pool = self.acquire_slot()
+        try:
+            conn = self.get_idle()
+            if conn is not None:
+                self.incr('reused')
+            else:
+                conn = create_func()
+                self.incr('created')
+        except Exception:
+            if in_pool:
+                self.slots.release()
+            raise
+
+        now = time.time()
+        with self.lock:
+            info = self.conn_info.setdefault(id(conn), [now, now, False])
+            info[1], info[2] = now, not in_pool
+            self.metrics['checkouts'] += 1
+            if not in_pool:
+                self.metrics['overflow'] += 1
+        return conn
+
+    def checkin(self, conn, reusable=True):
+        with self.lock:
+            info = self.conn_info.get(id(conn))
+            overflow = info[2] if info else False
+        if info is None:
+            # 连接池重建前创建的连接
+            self.close(conn, untracked=True)
+            return
+        if reusable and not overflow:
+            try:
+                # 回滚未提交的事务, 避免带到下一次使用
+                conn.rollback()
+            except Exception:
+                reusable = False
+        if reusable and not overflow:
+            with self.lock:
+                info[1] = time.time()
+            self.idle.put(conn)
+        else:
+            self.close(conn)
+        if not overflow:
+            self.slots.release()
+
+    def close(self, conn, untracked=False):
+        with self.lock:
+            if not untracked:
+                self.conn_info.pop(id(conn), None)
+            self.metrics['closed'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def get_metrics(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+            total = len(self.conn_info)
+        idle = self.idle.qsize()
+        metrics.update({
+            'size': self.size,
+            'idle': idle,
+            'in_use': total - idle,
+        })
+        return metrics
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    替换 DatabaseWrapper 的建立和关闭连接, 从连接池中取出和归还
+    """
+
+    @property
+    def pool(self):
+        return ConnectionPool.get_pool(self.alias)
+
+    def get_new_connection(self, conn_params):
+        create_func = lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params)
+        return self.pool.checkout(create_func)
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # 在事务中被关闭, 或者出错后不可用的连接不再复用
+        reusable = not self.in_atomic_block and (not self.errors_occurred or self.is_usable())
+        with self.wrap_database_errors:
+            self.pool.checkin(self.connection, reusable=reusable)
+
+
+def get_pool_metrics():
+    return ConnectionPool.get_all_metrics()
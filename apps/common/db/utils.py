@@ -92,6 +92,8 @@ def safe_atomic_db_connection(auto_close=False):
 def open_db_connection(alias="default"):
     connection = transaction.get_connection(alias)
     try:
+        # 先归还当前线程已有的连接, 开启连接池时从池中取出检查过的连接
+        connection.close()
         connection.connect()
         with transaction.atomic():
             yield connection
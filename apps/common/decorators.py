@@ -12,6 +12,7 @@ from functools import wraps
 from django.db import transaction
 
 from .db.utils import open_db_connection, safe_atomic_db_connection
+from .metrics import metrics
 from .utils import logger
 
 
@@ -85,15 +86,18 @@ def get_loop():
 def cancel_or_remove_debouncer_task(cache_key):
     task = _loop_debouncer_func_task_cache.get(cache_key, None)
     if not task:
-        return
+        return False
     if task.done():
         del _loop_debouncer_func_task_cache[cache_key]
+        return False
     else:
         task.cancel()
+        return True
 
 
 def run_debouncer_func(cache_key, org, ttl, func, *args, **kwargs):
-    cancel_or_remove_debouncer_task(cache_key)
+    if cancel_or_remove_debouncer_task(cache_key):
+        metrics.inc('jumpserver_debouncer_calls_total', func=func.__name__, result='merged')
     run_func_partial = functools.partial(_run_func_with_org, cache_key, org, func)
 
     current = time.time()
@@ -152,6 +156,7 @@ def _run_func_with_org(key, org, func, *args, **kwargs):
             # 避免出现 MySQL server has gone away 的情况
             set_current_org(org)
             func(*args, **kwargs)
+        metrics.inc('jumpserver_debouncer_calls_total', func=func.__name__, result='run')
     except Exception as e:
         msg = str(e)
         log_func = logger.error
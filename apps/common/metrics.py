@@ -0,0 +1,272 @@
+import atexit
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from common.utils import get_logger
+from common.utils.connection import get_redis_client
+
+logger = get_logger(__name__)
+
+__all__ = ['metrics', 'MetricsRegistry']
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class MetricsRegistry:
+    """
+    Prometheus 指标, 先在进程内累计, 每隔 METRICS_FLUSH_INTERVAL 秒合并到 Redis,
+    web, ws, celery 多个进程的数据在导出时汇总
+
+    - counter 存在 hash metrics:{name}, field 是 label 字符串
+    - histogram 存 metrics:{name}:bucket (不累加的分桶计数), :sum, :count
+    - gauge 是进程内的当前值, 每个进程一个 hash metrics:gauges:{进程}, 定时刷新过期时间,
+      进程崩溃后自动过期, 不会一直累加在共享的值上
+    """
+    key_prefix = 'metrics:'
+    gauge_key_prefix = 'metrics:gauges:'
+    gauge_processes_key = 'metrics:gauges'
+
+    def __init__(self):
+        self.definitions = {}
+        self.buffer = defaultdict(float)
+        self.gauges = defaultdict(float)
+        self.lock = threading.Lock()
+        self.last_flush = time.time()
+        self.pid = os.getpid()
+        self.heartbeat_pid = None
+        atexit.register(self.shutdown)
+
+    def define(self, name, tp, doc, buckets=None):
+        self.definitions[name] = (tp, doc, buckets)
+
+    @property
+    def enabled(self):
+        return settings.METRICS_ENABLED
+
+    @staticmethod
+    def format_labels(labels):
+        items = []
+        for k, v in sorted(labels.items()):
+            v = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            items.append(f'{k}="{v}"')
+        return ','.join(items)
+
+    @property
+    def process_id(self):
+        return f'{socket.gethostname()}-{os.getpid()}'
+
+    @property
+    def gauge_ttl(self):
+        return max(settings.METRICS_FLUSH_INTERVAL * 3, 30)
+
+    def reset_after_fork(self):
+        # fork 出来的子进程不继承父进程的数据
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            self.pid = os.getpid()
+            self.buffer = defaultdict(float)
+            self.gauges = defaultdict(float)
+
+    def _add(self, key, field, value):
+        self.reset_after_fork()
+        with self.lock:
+            self.buffer[(key, field)] += value
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        field = self.format_labels(labels)
+        if self.definitions[name][0] == 'gauge':
+            self.reset_after_fork()
+            with self.lock:
+                self.gauges[f'{name}|{field}'] += value
+            self.start_heartbeat()
+        else:
+            self._add(self.key_prefix + name, field, value)
+        self.maybe_flush()
+
+    def dec(self, name, value=1, **labels):
+        self.inc(name, -value, **labels)
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        buckets = self.definitions[name][2] or DEFAULT_BUCKETS
+        le = next((str(b) for b in buckets if value <= b), '+Inf')
+        key = self.key_prefix + name
+        field = self.format_labels(labels)
+        self._add(f'{key}:bucket', f'{field}|{le}', 1)
+        self._add(f'{key}:sum', field, value)
+        self._add(f'{key}:count', field, 1)
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if time.time() - self.last_flush < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self.flush()
+
+    def start_heartbeat(self):
+        """ 进程中有 gauge 时, 没有新的请求也要定时刷新, 否则会过期 """
+        if self.heartbeat_pid == os.getpid():
+            return
+        self.heartbeat_pid = os.getpid()
+        threading.Thread(target=self._heartbeat, daemon=True).start()
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        self.reset_after_fork()
+        with self.lock:
+            buffer, self.buffer = self.buffer, defaultdict(float)
+            gauges = dict(self.gauges)
+            self.last_flush = time.time()
+        if not buffer and not gauges:
+            return
+        try:
+            with get_redis_client().pipeline(transaction=False) as p:
+                for (key, field), value in buffer.items():
+                    p.hincrbyfloat(key, field, value)
+                if gauges:
+                    gauge_key = self.gauge_key_prefix + self.process_id
+                    p.hset(gauge_key, mapping=gauges)
+                    p.expire(gauge_key, self.gauge_ttl)
+                    p.zadd(self.gauge_processes_key, {self.process_id: time.time()})
+                p.execute()
+        except Exception as e:
+            logger.error(f'Flush metrics error: {e}')
+            # 没有写入的计数下次再写
+            with self.lock:
+                for k, v in buffer.items():
+                    self.buffer[k] += v
+
+    def shutdown(self):
+        """ 进程退出时写入剩下的计数, 删除这个进程的 gauge """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges.clear()
+        self.flush()
+        if self.heartbeat_pid != os.getpid():
+            return
+        try:
+            with get_redis_client().pipeline(transaction=False) as p:
+                p.delete(self.gauge_key_prefix + self.process_id)
+                p.zrem(self.gauge_processes_key, self.process_id)
+                p.execute()
+        except Exception as e:
+            logger.error(f'Clean metrics gauges error: {e}')
+
+    def collect_gauges(self, client):
+        """ 汇总还在刷新的进程的 gauge, :return: {name: {labels: value}} """
+        expired = time.time() - self.gauge_ttl
+        client.zremrangebyscore(self.gauge_processes_key, '-inf', expired)
+        processes = client.zrange(self.gauge_processes_key, 0, -1)
+        with client.pipeline(transaction=False) as p:
+            for process in processes:
+                process = process.decode() if isinstance(process, bytes) else process
+                p.hgetall(self.gauge_key_prefix + process)
+            results = p.execute()
+
+        gauges = defaultdict(lambda: defaultdict(float))
+        for data in results:
+            for key, value in self._decode(data).items():
+                name, labels = key.split('|', 1)
+                gauges[name][labels] += value
+        return gauges
+
+    @staticmethod
+    def _decode(data):
+        return {
+            (k.decode() if isinstance(k, bytes) else k): float(v)
+            for k, v in data.items()
+        }
+
+    @staticmethod
+    def format_value(value):
+        return int(value) if value == int(value) else round(value, 6)
+
+    def format_gauge(self, name, doc, samples):
+        """ 导出时才计算的指标, samples: [(labels, value)] """
+        lines = [f'# HELP {name} {doc}', f'# TYPE {name} gauge']
+        for labels, value in samples:
+            lines.append(f'{name}{{{self.format_labels(labels)}}} {self.format_value(value)}')
+        return lines
+
+    def collect(self):
+        self.flush()
+        client = get_redis_client()
+        gauges = self.collect_gauges(client)
+        with client.pipeline(transaction=False) as p:
+            for name, (tp, doc, buckets) in self.definitions.items():
+                key = self.key_prefix + name
+                if tp == 'histogram':
+                    p.hgetall(f'{key}:bucket')
+                    p.hgetall(f'{key}:sum')
+                    p.hgetall(f'{key}:count')
+                elif tp == 'counter':
+                    p.hgetall(key)
+            results = iter(p.execute())
+
+        lines = []
+        for name, (tp, doc, buckets) in self.definitions.items():
+            lines.append(f'# HELP {name} {doc}')
+            lines.append(f'# TYPE {name} {tp}')
+            if tp == 'gauge':
+                for labels, value in sorted(gauges[name].items()):
+                    lines.append(f'{name}{{{labels}}} {self.format_value(value)}')
+                continue
+            if tp == 'counter':
+                for labels, value in sorted(self._decode(next(results)).items()):
+                    lines.append(f'{name}{{{labels}}} {self.format_value(value)}')
+                continue
+
+            bucket_data = self._decode(next(results))
+            sums = self._decode(next(results))
+            counts = self._decode(next(results))
+            bounds = [str(b) for b in (buckets or DEFAULT_BUCKETS)] + ['+Inf']
+            for labels in sorted(counts):
+                cumulative = 0
+                sep = ',' if labels else ''
+                for le in bounds:
+                    cumulative += bucket_data.get(f'{labels}|{le}', 0)
+                    lines.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {self.format_value(cumulative)}')
+                lines.append(f'{name}_sum{{{labels}}} {self.format_value(sums.get(labels, 0))}')
+                lines.append(f'{name}_count{{{labels}}} {self.format_value(counts[labels])}')
+        return lines
+
+
+metrics = MetricsRegistry()
+metrics.define(
+    'jumpserver_http_request_duration_seconds', 'histogram',
+    'HTTP request latency by view'
+)
+metrics.define(
+    'jumpserver_http_request_db_queries', 'histogram',
+    'DB queries per HTTP request by view', buckets=COUNT_BUCKETS
+)
+metrics.define(
+    'jumpserver_cache_requests_total', 'counter',
+    'Cache lookups of perm tree, node mapping and RBAC caches by result'
+)
+metrics.define(
+    'jumpserver_celery_task_duration_seconds', 'histogram',
+    'Celery task duration by task and state'
+)
+metrics.define(
+    'jumpserver_debouncer_calls_total', 'counter',
+    'Delayed function calls, merged calls are replaced by a later one'
+)
+metrics.define(
+    'jumpserver_websocket_connections', 'gauge',
+    'Open websocket connections by path'
+)
@@ -83,6 +83,19 @@ class ESClientV7(ESClientBase):
     def get_sorts(cls, sorts: list):
         return ','.join(sorts)
 
+    @classmethod
+    def get_date_histogram(cls, field, interval, time_zone=None):
+        agg = {'field': field, 'calendar_interval': interval}
+        if time_zone:
+            agg['time_zone'] = time_zone
+        return agg
+
+    def open_point_in_time(self, index, keep_alive):
+        return self.es.open_point_in_time(index=index, keep_alive=keep_alive)['id']
+
+    def close_point_in_time(self, pit_id):
+        self.es.close_point_in_time(body={'id': pit_id})
+
 
 class ESClientV6(ESClientV7):
 
@@ -94,6 +107,17 @@ class ESClientV6(ESClientV7):
     def get_mapping(cls, properties):
         return {'mappings': {'data': {'properties': properties}}}
 
+    @classmethod
+    def get_date_histogram(cls, field, interval, time_zone=None):
+        agg = {'field': field, 'interval': interval}
+        if time_zone:
+            agg['time_zone'] = time_zone
+        return agg
+
+    def open_point_in_time(self, index, keep_alive):
+        # 6.x 不支持 point in time
+        return None
+
 
 class ESClientV8(ESClientBase):
     def __init__(self, *args, **kwargs):
@@ -108,6 +132,16 @@ class ESClientV8(ESClientBase):
     def get_sorts(cls, sorts: list):
         return sorts
 
+    @classmethod
+    def get_date_histogram(cls, field, interval, time_zone=None):
+        return ESClientV7.get_date_histogram(field, interval, time_zone)
+
+    def open_point_in_time(self, index, keep_alive):
+        return self.es.open_point_in_time(index=index, keep_alive=keep_alive)['id']
+
+    def close_point_in_time(self, pit_id):
+        self.es.close_point_in_time(id=pit_id)
+
 
 def get_es_client_version(**kwargs):
     try:
@@ -122,6 +156,8 @@ def get_es_client_version(**kwargs):
 
 
 class ES(object):
+    # search_after 翻页时兜底排序的唯一字段, 需要是 keyword 类型
+    unique_sort_field = 'id'
 
     def __init__(
             self, config, properties, keyword_fields,
@@ -243,15 +279,28 @@ class ES(object):
             item = data[0]
         return item
 
-    def filter(self, query: dict, from_=None, size=None, sort=None):
+    def filter(self, query: dict, from_=None, size=None, sort=None, source=None, search_after=None):
         try:
-            data = self._filter(query, from_, size, sort)
+            data = self._filter(query, from_, size, sort, source=source, search_after=search_after)
         except Exception as e:
             logger.error('ES filter error: {}'.format(e))
             data = []
         return data
 
-    def _filter(self, query: dict, from_=None, size=None, sort=None):
+    def _filter(self, query: dict, from_=None, size=None, sort=None, source=None, search_after=None):
+        data = self._search(
+            query, from_=from_, size=size, sort=sort,
+            source=source, search_after=search_after
+        )
+        return self.parse_hits(data)
+
+    def _search(self, query: dict, from_=None, size=None, sort=None,
+                source=None, search_after=None, pit=None):
+        """
+        :param source: _source 过滤, 如 {'includes': ['id']}, 减少返回的数据量
+        :param search_after: 上一页最后一条的 sort 值, 深度分页不受 max_result_window 限制
+        :param pit: point in time id, 导出时保证多次查询看到的数据一致
+        """
         body = self.get_query_body(**query)
         search_params = {
             'index': self.query_index,
@@ -259,19 +308,144 @@ class ES(object):
             'from_': from_,
             'size': size
         }
+        if source is not None:
+            body['_source'] = source
+        if search_after is not None:
+            body['search_after'] = search_after
+            search_params.pop('from_')
+        if pit is not None:
+            body['pit'] = pit
+            search_params.pop('index')
         if sort is not None:
             search_params['sort'] = sort
         logger.info('search_params: {}'.format(search_params))
-        data = self.es.search(**search_params)
+        return self.es.search(**search_params)
 
+    @staticmethod
+    def parse_hits(data):
         source_data = []
         for item in data['hits']['hits']:
             if item:
-                item['_source'].update({'es_id': item['_id']})
-                source_data.append(item['_source'])
-
+                source = item.get('_source', {})
+                source.update({'es_id': item['_id']})
+                if 'sort' in item:
+                    source['es_sort'] = item['sort']
+                source_data.append(source)
         return source_data
 
+    @staticmethod
+    def parse_total(data):
+        total = data['hits']['total']
+        if isinstance(total, dict):
+            total = total['value']
+        return total
+
+    def open_point_in_time(self, keep_alive='5m'):
+        try:
+            return self.client.open_point_in_time(self.query_index, keep_alive)
+        except Exception as e:
+            logger.warning('ES open point in time error: {}'.format(e))
+            return None
+
+    def close_point_in_time(self, pit_id):
+        try:
+            self.client.close_point_in_time(pit_id)
+        except Exception as e:
+            logger.warning('ES close point in time error: {}'.format(e))
+
+    @lazyproperty
+    def unique_sort_key(self):
+        """ 旧的索引可能还没有唯一字段, 或者被动态映射为 text 类型 """
+        try:
+            props = self.get_properties()
+        except Exception as e:
+            logger.warning('ES get properties error: {}'.format(e))
+            return self.unique_sort_field
+        if self.unique_sort_field not in props:
+            return '_id'
+        return self.get_agg_field(props, self.unique_sort_field)
+
+    def get_sorts(self, sorts: list, pit=False):
+        """
+        search_after 的游标需要唯一, _doc 在多个分片间会重复, 翻页时会跳过或重复数据
+        point in time 时用 _shard_doc 兜底, 否则用唯一字段兜底
+        """
+        field = '_shard_doc' if pit else self.unique_sort_key
+        sorts = [*sorts, self.client.get_sort(field, 'asc')]
+        return self.client.get_sorts(sorts)
+
+    def iter_all(self, query: dict, sorts: list, batch_size=1000, source=None, keep_alive='5m'):
+        """
+        用 point in time + search_after 遍历所有匹配的数据, 用于导出
+        不支持 point in time 时直接用 search_after
+        """
+        pit_id = self.open_point_in_time(keep_alive)
+        sort = self.get_sorts(sorts, pit=bool(pit_id))
+        search_after = None
+        try:
+            while True:
+                pit = {'id': pit_id, 'keep_alive': keep_alive} if pit_id else None
+                data = self._search(
+                    query, size=batch_size, sort=sort, source=source,
+                    search_after=search_after, pit=pit
+                )
+                pit_id = data.get('pit_id', pit_id)
+                items = self.parse_hits(data)
+                yield from items
+                if len(items) < batch_size:
+                    break
+                search_after = items[-1]['es_sort']
+        finally:
+            if pit_id:
+                self.close_point_in_time(pit_id)
+
+    def get_properties(self):
+        # query_index 可能是别名, 合并所有索引的 mapping
+        mapping = self.es.indices.get_mapping(index=self.query_index)
+        props = {}
+        for data in mapping.values():
+            mappings = data.get('mappings', {})
+            # 6.x 的 mapping 在 type 下
+            mappings = mappings.get('data', mappings)
+            props.update(mappings.get('properties', {}))
+        return props
+
+    @staticmethod
+    def get_agg_field(props: dict, field: str) -> str:
+        # 动态映射的字符串是 text 类型, 需要用 keyword 子字段聚合
+        if props.get(field, {}).get('type', 'text') == 'text':
+            return f'{field}.keyword'
+        return field
+
+    def aggregate(self, query: dict, aggs: dict):
+        """ 只返回聚合结果和总数, 不返回文档 """
+        body = self.get_query_body(**query)
+        body.update({'size': 0, 'aggs': aggs, 'track_total_hits': True})
+        data = self.es.search(index=self.query_index, body=body)
+        return self.parse_total(data), data.get('aggregations', {})
+
+    def terms(self, query: dict, field: str, size=100):
+        try:
+            agg_field = self.get_agg_field(self.get_properties(), field)
+            aggs = {'terms': {'terms': {'field': agg_field, 'size': size}}}
+            total, aggregations = self.aggregate(query, aggs)
+            buckets = aggregations['terms']['buckets']
+        except Exception as e:
+            logger.error('ES terms aggregation error: {}'.format(e))
+            return 0, {}
+        return total, {bucket['key']: bucket['doc_count'] for bucket in buckets}
+
+    def date_histogram(self, query: dict, field: str, interval='1d', time_zone=None):
+        try:
+            histogram = self.client.get_date_histogram(field, interval, time_zone)
+            aggs = {'histogram': {'date_histogram': histogram}}
+            __, aggregations = self.aggregate(query, aggs)
+            buckets = aggregations['histogram']['buckets']
+        except Exception as e:
+            logger.error('ES date histogram aggregation error: {}'.format(e))
+            return []
+        return [(bucket['key_as_string'], bucket['doc_count']) for bucket in buckets]
+
     def count(self, **query):
         try:
             body = self.get_query_body(**query)
@@ -451,6 +625,7 @@ class QuerySet(DJQuerySet):
     def __init__(self, es_instance):
         self._method_calls = []
         self._slice = None  # (from_, size)
+        self._search_after = None
         self._storage = es_instance
 
         # 命令列表模糊搜索时报错
@@ -494,6 +669,18 @@ class QuerySet(DJQuerySet):
             striped_kwargs[k] = v
         return striped_kwargs
 
+    @lazyproperty
+    def _source(self):
+        """ only / defer 转为 _source 过滤 """
+        source = {}
+        for name, key in (('only', 'includes'), ('defer', 'excludes')):
+            calls = self._grouped_method_calls.get(name)
+            if not calls:
+                continue
+            fields = [field for call in calls for field in call[1]]
+            source[key] = fields
+        return source or None
+
     @lazyproperty
     def _sort(self):
         order_by = self._grouped_method_calls.get('order_by')
@@ -512,14 +699,16 @@ class QuerySet(DJQuerySet):
                     sort = self._storage.client.get_sort(field, direction)
                     _sorts.append(sort)
                     break
-        sorts = self._storage.client.get_sorts(_sorts)
-        return sorts
+        return _sorts
 
     def __execute(self):
         _filter_kwargs = self._filter_kwargs
-        _sort = self._sort
         from_, size = self._slice or (None, None)
-        data = self._storage.filter(_filter_kwargs, from_=from_, size=size, sort=_sort)
+        data = self._storage.filter(
+            _filter_kwargs, from_=from_, size=size,
+            sort=self._storage.get_sorts(self._sort),
+            source=self._source, search_after=self._search_after
+        )
         return self.model.from_multi_dict(data)
 
     def __stage_method_call(self, item, *args, **kwargs):
@@ -531,9 +720,39 @@ class QuerySet(DJQuerySet):
         uqs = QuerySet(self._storage)
         uqs._method_calls = self._method_calls.copy()
         uqs._slice = self._slice
+        uqs._search_after = self._search_after
         uqs.model = self.model
         return uqs
 
+    def search_after(self, values):
+        """
+        从上一页最后一条的 es_sort 之后继续查询, 忽略 offset
+        """
+        clone = self.__clone()
+        clone._search_after = values
+        return clone
+
+    def iterator(self, chunk_size=1000):
+        """ 导出等需要遍历所有数据的场景, 不受 max_result_window 限制 """
+        data = self._storage.iter_all(
+            self._filter_kwargs, self._sort, batch_size=chunk_size, source=self._source
+        )
+        for item in data:
+            yield self.model.from_dict(item)
+
+    def count_by(self, field, size=100):
+        """
+        一次查询返回总数和按 field 分组的数量
+        :return: (total, {str(value): count})
+        """
+        total, buckets = self._storage.terms(self._filter_kwargs, field, size=size)
+        return total, {str(k): v for k, v in buckets.items()}
+
+    def date_histogram(self, field, interval='1d', time_zone=None):
+        return self._storage.date_histogram(
+            self._filter_kwargs, field, interval=interval, time_zone=time_zone
+        )
+
     def get(self, **kwargs):
         kwargs.update(self._filter_kwargs)
         return self._storage.get(kwargs)
@@ -570,7 +789,10 @@ class QuerySet(DJQuerySet):
                 else:
                     size = item.stop - from_
 
-                if from_ + size > max_window:
+                if self._search_after is not None:
+                    # search_after 没有 offset, 只限制每页数量
+                    size = min(size, max_window)
+                elif from_ + size > max_window:
                     if from_ >= max_window:
                         from_ = max_window
                         size = 0
@@ -6,8 +6,11 @@ if sys.version_info.major >= 3 and sys.version_info.minor >= 10:
 else:
     from collections import Iterable
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError as DjangoValidationError
+from django.db import transaction
 from django.db.models import NOT_PROVIDED, OneToOneField
+from django.db.models.signals import m2m_changed
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
@@ -16,7 +19,9 @@ from rest_framework.settings import api_settings
 from rest_framework.utils import html
 from rest_framework_bulk.serializers import BulkListSerializer
 
+from common.const.signals import PRE_ADD, POST_ADD, PRE_REMOVE, POST_REMOVE
 from common.db.fields import EncryptMixin
+from common.signals import pre_bulk_update, post_bulk_update
 from common.serializers.fields import (
     EncryptedField,
     LabeledChoiceField,
@@ -111,6 +116,10 @@ class BulkSerializerMixin(object):
             self.initial_data = data
         return super().run_validation(data)
 
+    def clean_bulk_update_attrs(self, instance, attrs):
+        """ 走 bulk_update 之前处理数据, 和 update 中对 validated_data 的处理保持一致 """
+        return attrs
+
     @classmethod
     def many_init(cls, *args, **kwargs):
         from .common import AdaptedBulkListSerializer
@@ -128,7 +137,28 @@ class BulkListSerializerMixin:
     'QuerySet' object has no attribute 'pk' when doing bulk update
     so rewrite it .
     https://github.com/miki725/django-rest-framework-bulk/issues/68
+
+    批量更新时一次查询出所有对象, 子 serializer 的 Meta.use_model_bulk_update = True 时
+    按修改的字段分组 bulk_update, 多对多字段只增删有变化的关联, 不发送逐个的 post_save,
+    而是发送 pre_bulk_update / post_bulk_update 信号, 多对多仍然发送 m2m_changed
+
+    Meta.bulk_update_fields 限定可以走 bulk_update 的字段, 修改了其他字段的对象仍然逐个 update
     """
+    _instance_map = None
+
+    def to_pk(self, pk):
+        """ 统一 pk 的格式, 如不同写法的 uuid """
+        try:
+            return self.instance.model._meta.pk.to_python(pk)
+        except DjangoValidationError:
+            return None
+
+    def get_instance_map(self, data):
+        if self._instance_map is None:
+            pks = [item.get("id", item.get("pk")) for item in data if isinstance(item, dict)]
+            pks = [pk for pk in map(self.to_pk, pks) if pk is not None]
+            self._instance_map = {obj.pk: obj for obj in self.instance.filter(pk__in=pks)}
+        return self._instance_map
 
     def to_internal_value(self, data):
         """
@@ -159,6 +189,8 @@ class BulkListSerializerMixin:
 
         ret = []
         errors = []
+        instance_map = self.get_instance_map(data)
+        model = self.instance.model
 
         for item in data:
             try:
@@ -169,7 +201,11 @@ class BulkListSerializerMixin:
                     pk = item["pk"]
                 else:
                     raise ValidationError("id or pk not in data")
-                child = self.instance.get(pk=pk)
+                child = instance_map.get(self.to_pk(pk))
+                if child is None:
+                    raise model.DoesNotExist(
+                        "%s matching query does not exist." % model._meta.object_name
+                    )
                 self.child.instance = child
                 self.child.initial_data = item
                 # raw
@@ -187,6 +223,136 @@ class BulkListSerializerMixin:
 
         return ret
 
+    def update(self, queryset, all_validated_data):
+        id_attr = getattr(self.child.Meta, "update_lookup_field", "id")
+        instance_map = self._instance_map or {}
+        instances = []
+        for attrs in all_validated_data:
+            obj = instance_map.get(self.to_pk(attrs.pop(id_attr, None)))
+            if obj is None:
+                raise ValidationError("Could not find all objects to update.")
+            instances.append(obj)
+
+        if not getattr(self.child.Meta, "use_model_bulk_update", False):
+            return [
+                self.child.update(obj, attrs)
+                for obj, attrs in zip(instances, all_validated_data)
+            ]
+
+        bulk_fields = self.get_bulk_update_fields()
+        bulk_instances, bulk_data, updated = [], [], {}
+        for obj, attrs in zip(instances, all_validated_data):
+            if set(attrs) <= bulk_fields:
+                bulk_instances.append(obj)
+                bulk_data.append(self.child.clean_bulk_update_attrs(obj, attrs))
+            else:
+                updated[obj.pk] = self.child.update(obj, attrs)
+        if bulk_instances:
+            self.bulk_update(bulk_instances, bulk_data)
+        return [updated.get(obj.pk, obj) for obj in instances]
+
+    def get_bulk_update_fields(self):
+        fields = getattr(self.child.Meta, "bulk_update_fields", None)
+        if fields is not None:
+            return set(fields)
+        opts = self.child.Meta.model._meta
+        concrete_names = {f.name for f in opts.concrete_fields if not f.primary_key}
+        return concrete_names | {f.name for f in opts.many_to_many}
+
+    def bulk_update(self, instances, all_validated_data):
+        model = self.child.Meta.model
+        opts = model._meta
+        concrete_names = {f.name for f in opts.concrete_fields if not f.primary_key}
+        m2m_names = {f.name for f in opts.many_to_many}
+        auto_now_names = [f.name for f in opts.concrete_fields if getattr(f, "auto_now", False)]
+
+        pre_bulk_update.send(model, instances=instances)
+        groups = defaultdict(list)
+        m2m_values = defaultdict(dict)
+        changed_fields = set()
+        now = timezone.now()
+        for obj, attrs in zip(instances, all_validated_data):
+            fields = set()
+            for attr, value in attrs.items():
+                if attr in m2m_names:
+                    m2m_values[attr][obj] = value
+                    continue
+                setattr(obj, attr, value)
+                if attr in concrete_names:
+                    fields.add(attr)
+            if not fields:
+                continue
+            for name in auto_now_names:
+                setattr(obj, name, now)
+                fields.add(name)
+            changed_fields |= fields
+            groups[frozenset(fields)].append(obj)
+
+        with transaction.atomic():
+            for fields, objs in groups.items():
+                # 不用 _default_manager, 账号的 VaultManagerMixin.bulk_update 会逐个发送 post_save
+                model._base_manager.bulk_update(objs, list(fields), batch_size=500)
+            for name, values in m2m_values.items():
+                self.bulk_set_m2m(model, name, values)
+
+        post_bulk_update.send(
+            model, instances=instances,
+            fields=changed_fields, m2m_fields=set(m2m_values)
+        )
+        return instances
+
+    @staticmethod
+    def send_m2m_changed(through, related_model, changes, action):
+        """ changes: {obj: pk_set}, 和 RelatedManager.add/remove 一样逐个对象发送, 节点、授权的缓存依赖它 """
+        for obj, pk_set in changes.items():
+            m2m_changed.send(
+                sender=through, action=action, instance=obj, reverse=False,
+                model=related_model, pk_set=set(pk_set), using=obj._state.db
+            )
+
+    @classmethod
+    def bulk_set_m2m(cls, model, name, values):
+        """ values: {obj: related objects or pks}, 一次查出现有的关联, 只增删有变化的 """
+        field = model._meta.get_field(name)
+        through = field.remote_field.through
+        if not through._meta.auto_created:
+            for obj, related in values.items():
+                getattr(obj, name).set(related)
+            return
+
+        source = through._meta.get_field(field.m2m_field_name()).attname
+        target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+        rows = through.objects.filter(**{f"{source}__in": [obj.pk for obj in values]}) \
+            .values_list("pk", source, target)
+        existed = defaultdict(dict)
+        for pk, source_id, target_id in rows:
+            existed[source_id][target_id] = pk
+
+        related_model = field.related_model
+        to_python = related_model._meta.pk.to_python
+        added, removed = {}, {}
+        to_add, to_remove = [], []
+        for obj, related in values.items():
+            current = existed.get(obj.pk, {})
+            wanted = {to_python(getattr(i, "pk", i)) for i in related}
+            removed_ids = [target_id for target_id in current if target_id not in wanted]
+            added_ids = [target_id for target_id in wanted if target_id not in current]
+            if removed_ids:
+                removed[obj] = removed_ids
+                to_remove.extend(current[target_id] for target_id in removed_ids)
+            if added_ids:
+                added[obj] = added_ids
+                to_add.extend(through(**{source: obj.pk, target: target_id}) for target_id in added_ids)
+
+        if to_remove:
+            cls.send_m2m_changed(through, related_model, removed, PRE_REMOVE)
+            through.objects.filter(pk__in=to_remove).delete()
+            cls.send_m2m_changed(through, related_model, removed, POST_REMOVE)
+        if to_add:
+            cls.send_m2m_changed(through, related_model, added, PRE_ADD)
+            through.objects.bulk_create(to_add, ignore_conflicts=True)
+            cls.send_m2m_changed(through, related_model, added, POST_ADD)
+
     def create(self, validated_data):
         ModelClass = self.child.Meta.model
         use_model_bulk_create = getattr(self.child.Meta, "use_model_bulk_create", False)
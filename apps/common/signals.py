@@ -4,3 +4,9 @@
 from django.dispatch import Signal
 
 django_ready = Signal()
+# 批量更新时代替逐个的 pre_save / post_save, 参数: instances (, fields, m2m_fields, user)
+# user 为操作的用户, 没有时使用当前 request 的用户
+pre_bulk_update = Signal()
+post_bulk_update = Signal()
+# bulk_create 不触发 post_save, 需要时手动发送, 参数: instances
+post_bulk_create = Signal()
@@ -1,4 +1,15 @@
-from django.test import TestCase
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
 
 # Create your tests here.
 
@@ -13,3 +24,423 @@ def test_signer_len():
         results[i] = (len(encs)/len(s))
     results = sorted(results.items(), key=lambda x: x[1], reverse=True)
     print(results)
+
+
+class SuperuserAPITestCase(APITestCase):
+    def setUp(self):
+        from orgs.models import Organization
+        from orgs.utils import set_current_org
+        from users.models import User
+
+        self.org = Organization.default()
+        set_current_org(self.org)
+        self.user = User.objects.create(
+            username='admin-' + random_string(6), name='admin',
+            email=random_string(6) + '@example.com'
+        )
+        self.user.is_superuser = True
+        self.client.force_authenticate(user=self.user)
+        self.client.credentials(HTTP_X_JMS_ORG=self.org.id)
+
+    @staticmethod
+    def create_hosts(amount):
+        from assets.models import Host, Platform
+
+        platform = Platform.objects.get(name='Linux')
+        hosts = []
+        for i in range(amount):
+            name = 'host-' + random_string(8)
+            host = Host.objects.create(name=name, address='127.0.0.1', platform=platform)
+            hosts.append(host)
+        return hosts
+
+
+class ListQueryCountTests(SuperuserAPITestCase):
+    """
+    列表分页只查询一次当前页, 查询数不随每页数量增长
+    """
+
+    def count_list_queries(self, url, limit):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return len(ctx.captured_queries)
+
+    def assert_constant_queries(self, url, create_objs, size=5):
+        create_objs(size)
+        # 第一次请求会预热缓存
+        self.count_list_queries(url, size)
+        small = self.count_list_queries(url, size)
+        create_objs(size)
+        large = self.count_list_queries(url, size * 2)
+        self.assertEqual(small, large)
+
+    def test_asset_list(self):
+        url = reverse('api-assets:asset-list')
+        self.assert_constant_queries(url, self.create_hosts)
+
+    def test_account_list(self):
+        from accounts.models import Account
+
+        def create_accounts(amount):
+            for host in self.create_hosts(amount):
+                Account.objects.create(asset=host, username='root', name='root')
+
+        url = reverse('api-accounts:account-list')
+        self.assert_constant_queries(url, create_accounts)
+
+    def test_user_list(self):
+        from rbac.models import Role
+        from users.models import User
+
+        def create_users(amount):
+            for i in range(amount):
+                name = random_string(8)
+                user = User.objects.create(username=name, name=name, email=name + '@example.com')
+                user.org_roles.add(Role.BuiltinRole.org_user.get_role())
+
+        url = reverse('api-users:user-list')
+        self.assert_constant_queries(url, create_users)
+
+    def test_asset_permission_list(self):
+        from perms.models import AssetPermission
+
+        def create_perms(amount):
+            for i in range(amount):
+                perm = AssetPermission.objects.create(name='perm-' + random_string(8))
+                perm.users.add(self.user)
+                perm.assets.add(*self.create_hosts(1))
+
+        url = reverse('api-perms:asset-permission-list')
+        self.assert_constant_queries(url, create_perms)
+
+    def test_page_selected_once(self):
+        from perms.models import AssetPermission
+
+        for i in range(3):
+            AssetPermission.objects.create(name='perm-' + random_string(8)).users.add(self.user)
+        url = reverse('api-perms:asset-permission-list')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'limit': 3})
+        self.assertEqual(len(response.data['results']), 3)
+
+        # 主表只有 count 和带 annotate 的当前页两次查询
+        table = 'FROM {}'.format(connection.ops.quote_name(AssetPermission._meta.db_table))
+        queries = [q['sql'] for q in ctx.captured_queries if table in q['sql']]
+        self.assertEqual(len([q for q in queries if 'COUNT(' not in q.upper()]), 1)
+
+
+class BulkUpdateTests(SuperuserAPITestCase):
+    """
+    批量修改走 bulk_update, 多对多仍然发送 m2m_changed, 修改其他字段时逐个 update
+    """
+
+    def setUp(self):
+        from assets.models import Node
+
+        super().setUp()
+        root = Node.org_root()
+        self.node1 = root.create_child(value='bulk-' + random_string(6))
+        self.node2 = root.create_child(value='bulk-' + random_string(6))
+        self.url = reverse('api-assets:host-list')
+
+    def patch_hosts(self, hosts, **data):
+        # 大写的 uuid 也能找到对象
+        items = [{'id': str(host.id).upper(), **data} for host in hosts]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(self.url, items, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return len(ctx.captured_queries)
+
+    def test_bulk_update_fields(self):
+        from assets.models import Asset
+
+        hosts = self.create_hosts(3)
+        self.patch_hosts(hosts, is_active=False, comment='bulk')
+        for host in Asset.objects.filter(id__in=[h.id for h in hosts]):
+            self.assertFalse(host.is_active)
+            self.assertEqual(host.comment, 'bulk')
+
+    def test_bulk_update_queries_constant(self):
+        self.patch_hosts(self.create_hosts(2), is_active=False)
+        small = self.patch_hosts(self.create_hosts(2), is_active=False)
+        large = self.patch_hosts(self.create_hosts(6), is_active=False)
+        self.assertEqual(small, large)
+
+    def test_bulk_set_m2m_send_m2m_changed(self):
+        from django.db.models.signals import m2m_changed
+        from assets.models import Asset
+
+        hosts = self.create_hosts(2)
+        for host in hosts:
+            host.nodes.set([self.node1])
+
+        received = []
+
+        def receiver(sender, action, instance, pk_set, **kwargs):
+            received.append((action, str(instance.id), set(pk_set)))
+
+        m2m_changed.connect(receiver, sender=Asset.nodes.through)
+        try:
+            self.patch_hosts(hosts, nodes=[str(self.node2.id)])
+        finally:
+            m2m_changed.disconnect(receiver, sender=Asset.nodes.through)
+
+        for host in hosts:
+            self.assertEqual(list(host.nodes.all()), [self.node2])
+            for action, pk in [('post_remove', self.node1.id), ('post_add', self.node2.id)]:
+                self.assertIn((action, str(host.id), {pk}), received)
+
+    def test_not_bulk_fields_use_row_update(self):
+        from assets.models import Host
+
+        hosts = self.create_hosts(2)
+        received = []
+
+        def receiver(sender, instance, created, **kwargs):
+            received.append(instance.id)
+
+        post_save.connect(receiver, sender=Host)
+        try:
+            self.patch_hosts(hosts[:1], is_active=False)
+            self.assertEqual(received, [])
+            self.patch_hosts(hosts, is_active=False, protocols=[{'name': 'ssh', 'port': 2222}])
+        finally:
+            post_save.disconnect(receiver, sender=Host)
+        self.assertEqual(sorted(received), sorted(h.id for h in hosts))
+
+    def test_account_bulk_update_save_metadata_once(self):
+        from accounts.models import Account
+
+        accounts = [
+            Account.objects.create(asset=host, username='root', name='root')
+            for host in self.create_hosts(3)
+        ]
+        received = []
+
+        def receiver(sender, instance, **kwargs):
+            received.append(instance.id)
+
+        url = reverse('api-accounts:account-list')
+        items = [{'id': str(account.id), 'privileged': True, 'comment': 'bulk'} for account in accounts]
+        post_save.connect(receiver, sender=Account)
+        try:
+            with mock.patch('accounts.signal_handlers.vault_client') as vault_client:
+                vault_client.metadata_fields = ['privileged']
+                response = self.client.patch(url, items, format='json')
+        finally:
+            post_save.disconnect(receiver, sender=Account)
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(received, [])
+        vault_client.save_metadata_many.assert_called_once()
+        instances = vault_client.save_metadata_many.call_args.args[0]
+        self.assertEqual(sorted(i.id for i in instances), sorted(a.id for a in accounts))
+        for account in Account.objects.filter(id__in=[a.id for a in accounts]):
+            self.assertTrue(account.privileged)
+            self.assertEqual(account.comment, 'bulk')
+
+
+@override_settings(
+    DB_POOL_SIZE=4, DB_POOL_TIMEOUT=0.1, DB_POOL_RECYCLE=3600,
+    DB_POOL_HEALTH_CHECK_INTERVAL=0,
+)
+class ConnectionPoolTests(SimpleTestCase):
+    def get_pool(self):
+        from common.db.pool import ConnectionPool
+        return ConnectionPool('test')
+
+    @staticmethod
+    def create():
+        return sqlite3.connect(':memory:', check_same_thread=False)
+
+    def test_reuse(self):
+        pool = self.get_pool()
+        conn = pool.checkout(self.create)
+        pool.checkin(conn)
+        self.assertIs(pool.checkout(self.create), conn)
+        metrics = pool.get_metrics()
+        self.assertEqual((metrics['created'], metrics['reused'], metrics['in_use']), (1, 1, 1))
+
+    def test_unhealthy_connection_is_replaced(self):
+        pool = self.get_pool()
+        conn = pool.checkout(self.create)
+        pool.checkin(conn)
+        conn.close()
+        self.assertIsNot(pool.checkout(self.create), conn)
+        self.assertEqual(pool.get_metrics()['health_check_failures'], 1)
+
+    def test_overflow_when_exhausted(self):
+        pool = self.get_pool()
+
+        def use(i):
+            conn = pool.checkout(self.create)
+            pool.checkin(conn)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(use, range(200)))
+        conns = [pool.checkout(self.create) for __ in range(5)]
+        metrics = pool.get_metrics()
+        self.assertEqual(metrics['overflow'], 1)
+        self.assertGreaterEqual(metrics['waits'], 1)
+        for conn in conns:
+            pool.checkin(conn)
+        self.assertLessEqual(pool.get_metrics()['idle'], 4)
+
+    def test_concurrent_conn_info_consistent(self):
+        pool = self.get_pool()
+
+        def use(i):
+            conn = pool.checkout(self.create)
+            pool.checkin(conn, reusable=i % 3 != 0)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(use, range(500)))
+        metrics = pool.get_metrics()
+        # 所有连接都已归还, 记录的连接数和创建, 关闭的数量一致
+        self.assertEqual(metrics['in_use'], 0)
+        self.assertEqual(metrics['created'] - metrics['closed'], metrics['idle'])
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_FLUSH_INTERVAL=3600)
+class MetricsRegistryTests(SimpleTestCase):
+    def setUp(self):
+        from common.metrics import MetricsRegistry
+        from common.utils.connection import get_redis_client
+
+        self.prefix = 'test:metrics:{}'.format(uuid.uuid4().hex)
+        self.client = get_redis_client()
+        self.registries = {}
+        for process_id in ('a', 'b'):
+            registry = MetricsRegistry()
+            registry.key_prefix = self.prefix + ':'
+            registry.gauge_key_prefix = self.prefix + ':gauges:'
+            registry.gauge_processes_key = self.prefix + ':gauges'
+            registry.define('test_connections', 'gauge', 'Connections')
+            registry.define('test_requests_total', 'counter', 'Requests')
+            registry.heartbeat_pid = registry.pid
+            self.registries[process_id] = registry
+        patcher = mock.patch('common.metrics.MetricsRegistry.process_id', new_callable=mock.PropertyMock)
+        self.process_id = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def run_in(self, process_id, func, *args, **kwargs):
+        self.process_id.return_value = process_id
+        return func(*args, **kwargs)
+
+    def collect(self):
+        lines = self.run_in('a', self.registries['a'].collect)
+        return [line for line in lines if not line.startswith('#')]
+
+    def test_gauge_sum_of_live_processes(self):
+        a, b = self.registries['a'], self.registries['b']
+        self.run_in('a', a.inc, 'test_connections', 2, path='/ws')
+        self.run_in('b', b.inc, 'test_connections', 3, path='/ws')
+        self.run_in('b', b.flush)
+        self.assertEqual(self.collect(), ['test_connections{path="/ws"} 5'])
+        self.assertGreater(self.client.ttl(b.gauge_key_prefix + 'b'), 0)
+
+        # 进程 b 崩溃, 不再刷新, 过期后不再计入
+        expired = time.time() - b.gauge_ttl - 1
+        self.client.zadd(b.gauge_processes_key, {'b': expired})
+        self.assertEqual(self.collect(), ['test_connections{path="/ws"} 2'])
+
+    def test_gauge_dec(self):
+        a = self.registries['a']
+        self.run_in('a', a.inc, 'test_connections', path='/ws')
+        self.run_in('a', a.dec, 'test_connections', path='/ws')
+        self.assertEqual(self.collect(), ['test_connections{path="/ws"} 0'])
+
+    def test_shutdown_flush_counters_and_clean_gauges(self):
+        b = self.registries['b']
+        self.run_in('b', b.inc, 'test_connections', path='/ws')
+        self.run_in('b', b.flush)
+        self.run_in('b', b.inc, 'test_requests_total', 4, view='home')
+        self.run_in('b', b.shutdown)
+
+        self.assertEqual(self.collect(), ['test_requests_total{view="home"} 4'])
+        self.assertFalse(self.client.exists(b.gauge_key_prefix + 'b'))
+
+    def test_keep_counters_when_flush_failed(self):
+        a = self.registries['a']
+        self.run_in('a', a.inc, 'test_requests_total', view='home')
+        with mock.patch('common.metrics.get_redis_client', side_effect=ConnectionError):
+            self.run_in('a', a.flush)
+        self.assertEqual(self.collect(), ['test_requests_total{view="home"} 1'])
+
+
+class CacheNamespaceTests(SimpleTestCase):
+    def setUp(self):
+        from common.cache import CacheNamespace
+        from common.utils.connection import get_redis_client
+
+        self.namespace = CacheNamespace('test:{}'.format(uuid.uuid4().hex), timeout=60)
+        self.client = get_redis_client()
+
+    def tearDown(self):
+        from django.core.cache import cache
+
+        keys = list(self.client.scan_iter(match='*{}*'.format(self.namespace.name)))
+        if keys:
+            self.client.delete(*keys)
+        cache.delete_many(self.namespace.get_generation_keys(['a', 'b']))
+
+    def test_expire_scope(self):
+        self.namespace.set('k', 1, scope='a')
+        self.namespace.set('k', 2, scope='b')
+        self.namespace.expire(scope='a')
+        self.assertIsNone(self.namespace.get('k', scope='a'))
+        self.assertEqual(self.namespace.get_many('k', ['a', 'b']), {'b': 2})
+
+        self.namespace.expire()
+        self.assertEqual(self.namespace.get_many('k', ['a', 'b']), {})
+
+    def test_get_in_one_round_trip(self):
+        from django.core.cache import cache
+
+        self.namespace.set('k', 1, scope='a')
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many, \
+                mock.patch.object(cache, 'get', wraps=cache.get) as get:
+            self.assertEqual(self.namespace.get('k', scope='a'), 1)
+            self.assertEqual(self.namespace.get_many('k', ['a', 'b']), {'a': 1})
+        self.assertEqual(get_many.call_count, 2)
+        get.assert_not_called()
+
+    def test_generation_key_ttl(self):
+        from django.core.cache import cache
+
+        self.namespace.expire_many(['a', 'b'])
+        for scope in ('a', 'b'):
+            ttl = self.client.ttl(cache.make_key(self.namespace.get_generation_key(scope)))
+            self.assertGreater(ttl, self.namespace.timeout)
+            self.assertLessEqual(ttl, self.namespace.generation_timeout)
+
+        # 版本号过期重建后不会回到旧的版本号
+        self.namespace.set('k', 1, scope='a')
+        cache.delete(self.namespace.get_generation_key('a'))
+        self.assertIsNone(self.namespace.get('k', scope='a'))
+        self.assertGreater(self.namespace.expire(scope='a'), 1)
+
+    def test_get_or_set_expire_during_compute(self):
+        def compute():
+            # 计算期间其他进程让缓存失效, 旧的值不能保存到新的版本号下
+            self.namespace.expire(scope='a')
+            return 'stale'
+
+        self.assertEqual(self.namespace.get_or_set('k', compute, scope='a'), 'stale')
+        self.assertIsNone(self.namespace.get('k', scope='a'))
+        self.assertEqual(self.namespace.get_or_set('k', lambda: 'fresh', scope='a'), 'fresh')
+        self.assertEqual(self.namespace.get('k', scope='a'), 'fresh')
+
+    def test_timeout_not_longer_than_namespace(self):
+        from django.core.cache import cache
+
+        with mock.patch.object(cache, 'set') as cache_set:
+            self.namespace.set('k', 1, timeout=3600)
+        self.assertEqual(cache_set.call_args.args[2], self.namespace.timeout)
@@ -0,0 +1,74 @@
+import time
+import uuid
+
+from common.utils.connection import get_redis_client
+
+__all__ = ['SlidingWindowCounter']
+
+# KEYS: 计数的 sorted set, 一个维度一个 key, member 为每次请求的随机值, score 为时间 (毫秒)
+# ARGV: now, member, max_entries, 每个 key 的窗口大小 (毫秒)...
+# 返回每个 key 在窗口内的计数
+INCR_SCRIPT = """
+local now = tonumber(ARGV[1])
+local member = ARGV[2]
+local max_entries = tonumber(ARGV[3])
+local counts = {}
+for i, key in ipairs(KEYS) do
+    local window = tonumber(ARGV[3 + i])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    redis.call('ZADD', key, now, member)
+    local count = redis.call('ZCARD', key)
+    if count > max_entries then
+        redis.call('ZREMRANGEBYRANK', key, 0, count - max_entries - 1)
+        count = max_entries
+    end
+    redis.call('PEXPIRE', key, window)
+    counts[i] = count
+end
+return counts
+"""
+
+
+class SlidingWindowCounter:
+    """
+    Redis 滑动窗口计数, 计数和过期在一个 Lua 脚本中完成, 并发时不会丢失计数
+
+    一次可以给多个维度 (如用户名, ip, 用户名 + ip) 计数, 每个维度的窗口可以不同,
+    每个 key 最多保留 max_entries 条记录, 避免被攻击时占用过多内存
+    """
+    max_entries = 10000
+    _incr_script = None
+
+    def __init__(self):
+        self.redis = get_redis_client()
+
+    @classmethod
+    def get_incr_script(cls, redis):
+        if cls._incr_script is None:
+            cls._incr_script = redis.register_script(INCR_SCRIPT)
+        return cls._incr_script
+
+    @staticmethod
+    def now_ms():
+        return int(time.time() * 1000)
+
+    def incr(self, windows):
+        """
+        :param windows: {key: 窗口大小 (秒)}
+        :return: {key: 窗口内的计数}
+        """
+        keys = list(windows)
+        if not keys:
+            return {}
+        args = [self.now_ms(), uuid.uuid4().hex, self.max_entries]
+        args += [int(windows[key] * 1000) for key in keys]
+        counts = self.get_incr_script(self.redis)(keys=keys, args=args)
+        return dict(zip(keys, [int(c) for c in counts]))
+
+    def count(self, key, window):
+        return self.redis.zcount(key, '({}'.format(self.now_ms() - int(window * 1000)), '+inf')
+
+    def reset(self, *keys):
+        keys = [key for key in keys if key]
+        if keys:
+            self.redis.delete(*keys)
@@ -266,9 +266,9 @@ class DatesLoginMetricMixin:
     def command_statistics(self):
         def _count_pair(_tp, _qs):
             if _tp == CommandStorageType.es:
-                total = _qs.count(limit_to_max_result_window=False)
-                danger = _qs.filter(risk_level=RiskLevelChoices.reject) \
-                    .count(limit_to_max_result_window=False)
+                # 一次聚合查询同时得到总数和各风险等级的数量
+                total, risk_levels = _qs.count_by('risk_level')
+                danger = risk_levels.get(str(RiskLevelChoices.reject.value), 0)
                 return total, danger
 
             agg = _qs.aggregate(
@@ -1,14 +1,20 @@
 import time
 
+from django.conf import settings
 from django.core.cache import cache
 from django.http.response import HttpResponse
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from common.metrics import metrics
+from common.utils import get_logger
+from terminal.backends.command.ingest import CommandIngestPipeline
 from terminal.utils import ComponentsPrometheusMetricsUtil
 from users.models import User
 
+logger = get_logger(__name__)
+
 
 class HealthApiMixin(APIView):
     pass
@@ -62,7 +68,45 @@ class HealthCheckView(HealthApiMixin):
 class PrometheusMetricsApi(HealthApiMixin):
     permission_classes = (AllowAny,)
 
+    @staticmethod
+    def get_celery_queue_metrics():
+        from ops.celery import app
+        samples = []
+        with app.connection_for_read() as conn:
+            for queue in app.conf.get('CELERY_QUEUES') or []:
+                try:
+                    __, size, __ = conn.default_channel.queue_declare(queue=queue.name, passive=True)
+                except Exception as e:
+                    logger.error(f'Get celery queue {queue.name} size error: {e}')
+                    continue
+                samples.append(({'queue': queue.name}, size))
+        return metrics.format_gauge(
+            'jumpserver_celery_queue_length', 'Messages waiting in celery queues', samples
+        )
+
+    @staticmethod
+    def get_command_ingest_metrics():
+        if not CommandIngestPipeline.is_enabled():
+            return []
+        lines = []
+        data = CommandIngestPipeline().get_metrics()
+        for k, v in data.items():
+            name = f'jumpserver_command_ingest_{k}'
+            lines.extend(metrics.format_gauge(name, f'Command ingest {k}', [({}, v)]))
+        return lines
+
+    def get_internal_metrics_text(self):
+        lines = metrics.collect()
+        for method in (self.get_celery_queue_metrics, self.get_command_ingest_metrics):
+            try:
+                lines.extend(method())
+            except Exception as e:
+                logger.error(f'Collect metrics error: {e}')
+        return '\n'.join(lines)
+
     def get(self, request, *args, **kwargs):
         util = ComponentsPrometheusMetricsUtil()
         metrics_text = util.get_prometheus_metrics_text()
+        if settings.METRICS_ENABLED:
+            metrics_text += '\n' + self.get_internal_metrics_text() + '\n'
         return HttpResponse(metrics_text, content_type='text/plain; version=0.0.4; charset=utf-8')
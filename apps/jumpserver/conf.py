@@ -196,6 +196,16 @@ class Config(dict):
         'DB_USER': 'root',
         'DB_PASSWORD': '',
         'DB_USE_SSL': False,
+        # 进程内的数据库连接池, 只支持 mysql 和 postgresql
+        'DB_POOL_ENABLED': False,
+        'DB_POOL_SIZE': 20,
+        'DB_POOL_TIMEOUT': 3,
+        'DB_POOL_RECYCLE': 3600,
+        'DB_POOL_HEALTH_CHECK_INTERVAL': 30,
+        'DB_CONN_MAX_AGE': 0,
+        # 导出 JumpServer 自身的性能指标到 /api/v1/prometheus/metrics/
+        'METRICS_ENABLED': False,
+        'METRICS_FLUSH_INTERVAL': 5,
         'REDIS_HOST': '127.0.0.1',
         'REDIS_PORT': 6379,
         'REDIS_PASSWORD': '',
@@ -258,10 +268,14 @@ class Config(dict):
 
         # 临时密码
         'AUTH_TEMP_TOKEN': False,
+        # API 签名, Private Token 认证凭证的缓存时间
+        'AUTH_CREDENTIAL_CACHE_TTL': 60,
 
         # Vault
         'VAULT_ENABLED': False,
         'VAULT_BACKEND': 'local',
+        # 进程内缓存从 vault 读取的 secret 的时间 (秒), 0 不缓存
+        'VAULT_SECRET_CACHE_TTL': 0,
 
         'VAULT_HCP_HOST': '',
         'VAULT_HCP_TOKEN': '',
@@ -568,6 +582,12 @@ class Config(dict):
         'TERMINAL_SESSION_KEEP_DURATION': 200,
         'TERMINAL_HOST_KEY': '',
         'TERMINAL_COMMAND_STORAGE': {},
+        # 组件上传的命令先写入 Redis, 后台批量写入命令存储
+        'COMMAND_INGEST_ASYNC_ENABLED': False,
+        'COMMAND_INGEST_BATCH_SIZE': 200,
+        'COMMAND_INGEST_FLUSH_INTERVAL': 10,
+        'COMMAND_INGEST_MAX_BATCHES': 50,
+        'COMMAND_INGEST_MAX_LAG': 100000,
         # 未来废弃(目前迁移会用)
         'TERMINAL_RDP_ADDR': '',
         # 保留(Luna还在用)
@@ -627,6 +647,8 @@ class Config(dict):
         # 用户登录限制的规则
         'SECURITY_LOGIN_LIMIT_COUNT': 7,
         'SECURITY_LOGIN_LIMIT_TIME': 30,
+        # 同一用户名所有 ip 的失败次数, 0 为不限制
+        'SECURITY_LOGIN_USER_LIMIT_COUNT': 0,
         # 登录IP限制的规则
         'SECURITY_LOGIN_IP_BLACK_LIST': [],
         'SECURITY_LOGIN_IP_WHITE_LIST': [],
@@ -645,6 +667,8 @@ class Config(dict):
 
         'PERM_EXPIRED_CHECK_PERIODIC': 60 * 60,
         'PERM_TREE_REGEN_INTERVAL': 1,
+        # 用户访问资产的授权决策 (协议, 账号, 动作) 缓存时间
+        'PERM_ACCESS_DECISION_CACHE_TTL': 600,
         'FLOWER_URL': "127.0.0.1:5555",
         'LANGUAGE_CODE': 'en',
         'TIME_ZONE': 'Asia/Shanghai',
@@ -673,6 +697,12 @@ class Config(dict):
         'JOB_EXECUTION_KEEP_DAYS': 180,
         'PASSWORD_CHANGE_LOG_KEEP_DAYS': 999,
         'ACCOUNT_CHANGE_SECRET_RECORD_KEEP_DAYS': 180,
+        # 过期记录每批删除的数量, 每秒最多删除的行数 (0 不限速)
+        'LOG_CLEAN_BATCH_SIZE': 1000,
+        'LOG_CLEAN_ROWS_PER_SECOND': 0,
+        # 命令和日志表按月分区, 需要先执行 partition_log_tables --convert
+        'LOG_TABLE_PARTITION_ENABLED': False,
+        'LOG_TABLE_PARTITION_MONTHS_AHEAD': 3,
 
         'TICKETS_ENABLED': True,
         'TICKETS_DIRECT_APPROVE': False,
@@ -108,6 +108,37 @@ class SQLCountMiddleware:
         return response
 
 
+class MetricsMiddleware:
+    """ 记录每个 view 的请求耗时和 SQL 查询数 """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        from django.db import connection
+        from common.metrics import metrics
+
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        start = time.time()
+        with connection.execute_wrapper(count_queries):
+            response = self.get_response(request)
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        metrics.observe(
+            'jumpserver_http_request_duration_seconds', time.time() - start,
+            view=view, method=request.method
+        )
+        metrics.observe('jumpserver_http_request_db_queries', queries[0], view=view)
+        return response
+
+
 class StartMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -5,8 +5,12 @@ from rest_framework.pagination import LimitOffsetPagination
 
 class MaxLimitOffsetPagination(LimitOffsetPagination):
     max_limit = settings.MAX_PAGE_SIZE
+    count_queryset = None
 
     def get_count(self, queryset):
+        # view 可以提供不带 annotate 的 queryset 用于 count, 避免 count 时 group by
+        if self.count_queryset is not None:
+            queryset = self.count_queryset
         try:
             return queryset.values_list('id').order_by().count()
         except (AttributeError, TypeError, FieldError):
@@ -17,5 +21,6 @@ class MaxLimitOffsetPagination(LimitOffsetPagination):
             self.max_limit = view.page_max_limit
         if view and hasattr(view, 'page_default_limit'):
             self.default_limit = view.page_default_limit
+        self.count_queryset = getattr(view, 'paginate_count_queryset', None)
 
         return super().paginate_queryset(queryset, request, view)
@@ -1,3 +1,5 @@
+import re
+
 from channels.auth import AuthMiddlewareStack
 from channels.db import database_sync_to_async
 from channels.routing import ProtocolTypeRouter, URLRouter
@@ -9,6 +11,7 @@ from authentication.backends.drf import (
     SignatureAuthentication,
     AccessTokenAuthentication
 )
+from common.metrics import metrics
 from notifications.urls.ws_urls import urlpatterns as notifications_urlpatterns
 from ops.urls.ws_urls import urlpatterns as ops_urlpatterns
 from settings.urls.ws_urls import urlpatterns as setting_urlpatterns
@@ -61,14 +64,41 @@ class WsSignatureAuthMiddleware:
         return await self.app(scope, receive, send)
 
 
+class WsMetricsMiddleware:
+    """ 统计当前打开的 websocket 连接数 """
+    id_pattern = re.compile(r'/[0-9a-fA-F-]{8,}(?=/|$)')
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = self.id_pattern.sub('/:id', scope.get('path', ''))
+        accepted = False
+
+        async def send_wrapper(message):
+            nonlocal accepted
+            if message['type'] == 'websocket.accept' and not accepted:
+                accepted = True
+                metrics.inc('jumpserver_websocket_connections', path=path)
+            await send(message)
+
+        try:
+            return await self.app(scope, receive, send_wrapper)
+        finally:
+            if accepted:
+                metrics.dec('jumpserver_websocket_connections', path=path)
+
+
 application = ProtocolTypeRouter({
     # Django's ASGI application to handle traditional HTTP requests
     "http": get_asgi_application(),
 
     # WebSocket chat handler
-    "websocket": WsSignatureAuthMiddleware(
-        AuthMiddlewareStack(
-            URLRouter(urlpatterns)
+    "websocket": WsMetricsMiddleware(
+        WsSignatureAuthMiddleware(
+            AuthMiddlewareStack(
+                URLRouter(urlpatterns)
+            )
         )
     ),
 })
@@ -235,10 +235,12 @@ FIDO_SERVER_NAME = CONFIG.FIDO_SERVER_NAME
 KEY_ATTACHMENT = 2  # 0 any, 1 platform, 2 cross-platform 3 none
 # 临时 token
 AUTH_TEMP_TOKEN = CONFIG.AUTH_TEMP_TOKEN
+AUTH_CREDENTIAL_CACHE_TTL = CONFIG.AUTH_CREDENTIAL_CACHE_TTL
 
 # Vault
 VAULT_ENABLED = CONFIG.VAULT_ENABLED
 VAULT_BACKEND = CONFIG.VAULT_BACKEND
+VAULT_SECRET_CACHE_TTL = CONFIG.VAULT_SECRET_CACHE_TTL
 
 VAULT_HCP_HOST = CONFIG.VAULT_HCP_HOST
 VAULT_HCP_TOKEN = CONFIG.VAULT_HCP_TOKEN
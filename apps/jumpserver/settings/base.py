@@ -161,6 +161,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'jumpserver.middleware.StartMiddleware',
+    'jumpserver.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -246,10 +247,20 @@ MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
 # Database
 # https://docs.djangoproject.com/en/1.10/ref/settings/#databases
 
+METRICS_ENABLED = CONFIG.METRICS_ENABLED
+METRICS_FLUSH_INTERVAL = CONFIG.METRICS_FLUSH_INTERVAL
+
 DB_OPTIONS = {}
 DB_ENGINE = CONFIG.DB_ENGINE.lower()
+DB_POOL_ENABLED = CONFIG.DB_POOL_ENABLED
+DB_POOL_SIZE = CONFIG.DB_POOL_SIZE
+DB_POOL_TIMEOUT = CONFIG.DB_POOL_TIMEOUT
+DB_POOL_RECYCLE = CONFIG.DB_POOL_RECYCLE
+DB_POOL_HEALTH_CHECK_INTERVAL = CONFIG.DB_POOL_HEALTH_CHECK_INTERVAL
 if DB_ENGINE == 'vastbase':
     DB_BACKEND = 'django_vastbase_backend'
+elif DB_POOL_ENABLED and DB_ENGINE in ('mysql', 'postgresql'):
+    DB_BACKEND = f'common.db.backends.{DB_ENGINE}'
 else:
     DB_BACKEND = f'django.db.backends.{DB_ENGINE}'
 DATABASES = {
@@ -261,6 +272,8 @@ DATABASES = {
         'USER': CONFIG.DB_USER,
         'PASSWORD': CONFIG.DB_PASSWORD,
         'ATOMIC_REQUESTS': True,
+        'CONN_MAX_AGE': CONFIG.DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
         'OPTIONS': DB_OPTIONS
     }
 }
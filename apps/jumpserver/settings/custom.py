@@ -12,6 +12,11 @@ DEFAULT_TERMINAL_COMMAND_STORAGE = {
     },
 }
 TERMINAL_COMMAND_STORAGE = CONFIG.TERMINAL_COMMAND_STORAGE or {}
+COMMAND_INGEST_ASYNC_ENABLED = CONFIG.COMMAND_INGEST_ASYNC_ENABLED
+COMMAND_INGEST_BATCH_SIZE = CONFIG.COMMAND_INGEST_BATCH_SIZE
+COMMAND_INGEST_FLUSH_INTERVAL = CONFIG.COMMAND_INGEST_FLUSH_INTERVAL
+COMMAND_INGEST_MAX_BATCHES = CONFIG.COMMAND_INGEST_MAX_BATCHES
+COMMAND_INGEST_MAX_LAG = CONFIG.COMMAND_INGEST_MAX_LAG
 
 # Server 类型的录像存储
 SERVER_REPLAY_STORAGE = CONFIG.SERVER_REPLAY_STORAGE
@@ -72,6 +77,7 @@ SECURITY_CHECK_DIFFERENT_CITY_LOGIN = CONFIG.SECURITY_CHECK_DIFFERENT_CITY_LOGIN
 # 用户登录限制的规则
 SECURITY_LOGIN_LIMIT_COUNT = CONFIG.SECURITY_LOGIN_LIMIT_COUNT
 SECURITY_LOGIN_LIMIT_TIME = CONFIG.SECURITY_LOGIN_LIMIT_TIME  # Unit: minute
+SECURITY_LOGIN_USER_LIMIT_COUNT = CONFIG.SECURITY_LOGIN_USER_LIMIT_COUNT
 # 登录IP限制的规则
 SECURITY_LOGIN_IP_BLACK_LIST = CONFIG.SECURITY_LOGIN_IP_BLACK_LIST
 SECURITY_LOGIN_IP_WHITE_LIST = CONFIG.SECURITY_LOGIN_IP_WHITE_LIST
@@ -135,6 +141,10 @@ FTP_LOG_KEEP_DAYS = CONFIG.FTP_LOG_KEEP_DAYS
 CLOUD_SYNC_TASK_EXECUTION_KEEP_DAYS = CONFIG.CLOUD_SYNC_TASK_EXECUTION_KEEP_DAYS
 JOB_EXECUTION_KEEP_DAYS = CONFIG.JOB_EXECUTION_KEEP_DAYS
 ACCOUNT_CHANGE_SECRET_RECORD_KEEP_DAYS = CONFIG.ACCOUNT_CHANGE_SECRET_RECORD_KEEP_DAYS
+LOG_CLEAN_BATCH_SIZE = CONFIG.LOG_CLEAN_BATCH_SIZE
+LOG_CLEAN_ROWS_PER_SECOND = CONFIG.LOG_CLEAN_ROWS_PER_SECOND
+LOG_TABLE_PARTITION_ENABLED = CONFIG.LOG_TABLE_PARTITION_ENABLED
+LOG_TABLE_PARTITION_MONTHS_AHEAD = CONFIG.LOG_TABLE_PARTITION_MONTHS_AHEAD
 ORG_CHANGE_TO_URL = CONFIG.ORG_CHANGE_TO_URL
 WINDOWS_SKIP_ALL_MANUAL_PASSWORD = CONFIG.WINDOWS_SKIP_ALL_MANUAL_PASSWORD
 
@@ -229,6 +239,7 @@ MAX_PAGE_SIZE = CONFIG.MAX_PAGE_SIZE
 DEFAULT_PAGE_SIZE = CONFIG.DEFAULT_PAGE_SIZE
 
 PERM_TREE_REGEN_INTERVAL = CONFIG.PERM_TREE_REGEN_INTERVAL
+PERM_ACCESS_DECISION_CACHE_TTL = CONFIG.PERM_ACCESS_DECISION_CACHE_TTL
 
 # Magnus DB Port
 MAGNUS_ORACLE_PORTS = CONFIG.MAGNUS_ORACLE_PORTS
@@ -12,6 +12,7 @@ from django.utils.functional import LazyObject
 from rest_framework.utils.encoders import JSONEncoder
 
 from common.db.utils import close_old_connections, get_logger
+from common.metrics import metrics
 from common.signals import django_ready
 from common.utils.connection import RedisPubSub
 from jumpserver.utils import get_current_request
@@ -87,8 +88,12 @@ def before_task_publish(body=None, **kwargs):
     kwargs['__current_org_id'] = current_org_id
 
 
+_task_start_times = {}
+
+
 @signals.task_prerun.connect
 def on_celery_task_pre_run(task_id='', kwargs=None, **others):
+    _task_start_times[task_id] = time.time()
     count = 0
     qs = CeleryTaskExecution.objects.filter(id=task_id)
     while not qs.exists() and count < 5:
@@ -114,12 +119,19 @@ def on_celery_task_pre_run(task_id='', kwargs=None, **others):
 
 
 @signals.task_postrun.connect
-def on_celery_task_post_run(task_id='', state='', **kwargs):
+def on_celery_task_post_run(task_id='', state='', task=None, **kwargs):
     CeleryTaskExecution.objects.filter(id=task_id).update(
         state=state, date_finished=timezone.now(), is_finished=True
     )
     close_old_connections()
 
+    start = _task_start_times.pop(task_id, None)
+    if start is not None and task is not None:
+        metrics.observe(
+            'jumpserver_celery_task_duration_seconds', time.time() - start,
+            task=task.name, state=state
+        )
+
 
 @signals.after_task_publish.connect
 def task_sent_handler(headers=None, body=None, **kwargs):
@@ -1,14 +1,16 @@
 # -*- coding: utf-8 -*-
 #
-from django.db.models.signals import m2m_changed, pre_delete, pre_save, post_save
+from django.db.models.signals import m2m_changed, pre_delete, pre_save, post_save, post_delete
 from django.dispatch import receiver
 
+from accounts.models import Account
 from assets.models import Asset
 from common.const.signals import POST_ADD, POST_REMOVE, POST_CLEAR
 from common.exceptions import M2MReverseNotAllowed
+from common.signals import post_bulk_update
 from common.utils import get_logger, get_object_or_none
 from perms.models import AssetPermission
-from perms.utils import UserPermTreeExpireUtil, UserPermAssetUtil
+from perms.utils import UserPermTreeExpireUtil, UserPermAssetUtil, PermAssetDetailUtil
 from users.models import User, UserGroup
 
 logger = get_logger(__file__)
@@ -63,6 +65,9 @@ def on_asset_perm_pre_save(sender, instance, **kwargs):
 @receiver([post_save], sender=AssetPermission)
 def on_asset_perm_post_save(sender, instance, created, **kwargs):
     if not created:
+        # 账号, 协议, 动作, 有效期的修改不影响授权树, 只需要让授权决策失效
+        user_ids = AssetPermission.get_all_users_for_perms([instance.id], flat=True)
+        PermAssetDetailUtil.expire_access_decisions(user_ids=user_ids)
         return
     UserPermTreeExpireUtil().expire_perm_tree_for_perms([instance.id])
 
@@ -124,3 +129,14 @@ def on_node_asset_change(action, instance, reverse, pk_set, **kwargs):
         node_ids = pk_set
 
     UserPermTreeExpireUtil().expire_perm_tree_for_nodes_assets(node_ids, asset_ids)
+
+
+@receiver([post_save, post_delete], sender=Account)
+def on_account_changed_expire_access_decisions(sender, instance, **kwargs):
+    PermAssetDetailUtil.expire_access_decisions(asset_ids=[instance.asset_id])
+
+
+@receiver(post_bulk_update, sender=Account)
+def on_accounts_bulk_changed_expire_access_decisions(sender, instances=(), **kwargs):
+    asset_ids = {instance.asset_id for instance in instances}
+    PermAssetDetailUtil.expire_access_decisions(asset_ids=asset_ids)
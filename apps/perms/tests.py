@@ -0,0 +1,85 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import Account
+from assets.models import Host, Platform
+from common.utils import random_string
+from orgs.models import Organization
+from orgs.utils import set_current_org
+from perms.const import ActionChoices
+from perms.models import AssetPermission
+from perms.utils import PermAssetDetailUtil
+from users.models import User
+
+
+@override_settings(PERM_ACCESS_DECISION_CACHE_TTL=600)
+class AccessDecisionCacheTests(TestCase):
+    def setUp(self):
+        set_current_org(Organization.default())
+        name = random_string(8)
+        self.user = User.objects.create(username=name, name=name, email=name + '@example.com')
+        platform = Platform.objects.get(name='Linux')
+        self.asset = Host.objects.create(name='host-' + name, address='127.0.0.1', platform=platform)
+        Account.objects.create(asset=self.asset, username='root', name='root')
+        now = timezone.now()
+        self.perm = self.create_perm(now - timedelta(days=1), now + timedelta(days=1))
+
+    def tearDown(self):
+        PermAssetDetailUtil.expire_access_decisions(user_ids=[self.user.id])
+
+    def create_perm(self, date_start, date_expired):
+        perm = AssetPermission.objects.create(
+            name='perm-' + random_string(8), accounts=['@ALL'],
+            date_start=date_start, date_expired=date_expired
+        )
+        perm.users.add(self.user)
+        perm.assets.add(self.asset)
+        return perm
+
+    def get_decision(self):
+        return PermAssetDetailUtil(self.user, self.asset).access_decision
+
+    def get_decision_timeout(self):
+        cache = PermAssetDetailUtil.access_decision_cache
+        PermAssetDetailUtil.expire_access_decisions(user_ids=[self.user.id])
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            decision = self.get_decision()
+        return decision, cache_set.call_args.kwargs['timeout']
+
+    def test_cached(self):
+        decision = self.get_decision()
+        self.assertTrue(decision['accounts'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_decision(), decision)
+
+    def test_expire_on_permission_change(self):
+        decision = self.get_decision()
+        access = list(decision['accounts'].values())[0]
+        self.assertEqual(access['actions'], ActionChoices.connect)
+
+        self.perm.actions = ActionChoices.all()
+        self.perm.save()
+        access = list(self.get_decision()['accounts'].values())[0]
+        self.assertEqual(access['actions'], ActionChoices.all())
+
+    def test_timeout_capped_by_date_expired(self):
+        self.perm.date_expired = timezone.now() + timedelta(seconds=30)
+        self.perm.save()
+        __, timeout = self.get_decision_timeout()
+        self.assertLessEqual(timeout, 30)
+
+    def test_denied_timeout_capped_by_date_start(self):
+        # 授权还没有开始, 拒绝的决策在授权开始时失效
+        self.perm.delete()
+        now = timezone.now()
+        self.create_perm(now + timedelta(seconds=30), now + timedelta(days=1))
+        decision, timeout = self.get_decision_timeout()
+        self.assertEqual(decision['accounts'], {})
+        self.assertLessEqual(timeout, 30)
+
+    def test_timeout_default(self):
+        __, timeout = self.get_decision_timeout()
+        self.assertEqual(timeout, 600)
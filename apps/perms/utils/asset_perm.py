@@ -1,20 +1,30 @@
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db.models import Min
+from django.utils import timezone
 
 from accounts.const import AliasAccount
 from accounts.models import VirtualAccount
 from assets.models import Asset, MyAsset
+from common.cache import CacheNamespace
 from common.utils import lazyproperty, get_logger
 from orgs.utils import tmp_to_org, tmp_to_root_org
 from perms.const import ActionChoices
+from perms.models import AssetPermission
 from .permission import AssetPermissionUtil
 
 logger = get_logger(__name__)
 
-__all__ = ['PermAssetDetailUtil']
+__all__ = ['PermAssetDetailUtil', 'AccountAccess']
+
+AccountAccess = namedtuple('AccountAccess', ['actions', 'date_expired'])
 
 
 class PermAssetDetailUtil:
     """ 资产授权账号相关的工具 """
+    # 用户访问资产的授权决策, 用户或资产的版本号变化时失效
+    access_decision_cache = CacheNamespace('perms:asset-access', timeout=60 * 60)
 
     def __init__(self, user, asset_or_id):
         self.user = user
@@ -40,21 +50,134 @@ class PermAssetDetailUtil:
             queryset = Asset.objects.filter(id=self.asset_id)
             return queryset.get()
 
-    def validate_permission(self, account_alias, protocol):
-        with tmp_to_org(self.asset.org):
+    @staticmethod
+    def get_access_decision_scope(user_id, asset_id):
+        return f'user:{user_id}', f'asset:{asset_id}'
+
+    @classmethod
+    def expire_access_decisions(cls, user_ids=(), asset_ids=()):
+        scopes = [f'user:{i}' for i in user_ids]
+        scopes += [f'asset:{i}' for i in asset_ids]
+        cls.access_decision_cache.expire_many(scopes)
+
+    @lazyproperty
+    def access_decision(self):
+        """
+        用户访问资产的授权决策:
+        {'protocols': [...], 'accounts': {alias: {'actions': 1, 'date_expired': datetime}}}
+        """
+        scope = self.get_access_decision_scope(self.user.id, self.asset_id)
+        decision, generations = self.access_decision_cache.lookup('decision', scope=scope)
+        if decision is not None:
+            return decision
+
+        decision, date_expired = self.compute_access_decision()
+        timeout = self.get_access_decision_timeout(date_expired, self.get_next_date_start())
+        self.access_decision_cache.set(
+            'decision', decision, scope=scope, timeout=timeout, generations=generations
+        )
+        return decision
+
+    @staticmethod
+    def get_access_decision_timeout(*dates):
+        """ 最早过期的授权过期后, 或者最早开始的授权开始后, 决策就不准确了 """
+        timeout = settings.PERM_ACCESS_DECISION_CACHE_TTL
+        now = timezone.now()
+        for dt in dates:
+            if not dt:
+                continue
+            seconds = int((dt - now).total_seconds())
+            timeout = max(min(timeout, seconds), 1)
+        return timeout
+
+    def get_next_date_start(self):
+        """ 还没有开始的授权中最早的开始时间 """
+        now = timezone.now()
+        perms = AssetPermission.objects.filter(id__in=self.user_asset_perm_ids) \
+            .active().filter(date_start__gt=now, date_expired__gt=now)
+        return perms.aggregate(date_start=Min('date_start'))['date_start']
+
+    def compute_access_decision(self):
+        perms = self.user_asset_perms
+        decision = {'protocols': [], 'accounts': {}}
+        if not perms:
+            return decision, None
+
+        asset = self._asset
+        with tmp_to_org(asset.org):
             protocols = self.get_permed_protocols_for_user(only_name=True)
-            if 'all' not in protocols and protocol not in protocols:
-                return None
-            permed_accounts = self.get_permed_accounts_for_user()
-            accounts_mapper = {account.alias: account for account in permed_accounts}
-            account = accounts_mapper.get(account_alias)
-            return account
+            accounts = self.get_permed_accounts_from_perms(perms, self.user, asset)
+        decision['protocols'] = list(protocols)
+        decision['accounts'] = {
+            account.alias: {'actions': account.actions, 'date_expired': account.date_expired}
+            for account in accounts
+        }
+        date_expired = min(perm.date_expired for perm in perms)
+        return decision, date_expired
+
+    @classmethod
+    def get_access_decisions(cls, user_asset_pairs):
+        """
+        批量获取多个 (用户, 资产) 的授权决策, 一次读取缓存, 只计算没有缓存的
+        :param user_asset_pairs: [(user, asset), ...]
+        :return: {(user_id, asset_id): decision}
+        """
+        pairs = {(user.id, asset.id): (user, asset) for user, asset in user_asset_pairs}
+        scopes = {k: cls.get_access_decision_scope(*k) for k in pairs}
+        cached = cls.access_decision_cache.get_many('decision', scopes.values())
+
+        decisions = {}
+        for k, (user, asset) in pairs.items():
+            decision = cached.get(scopes[k])
+            if decision is None:
+                decision = cls(user, asset).access_decision
+            decisions[k] = decision
+        return decisions
+
+    def get_account_access(self, account_alias, protocol):
+        """
+        只从授权决策中获取账号的动作和过期时间, 不查询账号, 用于周期性的会话权限校验
+        :return: AccountAccess or None
+        """
+        return self.get_decision_account_access(self.access_decision, account_alias, protocol)
+
+    @staticmethod
+    def get_decision_account_access(decision, account_alias, protocol):
+        protocols = decision['protocols']
+        if 'all' not in protocols and protocol not in protocols:
+            return None
+        access = decision['accounts'].get(account_alias)
+        if not access:
+            return None
+        return AccountAccess(**access)
+
+    def validate_permission(self, account_alias, protocol):
+        access = self.get_account_access(account_alias, protocol)
+        if not access:
+            return None
+
+        asset = self._asset
+        if account_alias.startswith('@'):
+            account = VirtualAccount.get_special_account(account_alias, self.user, asset, from_permed=True)
+        else:
+            with tmp_to_org(asset.org):
+                account = asset.all_valid_accounts.filter(id=account_alias).first()
+        if not account:
+            return None
+        account.actions = access.actions
+        account.date_expired = access.date_expired
+        return account
 
     @lazyproperty
-    def user_asset_perms(self):
+    def user_asset_perm_ids(self):
+        """ 包含还没有生效的授权, 计算授权决策的缓存时间时也要用到 """
         perm_util = AssetPermissionUtil()
-        perms = perm_util.get_permissions_for_user_asset(self.user, self.asset_id)
-        return perms
+        perms = perm_util.get_permissions_for_user_asset(self.user, self.asset_id, with_expired=True)
+        return list(perms.values_list('id', flat=True))
+
+    @lazyproperty
+    def user_asset_perms(self):
+        return AssetPermissionUtil.get_permissions(ids=self.user_asset_perm_ids)
 
     def get_permed_accounts_for_user(self):
         """ 获取授权给用户某个资产的账号 """
@@ -44,7 +44,7 @@ class AssetPermissionUtil(object):
             return perms.values_list('id', flat=True)
         return perms
 
-    def get_permissions_for_assets(self, assets, with_node=True, flat=False):
+    def get_permissions_for_assets(self, assets, with_node=True, flat=False, with_expired=False):
         """ 获取资产的授权规则"""
         perm_ids = set()
         assets = self.convert_to_queryset_if_need(assets, Asset)
@@ -54,14 +54,14 @@ class AssetPermissionUtil(object):
         perm_ids.update(asset_perm_ids)
         if with_node:
             nodes = Asset.get_all_nodes_for_assets(assets)
-            node_perm_ids = self.get_permissions_for_nodes(nodes, flat=True)
+            node_perm_ids = self.get_permissions_for_nodes(nodes, flat=True, with_expired=with_expired)
             perm_ids.update(node_perm_ids)
-        perms = self.get_permissions(ids=perm_ids)
+        perms = self.get_permissions(ids=perm_ids, with_expired=with_expired)
         if flat:
             return perms.values_list('id', flat=True)
         return perms
 
-    def get_permissions_for_nodes(self, nodes, with_ancestor=False, flat=False):
+    def get_permissions_for_nodes(self, nodes, with_ancestor=False, flat=False, with_expired=False):
         """ 获取节点的授权规则 """
         nodes = self.convert_to_queryset_if_need(nodes, Node)
         if with_ancestor:
@@ -69,17 +69,17 @@ class AssetPermissionUtil(object):
         node_ids = nodes.values_list('id', flat=True).distinct()
         relations = AssetPermission.nodes.through.objects.filter(node_id__in=node_ids)
         perm_ids = relations.values_list('assetpermission_id', flat=True).distinct()
-        perms = self.get_permissions(ids=perm_ids)
+        perms = self.get_permissions(ids=perm_ids, with_expired=with_expired)
         if flat:
             return perms.values_list('id', flat=True)
         return perms
 
-    def get_permissions_for_user_asset(self, user, asset):
+    def get_permissions_for_user_asset(self, user, asset, with_expired=False):
         """ 获取同时包含用户、资产的授权规则 """
-        user_perm_ids = self.get_permissions_for_user(user, flat=True)
-        asset_perm_ids = self.get_permissions_for_assets([asset], flat=True)
+        user_perm_ids = self.get_permissions_for_user(user, flat=True, with_expired=with_expired)
+        asset_perm_ids = self.get_permissions_for_assets([asset], flat=True, with_expired=with_expired)
         perm_ids = set(user_perm_ids) & set(asset_perm_ids)
-        perms = self.get_permissions(ids=perm_ids)
+        perms = self.get_permissions(ids=perm_ids, with_expired=with_expired)
         return perms
 
     def get_permissions_for_user_group_asset(self, user_group, asset):
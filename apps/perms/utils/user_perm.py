@@ -2,13 +2,13 @@ import json
 import re
 
 from django.conf import settings
-from django.core.cache import cache
 from django.db.models import Q
 from django.utils.translation import get_language
 from rest_framework.utils.encoders import JSONEncoder
 
 from assets.const import AllTypes
 from assets.models import FavoriteAsset, Asset, Node
+from common.cache import CacheNamespace
 from common.utils.common import timeit, get_logger
 from orgs.utils import current_org, get_current_org_id
 from perms.models import PermNode, UserAssetGrantedTreeNodeRelation, AssetPermission
@@ -92,18 +92,16 @@ class UserPermAssetUtil(AssetPermissionPermAssetUtil):
             nodes.append(node)
         return nodes
 
+    type_nodes_tree_cache = CacheNamespace('perms:type-nodes-tree', timeout=60 * 60 * 24)
+
     @classmethod
     def get_type_nodes_tree_or_cached(cls, user):
         lang = get_language()
-        key = f'perms:type-nodes-tree:{user.id}:{current_org.id}:{lang}'
-        nodes = cache.get(key)
-        if nodes is None:
-            nodes = cls(user).get_type_nodes_tree()
-            nodes_json = json.dumps(nodes, cls=JSONEncoder)
-            cache.set(key, nodes_json, 60 * 60 * 24)
-        else:
-            nodes = json.loads(nodes)
-        return nodes
+        scope = f'{user.id}:{current_org.id}'
+        nodes_json = cls.type_nodes_tree_cache.get_or_set(
+            lang, lambda: json.dumps(cls(user).get_type_nodes_tree(), cls=JSONEncoder), scope=scope
+        )
+        return json.loads(nodes_json)
 
     @classmethod
     def refresh_type_nodes_tree_cache(cls, user_ids=None, org_id=None):
@@ -115,8 +113,7 @@ class UserPermAssetUtil(AssetPermissionPermAssetUtil):
 
         logger.debug("Refresh type nodes tree cache")
         for user_id in user_ids:
-            key = f'perms:type-nodes-tree:{user_id}:{org_id}*'
-            cache.delete_pattern(key)
+            cls.type_nodes_tree_cache.expire(scope=f'{user_id}:{org_id}')
 
     def refresh_favorite_assets(self):
         favor_ids = FavoriteAsset.objects.filter(user=self.user).values_list('asset_id', flat=True)
@@ -26,6 +26,7 @@ from perms.models import (
 )
 from users.models import User
 from . import UserPermAssetUtil
+from .asset_perm import PermAssetDetailUtil
 from .permission import AssetPermissionUtil
 
 logger = get_logger(__name__)
@@ -205,6 +206,7 @@ class UserPermTreeExpireUtil(_UserPermTreeCacheMixin):
                 cache_key = self.get_cache_key(uid)
                 p.srem(cache_key, *org_ids)
             p.execute()
+        PermAssetDetailUtil.expire_access_decisions(user_ids=user_ids)
         users_display = ','.join([str(i) for i in user_ids[:3]])
         if len(user_ids) > 3:
             users_display += '...'
@@ -219,6 +221,7 @@ class UserPermTreeExpireUtil(_UserPermTreeCacheMixin):
             for k in keys:
                 p.delete(k)
             p.execute()
+        PermAssetDetailUtil.access_decision_cache.expire()
         logger.info('Expire all user perm tree')
 
 
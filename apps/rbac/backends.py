@@ -22,12 +22,13 @@ class RBACBackend(JMSBaseAuthBackend):
         if not user_obj.is_active or not perm:
             raise PermissionDenied()
         if isinstance(perm, str):
-            perm_set = set(i.strip() for i in perm.split('|'))
+            perm_set = [i.strip() for i in perm.split('|')]
         elif isinstance(perm, (list, tuple, set)):
-            perm_set = set(perm)
+            perm_set = perm
         else:
             raise ValueError('perm must be str, list, tuple or set')
-        has_perm = bool(perm_set & set(user_obj.perms))
+        # user_obj.perms 是 frozenset, 不用每次都构造 set
+        has_perm = not user_obj.perms.isdisjoint(perm_set)
         if not has_perm:
             raise PermissionDenied()
         return has_perm
@@ -61,6 +61,7 @@ exclude_permissions = (
 
     ('accounts', 'historicalaccount', '*', '*'),
     ('accounts', 'serviceintegration', '*', '*'),
+    ('accounts', 'vaultsynccheckpoint', '*', '*'),
     ('accounts', 'accountbaseautomation', '*', '*'),
     ('accounts', 'accountbackupautomation', '*', '*'),
     ('accounts', 'pushsecretrecord', 'add,change,delete', '*'),
@@ -110,6 +111,7 @@ exclude_permissions = (
     ('tickets', 'comment', '*', '*'),
     ('tickets', 'ticket', 'add,delete,change', 'ticket'),
     ('tickets', 'ticketstep', '*', '*'),
+    ('tickets', 'ticketinbox', '*', '*'),
     ('tickets', 'approvalrule', '*', '*'),
     ('tickets', 'applyloginticket', '*', '*'),
     ('tickets', 'applyloginassetticket', '*', '*'),
@@ -175,3 +177,11 @@ only_org_permissions = (
 
 system_exclude_permissions = list(exclude_permissions) + list(only_org_permissions)
 org_exclude_permissions = list(exclude_permissions) + list(only_system_permissions)
+
+# 用户可以切换的组织: 字段 -> 权限
+org_access_perms = {
+    'pam_orgs': 'rbac.view_pam',
+    'console_orgs': 'rbac.view_console',
+    'audit_orgs': 'rbac.view_audit',
+    'workbench_orgs': 'rbac.view_workbench',
+}
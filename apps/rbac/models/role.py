@@ -1,6 +1,7 @@
 from django.db import models
 from django.utils.translation import gettext_lazy as _, gettext
 
+from common.cache import CacheNamespace
 from common.db.models import JMSBaseModel
 from common.utils import lazyproperty
 from .permission import Permission
@@ -37,6 +38,8 @@ class Role(JMSBaseModel):
     comment = models.TextField(max_length=128, default='', blank=True, verbose_name=_('Comment'))
 
     BuiltinRole = BuiltinRole
+    # perm -> role ids 的索引, 角色或角色权限变化时重建
+    perms_roles_cache = CacheNamespace('rbac_perms_roles', timeout=60 * 60 * 24)
     objects = models.Manager()
     org_roles = OrgRoleManager()
     system_roles = SystemRoleManager()
@@ -135,6 +138,37 @@ class Role(JMSBaseModel):
         role_ids += admin_ids
         return cls.objects.filter(id__in=role_ids)
 
+    @classmethod
+    def compute_perms_roles_mapper(cls, perms):
+        admin_ids = {BuiltinRole.system_admin.id, BuiltinRole.org_admin.id}
+        mapper = {perm: set(admin_ids) for perm in perms}
+        q = models.Q()
+        for perm in perms:
+            app_label, codename = perm.split('.')
+            q |= models.Q(permission__codename=codename, permission__content_type__app_label=app_label)
+        if not q:
+            return mapper
+        relations = cls.permissions.through.objects.filter(q).values_list(
+            'permission__content_type__app_label', 'permission__codename', 'role_id'
+        )
+        for app_label, codename, role_id in relations:
+            mapper['{}.{}'.format(app_label, codename)].add(str(role_id))
+        return mapper
+
+    @classmethod
+    def get_perms_roles_mapper(cls, perms):
+        """
+        一次查询获取多个权限对应的角色 id, {perm: set(role_ids)}
+        """
+        perms = sorted(set(perms))
+        key = ','.join(perms)
+        return cls.perms_roles_cache.get_or_set(key, lambda: cls.compute_perms_roles_mapper(perms))
+
+    @classmethod
+    def refresh_perms_roles_mapper(cls, perms):
+        cls.perms_roles_cache.expire()
+        return cls.get_perms_roles_mapper(perms)
+
 
 class SystemRole(Role):
     objects = SystemRoleManager()
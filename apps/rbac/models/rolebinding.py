@@ -1,11 +1,15 @@
+import uuid
+
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models import Q
+from django.db.models import Q, Value, CharField
+from django.db.models.functions import Cast, Concat
 from django.db.models.signals import post_save
 from django.utils.translation import gettext_lazy as _
 from rest_framework.serializers import ValidationError
 
+from common.db.aggregates import GroupConcat, set_group_concat_max_len
 from common.db.models import JMSBaseModel, CASCADE_SIGNAL_SKIP
 from common.utils import lazyproperty
 from orgs.utils import current_org, tmp_to_root_org
@@ -99,6 +103,45 @@ class RoleBinding(JMSBaseModel):
         roles_id = bindings.values_list('role', flat=True).distinct()
         return Role.objects.filter(id__in=roles_id)
 
+    @classmethod
+    def get_users_role_ids(cls, user_ids):
+        """
+        一次聚合查询一批用户的角色
+        :return: {user_id: {'system': [role_id], 'orgs': [(org_id, role_id)]}}
+        """
+        sep, pair_sep = ',', ':'
+
+        def as_char(field):
+            return Cast(field, output_field=CharField())
+
+        set_group_concat_max_len()
+        rows = cls.objects_raw.filter(user_id__in=user_ids) \
+            .values('user_id').order_by() \
+            .annotate(
+                system=GroupConcat(
+                    as_char('role_id'), separator=sep,
+                    filter=Q(scope=Scope.system, org__isnull=True)
+                ),
+                orgs=GroupConcat(
+                    Concat(as_char('org_id'), Value(pair_sep), as_char('role_id')),
+                    separator=sep, filter=Q(scope=Scope.org, org__isnull=False)
+                ),
+            )
+
+        # MySQL 中 uuid 保存为不带 - 的字符串
+        def to_id(value):
+            return str(uuid.UUID(value))
+
+        mapper = {}
+        for row in rows:
+            system = [to_id(i) for i in (row['system'] or '').split(sep) if i]
+            orgs = [
+                tuple(to_id(j) for j in i.split(pair_sep))
+                for i in (row['orgs'] or '').split(sep) if i
+            ]
+            mapper[str(row['user_id'])] = {'system': system, 'orgs': orgs}
+        return mapper
+
     @lazyproperty
     def user_display(self):
         return self.user.name
@@ -134,43 +177,56 @@ class RoleBinding(JMSBaseModel):
 
     @classmethod
     def get_user_has_the_perm_orgs(cls, perm, user):
+        return cls.get_user_perms_orgs(user, [perm])[perm]
+
+    @classmethod
+    def get_user_perms_orgs(cls, user, perms):
+        """
+        一次计算用户拥有这些权限的组织, {perm: [org, ...]}
+        用户的绑定, 组织, perm -> roles 索引都只加载一次
+        """
         from orgs.models import Organization
 
-        roles = Role.get_roles_by_perm(perm)
+        workbench_perm = 'rbac.view_workbench'
+        perms_roles = Role.get_perms_roles_mapper(perms)
         with tmp_to_root_org():
-            bindings = list(cls.objects.root_all().filter(role__in=roles, user=user))
-
-        system_bindings = [b for b in bindings if b.scope == Role.Scope.system.value]
-        # 工作台仅限于自己加入的组织
-        if perm == 'rbac.view_workbench':
-            all_orgs = user.orgs.all().distinct()
-        else:
-            all_orgs = Organization.objects.all()
+            bindings = list(
+                cls.objects.root_all().filter(user=user)
+                .values_list('scope', 'role_id', 'org_id')
+            )
 
+        all_orgs = Organization.objects.all()
         if not settings.XPACK_ENABLED:
             all_orgs = all_orgs.filter(id=Organization.DEFAULT_ID)
-
-        # 有系统级别的绑定，就代表在所有组织有这个权限
-        if system_bindings:
-            orgs = all_orgs
-        else:
-            org_ids = [b.org.id for b in bindings if b.org]
-            orgs = all_orgs.filter(id__in=org_ids)
-
-        orgs = cls.orgs_order_by_name(orgs)
-        workbench_perm = 'rbac.view_workbench'
-        # 全局组织
-        has_root_org = False
-        root_org = Organization.root()
-        if orgs and perm != workbench_perm and user.has_perm('orgs.view_rootorg'):
-            has_root_org = True
-        elif orgs and perm == workbench_perm and user.has_perm('orgs.view_alljoinedorg'):
-            root_org.name = _('All organizations')
-            has_root_org = True
-
-        if has_root_org and system_bindings:
-            orgs = [root_org, *list(orgs)]
-        return orgs
+        all_orgs = sorted(all_orgs, key=lambda o: o.name)
+        # 工作台仅限于自己加入的组织
+        joined_org_ids = {str(org_id) for __, __, org_id in bindings if org_id}
+        joined_orgs = [o for o in all_orgs if str(o.id) in joined_org_ids]
+
+        perms_orgs = {}
+        for perm in perms:
+            role_ids = perms_roles[perm]
+            perm_bindings = [b for b in bindings if str(b[1]) in role_ids]
+            has_system_binding = any(b[0] == Scope.system for b in perm_bindings)
+            perm_all_orgs = joined_orgs if perm == workbench_perm else all_orgs
+
+            # 有系统级别的绑定，就代表在所有组织有这个权限
+            if has_system_binding:
+                orgs = list(perm_all_orgs)
+            else:
+                org_ids = {str(b[2]) for b in perm_bindings if b[2]}
+                orgs = [o for o in perm_all_orgs if str(o.id) in org_ids]
+
+            # 全局组织
+            if orgs and has_system_binding:
+                root_org = Organization.root()
+                if perm != workbench_perm and user.has_perm('orgs.view_rootorg'):
+                    orgs.insert(0, root_org)
+                elif perm == workbench_perm and user.has_perm('orgs.view_alljoinedorg'):
+                    root_org.name = _('All organizations')
+                    orgs.insert(0, root_org)
+            perms_orgs[perm] = orgs
+        return perms_orgs
 
 
 class OrgRoleBindingManager(RoleBindingManager):
@@ -2,8 +2,10 @@ from django.dispatch import receiver
 from django.db.models.signals import post_migrate, post_save, m2m_changed, post_delete
 from django.apps import apps
 
-from .models import SystemRole, OrgRole, OrgRoleBinding, SystemRoleBinding
+from common.decorators import on_transaction_commit
+from .models import Role, SystemRole, OrgRole, OrgRoleBinding, SystemRoleBinding
 from .builtin import BuiltinRole
+from .const import org_access_perms
 
 
 @receiver(post_migrate)
@@ -49,3 +51,15 @@ def on_org_role_permission_changed(sender, instance, action, **kwargs):
 def on_org_role_binding_update(sender, instance, **kwargs):
     from users.models import User
     User.expire_users_rbac_perms_cache()
+
+
+@receiver([post_save, post_delete], sender=Role)
+@receiver([post_save, post_delete], sender=SystemRole)
+@receiver([post_save, post_delete], sender=OrgRole)
+@receiver(m2m_changed, sender=Role.permissions.through)
+@on_transaction_commit
+def on_role_changed_refresh_perms_roles_mapper(sender, action=None, **kwargs):
+    if action and not action.startswith('post'):
+        return
+    # 预先计算切换组织需要的 perm -> roles 索引
+    Role.refresh_perms_roles_mapper(org_access_perms.values())
@@ -1,4 +1,9 @@
-from django.test import TestCase
+import time
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 # Create your tests here.
 
@@ -21,3 +26,125 @@ from django.test import TestCase
 #  8. 权限位名称翻译 (整理一个dict，key为codename，value为翻译)
 #  9. 修改用户-组织关联的角色，修改表结构
 #  10. 前端获取所有权限，给每个按钮添加对应的权限控制指令
+
+
+@override_settings(XPACK_ENABLED=True)
+class UserPermsOrgsTests(TestCase):
+    """
+    用户加入几百个组织时, 计算可切换的组织
+    """
+    orgs_amount = 300
+
+    def setUp(self):
+        from orgs.models import Organization
+        from rbac.models import Role, RoleBinding
+        from users.models import User
+
+        self.user = User.objects.create(username='orgs-bench', name='orgs-bench', email='orgs-bench@example.com')
+        orgs = Organization.objects.bulk_create([
+            Organization(name='bench-org-{}'.format(i)) for i in range(self.orgs_amount)
+        ])
+        org_user = Role.BuiltinRole.org_user.get_role()
+        org_admin = Role.BuiltinRole.org_admin.get_role()
+        RoleBinding.objects_raw.bulk_create([
+            RoleBinding(user=self.user, role=org_admin if i % 2 else org_user, org=org, scope='org')
+            for i, org in enumerate(orgs)
+        ])
+
+    def test_user_perms_orgs(self):
+        from rbac.const import org_access_perms
+        from rbac.models import RoleBinding
+
+        perms = list(org_access_perms.values())
+        # 预热 perm -> roles 索引和用户权限
+        RoleBinding.get_user_perms_orgs(self.user, perms)
+
+        with CaptureQueriesContext(connection) as ctx:
+            perms_orgs = RoleBinding.get_user_perms_orgs(self.user, perms)
+        # 用户的绑定和组织各查询一次, 与组织数量无关
+        self.assertLessEqual(len(ctx.captured_queries), 2)
+        self.assertEqual(len(perms_orgs['rbac.view_console']), self.orgs_amount // 2)
+        self.assertEqual(len(perms_orgs['rbac.view_workbench']), self.orgs_amount)
+
+
+class UsersRoleIdsTests(TestCase):
+    """
+    一次聚合查询得到一批用户的系统角色和各组织的角色
+    """
+    users_amount = 20
+
+    def setUp(self):
+        from orgs.models import Organization
+        from rbac.models import Role, RoleBinding
+        from users.models import User
+
+        self.users = User.objects.bulk_create([
+            User(username='roles-{}'.format(i), name='roles-{}'.format(i), email='roles-{}@example.com'.format(i))
+            for i in range(self.users_amount)
+        ])
+        self.orgs = Organization.objects.bulk_create([
+            Organization(name='roles-org-{}'.format(i)) for i in range(3)
+        ])
+        self.system_user = Role.BuiltinRole.system_user.get_role()
+        self.org_user = Role.BuiltinRole.org_user.get_role()
+        bindings = []
+        for user in self.users:
+            bindings.append(RoleBinding(user=user, role=self.system_user, scope='system'))
+            bindings.extend(
+                RoleBinding(user=user, role=self.org_user, org=org, scope='org')
+                for org in self.orgs
+            )
+        RoleBinding.objects_raw.bulk_create(bindings)
+
+    def test_get_users_role_ids(self):
+        from rbac.models import RoleBinding
+
+        user_ids = [u.id for u in self.users]
+        with CaptureQueriesContext(connection) as ctx:
+            mapper = RoleBinding.get_users_role_ids(user_ids)
+        # mysql 会多一次设置 group_concat_max_len
+        self.assertLessEqual(len(ctx.captured_queries), 2)
+        self.assertEqual(len(mapper), self.users_amount)
+
+        item = mapper[str(self.users[0].id)]
+        self.assertEqual(item['system'], [str(self.system_user.id)])
+        self.assertEqual(
+            sorted(item['orgs']),
+            sorted((str(org.id), str(self.org_user.id)) for org in self.orgs)
+        )
+
+
+class UserPermsLocalCacheTests(TestCase):
+    def setUp(self):
+        from users.models import User
+
+        self.user = User.objects.create(username='local-perms', name='local-perms', email='local-perms@example.com')
+        self.load = mock.Mock(return_value=['rbac.view_console'])
+
+    def tearDown(self):
+        from rbac.utils import UserPermsLocalCache
+        UserPermsLocalCache.expire(self.user.id)
+
+    def get_perms(self):
+        from rbac.utils import UserPermsLocalCache
+        return UserPermsLocalCache.get_perms(self.user, 'org', self.load)
+
+    def test_reload_once_generation_changed(self):
+        self.assertEqual(self.get_perms(), frozenset(['rbac.view_console']))
+        self.get_perms()
+        self.assertEqual(self.load.call_count, 1)
+
+        # 其他进程失效了权限缓存, 本进程的缓存没有清除, 下次读取时就重新加载
+        self.load.return_value = ['rbac.view_workbench']
+        self.user.rbac_perms_cache.expire(scope=self.user.id)
+        self.assertEqual(self.get_perms(), frozenset(['rbac.view_workbench']))
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_reload_after_timeout(self):
+        self.get_perms()
+        # 版本号没变, 超过 Redis 缓存的 timeout 后也要重新加载
+        timeout = self.user.rbac_perms_cache.timeout
+        with mock.patch('rbac.utils.time.monotonic', return_value=time.monotonic() + timeout + 1):
+            self.get_perms()
+        self.assertEqual(self.load.call_count, 2)
+
@@ -0,0 +1,75 @@
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from common.metrics import metrics
+from common.utils import get_logger
+
+logger = get_logger(__name__)
+
+__all__ = ['UserPermsLocalCache', 'intern_perms']
+
+_interned_perms = weakref.WeakValueDictionary()
+_interned_lock = threading.Lock()
+
+
+def intern_perms(perms):
+    """
+    权限 codename 都 intern, 相同的权限集合共用同一个 frozenset, 节省内存
+    """
+    perms = frozenset(sys.intern(p) for p in perms)
+    with _interned_lock:
+        return _interned_perms.setdefault(perms, perms)
+
+
+class UserPermsLocalCache:
+    """
+    进程内的用户权限缓存, 以 (user, org) 为 key, 值为 frozenset
+
+    每次读取都去 Redis 校验用户权限缓存的版本号 (一次 get_many),
+    版本没变则继续使用, 不用每个请求都从 Redis 反序列化角色和权限,
+    本地缓存最多保留 rbac_perms_cache 的 timeout
+    """
+    max_size = 10000
+    _data = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_perms(cls, user, org_id, load_func):
+        """
+        :param load_func: 版本号变化时, 重新加载权限 codename 列表
+        """
+        key = (str(user.id), str(org_id))
+        item = cls._data.get(key)
+        generations = user.rbac_perms_cache.get_generations(scope=user.id)
+        now = time.monotonic()
+        if item and item[0] == generations and item[2] > now:
+            metrics.inc('jumpserver_cache_requests_total', cache='rbac_perms_local', result='hit')
+            return item[1]
+
+        perms = intern_perms(load_func())
+        metrics.inc('jumpserver_cache_requests_total', cache='rbac_perms_local', result='miss')
+        # 版本号的 key 过期后会读到 0, 本地缓存不能比 Redis 缓存活得久, 否则旧的版本号可能重新匹配
+        expired_at = now + user.rbac_perms_cache.timeout
+        cls._set(key, (generations, perms, expired_at))
+        return perms
+
+    @classmethod
+    def _set(cls, key, value):
+        with cls._lock:
+            cls._data[key] = value
+            cls._data.move_to_end(key)
+            while len(cls._data) > cls.max_size:
+                cls._data.popitem(last=False)
+
+    @classmethod
+    def expire(cls, user_id=None):
+        with cls._lock:
+            if user_id is None:
+                cls._data.clear()
+                return
+            user_id = str(user_id)
+            for key in [k for k in cls._data if k[0] == user_id]:
+                cls._data.pop(key, None)
@@ -1,11 +1,8 @@
 # -*- coding: utf-8 -*-
 #
-from collections import defaultdict
-
 from django.db.models import Count, Q, F, Value
 from django.db.models.functions import Concat
 from django.http import JsonResponse
-from django.utils import timezone
 from rest_framework.views import APIView
 
 from accounts.const import Source
@@ -36,16 +33,7 @@ class AccountStatisticApi(DateRangeMixin, APIView):
         return AccountTemplate.objects.all()
 
     def get_change_secret_account_metrics(self):
-        filtered_queryset = self.filter_by_date_range(self.base_qs, 'date_change_secret')
-
-        data = defaultdict(set)
-        for t, _id in filtered_queryset.values_list('date_change_secret', 'id'):
-            dt_local = timezone.localtime(t)
-            date_str = str(dt_local.date())
-            data[date_str].add(_id)
-
-        metrics = [len(data.get(str(d), set())) for d in self.date_range_list]
-        return metrics
+        return self.get_date_metrics(self.base_qs, 'date_change_secret')
 
     def get(self, request, *args, **kwargs):
         qs = self.base_qs
@@ -1,9 +1,6 @@
 # -*- coding: utf-8 -*-
 #
-from collections import defaultdict
-
 from django.http import JsonResponse
-from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from rest_framework.views import APIView
 
@@ -46,29 +43,12 @@ class AccountAutomationApi(DateRangeMixin, APIView):
 
     def get_execution_metrics(self):
         executions = AutomationExecution.objects.filter(type__in=AutomationTypes.values)
-        qs = self.filter_by_date_range(executions, 'date_start')
-
-        types = set()
-        data = defaultdict(lambda: defaultdict(int))
-        for obj in qs:
-            tp = obj.type
-            if not tp:
-                continue
-            types.add(tp)
-
-            dt = obj.date_start
-            dt_local = timezone.localtime(dt)
-            date_str = str(dt_local.date())
-            data[date_str][tp] += 1
-
-        tp_map = defaultdict(list)
-        for d in self.date_range_list:
-            tp_data = data.get(str(d), {})
-            for tp in types:
-                tp_map[tp].append(tp_data.get(tp, 0))
+        tp_map = self.get_date_metrics_by(executions, 'date_start', 'type')
 
         metrics = {}
         for tp, values in tp_map.items():
+            if not tp:
+                continue
             if tp == AutomationTypes.change_secret:
                 _tp = _('Account change secret')
             else:
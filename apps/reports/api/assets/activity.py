@@ -1,7 +1,5 @@
 # -*- coding: utf-8 -*-
 #
-from collections import defaultdict
-
 from django.db.models import Count
 from django.http.response import JsonResponse
 from rest_framework.views import APIView
@@ -27,13 +25,7 @@ class AssetActivityApi(DateRangeMixin, APIView):
     permission_classes = [RBACPermission, IsValidLicense]
 
     def get_asset_login_metrics(self, queryset):
-        data = defaultdict(set)
-        for t, _id in queryset.values_list('date_start', 'id'):
-            date_str = str(t.date())
-            data[date_str].add(_id)
-
-        metrics = [len(data.get(str(d), set())) for d in self.date_range_list]
-        return metrics
+        return self.get_date_metrics(queryset, 'date_start')
 
     @lazyproperty
     def session_qs(self):
@@ -28,15 +28,7 @@ class AssetStatisticApi(DateRangeMixin, APIView):
         return Asset.objects.all()
 
     def get_added_asset_metrics(self):
-        filtered_queryset = self.filter_by_date_range(self.base_qs, 'date_created')
-
-        data = defaultdict(set)
-        for t, _id in filtered_queryset.values_list('date_created', 'id'):
-            date_str = str(t.date())
-            data[date_str].add(_id)
-
-        metrics = [len(data.get(str(d), set())) for d in self.date_range_list]
-        return metrics
+        return self.get_date_metrics(self.base_qs, 'date_created')
 
     def get(self, request, *args, **kwargs):
         qs = self.base_qs
@@ -56,21 +48,22 @@ class AssetStatisticApi(DateRangeMixin, APIView):
         for d in AllTypes.types():
             category_type_map[str(d['category'].label)].append(d['value'])
 
-        category_type_ids = defaultdict(lambda: defaultdict(set))
-        for _id, tp, category in (qs.select_related('platform')
-                .values_list('id', 'platform__type', 'platform__category')):
+        category_type_counts = defaultdict(lambda: defaultdict(int))
+        rows = qs.order_by().values('platform__type', 'platform__category').annotate(total=Count(1))
+        for row in rows:
+            category = row['platform__category']
             category_label = category_map.get(category, category)
-            category_type_ids[category_label][tp].add(_id)
+            category_type_counts[category_label][row['platform__type']] += row['total']
 
         by_type_category = defaultdict(list)
-        for k, v in category_type_ids.items():
+        for k, v in category_type_counts.items():
             by_type_category[k] = [
                 {
                     'label': all_type_dict.get(tp, tp),
                     'type': tp,
-                    'total': len(_ids),
+                    'total': total,
                 }
-                for tp, _ids in v.items()
+                for tp, total in v.items()
             ]
 
         sorted_category_assets = OrderedDict()
@@ -1,7 +1,5 @@
 # -*- coding: utf-8 -*-
 #
-from collections import defaultdict
-
 from django.db.models import Count
 from django.http.response import JsonResponse
 from rest_framework.views import APIView
@@ -25,15 +23,7 @@ class UserChangeSecretApi(DateRangeMixin, APIView):
     permission_classes = [RBACPermission, IsValidLicense]
 
     def get_change_password_metrics(self, queryset):
-        filtered_queryset = self.filter_by_date_range(queryset, 'datetime')
-
-        data = defaultdict(set)
-        for t, username in filtered_queryset.values_list('datetime', 'user'):
-            date_str = str(t.date())
-            data[date_str].add(username)
-
-        metrics = [len(data.get(str(d), set())) for d in self.date_range_list]
-        return metrics
+        return self.get_date_metrics(queryset, 'datetime', count_field='user')
 
     @lazyproperty
     def change_password_queryset(self):
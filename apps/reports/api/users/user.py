@@ -3,6 +3,7 @@
 from collections import defaultdict
 
 from django.db.models import Count, Q
+from django.db.models.functions import Lower
 from django.http.response import JsonResponse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
@@ -27,46 +28,26 @@ class UserReportApi(DateRangeMixin, APIView):
     permission_classes = [RBACPermission, IsValidLicense]
 
     def get_user_login_metrics(self, queryset):
-        filtered_queryset = self.filter_by_date_range(queryset, 'datetime')
-
-        data = defaultdict(set)
-        for t, username in filtered_queryset.values_list('datetime', 'username'):
-            date_str = str(t.date())
-            data[date_str].add(username)
-
-        metrics = [len(data.get(str(d), set())) for d in self.date_range_list]
-        return metrics
+        return self.get_date_metrics(queryset, 'datetime', count_field='username')
 
     def get_user_login_method_metrics(self, source_map):
-        filtered_queryset = self.filter_by_date_range(self.user_login_log_queryset, 'datetime')
-
-        backends = set()
-        data = defaultdict(lambda: defaultdict(set))
-        for t, username, backend in filtered_queryset.values_list('datetime', 'username', 'backend'):
-            backend = str(source_map.get(backend.lower(), backend))
-            backends.add(backend)
-            date_str = str(t.date())
-            data[date_str][backend].add(username)
-        metrics = defaultdict(list)
-        for t in self.date_range_list:
-            date_str = str(t)
-            for backend in backends:
-                username = data.get(date_str) if data.get(date_str) else {backend: set()}
-                metrics[backend].append(len(username.get(backend, set())))
+        queryset = self.user_login_log_queryset.annotate(backend_lower=Lower('backend'))
+        data = self.get_date_metrics_by(
+            queryset, 'datetime', 'backend_lower', count_field='username'
+        )
+        metrics = defaultdict(lambda: [0] * len(self.date_range_list))
+        for backend, values in data.items():
+            backend = str(source_map.get(backend, backend))
+            metrics[backend] = [a + b for a, b in zip(metrics[backend], values)]
         return metrics
 
     def get_user_login_time_metrics(self):
         buckets = ['00:00-06:00', '06:00-12:00', '12:00-18:00', '18:00-24:00']
         metrics = {k: 0 for k in buckets}
 
-        qs = self.filter_by_date_range(self.user_login_log_queryset, 'datetime').only('datetime')
-
-        for obj in qs:
-            dt = obj.datetime
-            dt_local = timezone.localtime(dt)
-            hour = dt_local.hour
-            metrics[buckets[hour // 6]] += 1
-
+        hour_counts = self.get_hour_counts(self.user_login_log_queryset, 'datetime')
+        for hour, count in hour_counts.items():
+            metrics[buckets[hour // 6]] += count
         return metrics
 
     @lazyproperty
@@ -86,23 +67,27 @@ class UserReportApi(DateRangeMixin, APIView):
     def get(self, request, *args, **kwargs):
         data = {}
 
+        valid = Q(is_active=True) & (
+                Q(date_expired__isnull=True) | Q(date_expired__gte=timezone.now())
+        )
         user_stats = self.user_qs.aggregate(
             total=Count(1),
+            valid=Count(1, filter=valid),
             first_login=Count(1, filter=Q(is_first_login=True)),
             need_update_password=Count(1, filter=Q(need_update_password=True)),
             face_vector=Count(1, filter=Q(face_vector__isnull=False)),
             not_enabled_mfa=Count(1, filter=Q(mfa_level=0)),
         )
 
-        user_stats['valid'] = sum(1 for u in self.user_qs if u.is_valid)
         data['user_stats'] = user_stats
 
         source_map = Source.as_dict()
         source_map.update({'password': _('Password')})
         user_by_source = defaultdict(int)
-        for source in self.user_qs.values_list('source', flat=True):
-            k = source_map.get(source, source)
-            user_by_source[str(k)] += 1
+        rows = self.user_qs.order_by().values('source').annotate(total=Count(1))
+        for row in rows:
+            k = source_map.get(row['source'], row['source'])
+            user_by_source[str(k)] += row['total']
 
         data['user_by_source'] = [{'name': k, 'value': v} for k, v in user_by_source.items()]
 
@@ -1,3 +1,9 @@
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+
+from django.db import connection
+from django.db.models import Count, DateTimeField, ExpressionWrapper, F
+from django.db.models.functions import ExtractHour, TruncDate
 from django.utils import timezone
 from rest_framework.request import Request
 
@@ -9,6 +15,8 @@ class DateRangeMixin:
     request: Request
     days_param = 'days'
     default_days = 1
+    # {时区名: 数据库能否转换到这个时区}
+    _db_timezone_support = {}
 
     @lazyproperty
     def days(self) -> int:
@@ -44,3 +52,65 @@ class DateRangeMixin:
     @lazyproperty
     def dates_metrics_date(self):
         return [date.strftime('%m-%d') for date in self.date_range_list] or ['0']
+
+    @classmethod
+    def db_support_timezone(cls, tzname):
+        """ MySQL 没有加载时区表时 CONVERT_TZ 会返回 NULL, 每个进程只检查一次 """
+        if connection.vendor != 'mysql':
+            return True
+        if tzname not in cls._db_timezone_support:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT CONVERT_TZ('2000-01-01 00:00:00', 'UTC', %s)", [tzname])
+                cls._db_timezone_support[tzname] = cursor.fetchone()[0] is not None
+        return cls._db_timezone_support[tzname]
+
+    @staticmethod
+    def local_datetime_expr(field_name):
+        """
+        数据库不支持时区名时, 使用当前时区现在的 UTC 偏移转换为本地时间,
+        跨越夏令时切换的数据会差一个小时
+        """
+        offset = local_now().utcoffset()
+        if not offset:
+            return F(field_name)
+        return ExpressionWrapper(F(field_name) + offset, output_field=DateTimeField())
+
+    def local_trunc(self, func, field_name):
+        """ 按当前时区 (包括夏令时) 在数据库中截取本地的日期或小时 """
+        if self.db_support_timezone(timezone.get_current_timezone_name()):
+            return func(field_name, tzinfo=timezone.get_current_timezone())
+        return func(self.local_datetime_expr(field_name), tzinfo=dt_timezone.utc)
+
+    def get_date_counts(self, queryset, field_name, count_field='pk', group_by=None):
+        """
+        在数据库中按本地日期 (和 group_by) 分组计数, count_field 不是主键时去重
+        返回 {group: {date: count}}, 没有 group_by 时 group 为 None
+        """
+        queryset = self.filter_by_date_range(queryset, field_name)
+        day = self.local_trunc(TruncDate, field_name)
+        fields = ['day', group_by] if group_by else ['day']
+        rows = queryset.annotate(day=day).values(*fields).order_by() \
+            .annotate(total=Count(count_field, distinct=count_field != 'pk'))
+
+        data = defaultdict(dict)
+        for row in rows:
+            data[row.get(group_by)][row['day']] = row['total']
+        return data
+
+    def get_date_metrics(self, queryset, field_name, count_field='pk'):
+        counts = self.get_date_counts(queryset, field_name, count_field).get(None, {})
+        return [counts.get(d, 0) for d in self.date_range_list]
+
+    def get_date_metrics_by(self, queryset, field_name, group_by, count_field='pk'):
+        data = self.get_date_counts(queryset, field_name, count_field, group_by)
+        return {
+            group: [counts.get(d, 0) for d in self.date_range_list]
+            for group, counts in data.items()
+        }
+
+    def get_hour_counts(self, queryset, field_name):
+        """ 按本地时间的小时分组计数, {hour: count} """
+        queryset = self.filter_by_date_range(queryset, field_name)
+        hour = self.local_trunc(ExtractHour, field_name)
+        rows = queryset.annotate(hour=hour).values('hour').order_by().annotate(total=Count('pk'))
+        return {row['hour']: row['total'] for row in rows}
@@ -1,3 +1,59 @@
+import datetime
+from unittest import mock
+
+from django.db.models.functions import ExtractHour, TruncDate
 from django.test import TestCase
+from django.utils import timezone
+
+from audits.models import UserLoginLog
+from reports.mixins import DateRangeMixin
+
+UTC = datetime.timezone.utc
+
+
+class LocalTruncTests(TestCase):
+    """
+    America/New_York 在 2026-11-01 06:00 UTC 结束夏令时, 前后两天的 23:30 分别是 UTC-4 和 UTC-5
+    """
+    tzname = 'America/New_York'
+
+    def setUp(self):
+        self.mixin = DateRangeMixin()
+        self.logs = {
+            'edt': datetime.datetime(2026, 11, 1, 3, 30, tzinfo=UTC),
+            'est': datetime.datetime(2026, 11, 2, 4, 30, tzinfo=UTC),
+        }
+        UserLoginLog.objects.bulk_create([
+            UserLoginLog(username=username, type='W', ip='127.0.0.1', datetime=dt)
+            for username, dt in self.logs.items()
+        ])
+
+    def trunc(self, func):
+        queryset = UserLoginLog.objects.filter(username__in=self.logs) \
+            .annotate(value=self.mixin.local_trunc(func, 'datetime'))
+        return dict(queryset.values_list('username', 'value'))
+
+    def test_day_across_dst(self):
+        with timezone.override(self.tzname):
+            days = self.trunc(TruncDate)
+        self.assertEqual(days, {
+            'edt': datetime.date(2026, 10, 31),
+            'est': datetime.date(2026, 11, 1),
+        })
+
+    def test_hour_across_dst(self):
+        with timezone.override(self.tzname):
+            hours = self.trunc(ExtractHour)
+        self.assertEqual(hours, {'edt': 23, 'est': 23})
 
-# Create your tests here.
+    def test_fallback_fixed_offset(self):
+        # 数据库不支持时区名时, 使用当前的 UTC 偏移
+        with timezone.override(datetime.timezone(datetime.timedelta(hours=8))), \
+                mock.patch.object(DateRangeMixin, 'db_support_timezone', return_value=False):
+            days = self.trunc(TruncDate)
+            hours = self.trunc(ExtractHour)
+        self.assertEqual(days, {
+            'edt': datetime.date(2026, 11, 1),
+            'est': datetime.date(2026, 11, 2),
+        })
+        self.assertEqual(hours, {'edt': 11, 'est': 12})
@@ -1,7 +1,6 @@
 from uuid import uuid4
 
 from django.conf import settings
-from django.core.cache import cache
 from rest_framework.generics import ListAPIView, CreateAPIView
 from rest_framework.views import Response
 from rest_framework_bulk.generics import BulkModelViewSet
@@ -22,12 +21,7 @@ class BlockIPSecurityAPI(ListAPIView):
 
     @staticmethod
     def get_ips():
-        ips = []
-        prefix = LoginIpBlockUtil.BLOCK_KEY_TMPL.replace('{}', '')
-        keys = cache.keys(f'{prefix}*')
-        for key in keys:
-            ips.append(key.replace(prefix, ''))
-
+        ips = LoginIpBlockUtil.get_blocked_ips()
         white_list = settings.SECURITY_LOGIN_IP_WHITE_LIST
         ips = list(set(ips) - set(white_list))
         ips = [ip for ip in ips if ip != '*']
@@ -24,6 +24,7 @@ from ldap3.core.exceptions import (
     LDAPAttributeError,
 )
 
+from authentication.backends.drf import CredentialCache
 from authentication.backends.ldap import LDAPAuthorizationBackend, LDAPUser, \
     LDAPHAAuthorizationBackend
 from common.const import LDAP_AD_ACCOUNT_DISABLE
@@ -453,7 +454,9 @@ class LDAPImportUtil(object):
         disable_users = User.objects.filter(source=self.category, is_active=True).exclude(username__in=ldap_users).all()
         disable_usernames = disable_users.values_list('username', flat=True)
         disable_usernames = list(map(str, disable_usernames))
+        disable_user_ids = list(disable_users.values_list('id', flat=True))
         disable_users.update(is_active=False)
+        CredentialCache.expire_users(disable_user_ids)
         logger.info(f"Disable {len(disable_usernames)} {self.category.upper()} users successfully")
         return disable_usernames
 
@@ -14,6 +14,7 @@ from orgs.utils import current_org
 from terminal.backends import (
     get_command_storage, get_multi_command_storage
 )
+from terminal.backends.command.ingest import CommandIngestPipeline, IngestBackpressure
 from terminal.const import RiskLevelChoices
 from terminal.exceptions import StorageInvalid
 from terminal.filters import CommandFilter
@@ -181,6 +182,8 @@ class CommandViewSet(JMSBulkModelViewSet):
     def create(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data, many=True)
         if serializer.is_valid():
+            if CommandIngestPipeline.is_enabled():
+                return self.push_to_ingest_pipeline(serializer.validated_data)
             ok = self.command_store.bulk_save(serializer.validated_data)
             if ok:
                 return Response("ok", status=201)
@@ -191,6 +194,15 @@ class CommandViewSet(JMSBulkModelViewSet):
             logger.error(msg)
             return Response({"msg": msg}, status=401)
 
+    @staticmethod
+    def push_to_ingest_pipeline(commands):
+        try:
+            CommandIngestPipeline().push(commands)
+        except IngestBackpressure:
+            # 积压太多, 组件保留命令稍后重试
+            return Response("Ingest busy", status=429)
+        return Response("ok", status=201)
+
 
 class InsecureCommandAlertAPI(generics.CreateAPIView):
     serializer_class = InsecureCommandAlertSerializer
@@ -104,6 +104,12 @@ class SessionViewSet(OrgBulkModelViewSet):
             self.permission_classes = [RBACPermission | IsSessionAssignee]
         return super().get_permissions()
 
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            Session.prefetch_command_amount(page)
+        return page
+
     @staticmethod
     def prepare_offline_file(session, local_path):
         replay_path = default_storage.path(local_path)
@@ -25,3 +25,9 @@ class CommandBase(object):
               input=None, session=None):
         pass
 
+    def count_by_sessions(self, session_ids):
+        """
+        批量统计多个会话的命令数量
+        :return: {session_id: amount}
+        """
+        return {str(i): self.count(session=str(i)) for i in session_ids}
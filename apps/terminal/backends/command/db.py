@@ -1,11 +1,13 @@
 # ~*~ coding: utf-8 ~*~
 import datetime
 
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Count
 from django.db.utils import OperationalError
 from django.utils import timezone
 
-from common.utils.common import pretty_string
+from common.utils.common import pretty_string, is_uuid
 from .base import CommandBase
 
 
@@ -62,6 +64,17 @@ class CommandStore(CommandBase):
                 command.save()
         return True
 
+    @staticmethod
+    def get_session_date_start(session_id):
+        from terminal.models import Session
+        if not is_uuid(session_id):
+            return None
+        date_start = Session.objects.filter(id=session_id) \
+            .values_list('date_start', flat=True).first()
+        if not date_start:
+            return None
+        return date_start - datetime.timedelta(days=1)
+
     @staticmethod
     def make_filter_kwargs(
             date_from=None, date_to=None,
@@ -75,6 +88,9 @@ class CommandStore(CommandBase):
             date_from = date_from_default
         if not date_to and not session:
             date_to = date_to_default
+        if not date_from and session and settings.LOG_TABLE_PARTITION_ENABLED:
+            # 按会话的开始时间限定范围, 分区表只扫描会话之后的分区
+            date_from = CommandStore.get_session_date_start(session)
         if date_from is not None:
             if isinstance(date_from, datetime.datetime):
                 date_from = date_from.timestamp()
@@ -122,4 +138,8 @@ class CommandStore(CommandBase):
         count = self.model.objects.filter(**filter_kwargs).count()
         return count
 
-
+    def count_by_sessions(self, session_ids):
+        session_ids = [str(i) for i in session_ids]
+        queryset = self.model.objects.filter(session__in=session_ids) \
+            .order_by().values('session').annotate(amount=Count('id'))
+        return {item['session']: item['amount'] for item in queryset}
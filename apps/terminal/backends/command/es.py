@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 #
+import uuid
+
 import pytz
 
 from datetime import datetime
@@ -14,6 +16,9 @@ logger = get_logger(__file__)
 class CommandStore(ES):
     def __init__(self, config):
         properties = {
+            "id": {
+                "type": "keyword"
+            },
             "session": {
                 "type": "keyword"
             },
@@ -37,7 +42,7 @@ class CommandStore(ES):
     @staticmethod
     def make_data(command):
         data = dict(
-            user=command["user"], asset=command["asset"],
+            id=str(command.get('id') or uuid.uuid4()), user=command["user"], asset=command["asset"],
             account=command["account"], input=command["input"],
             output=command["output"], risk_level=command["risk_level"],
             session=command["session"], timestamp=command["timestamp"],
@@ -57,3 +62,21 @@ class CommandStore(ES):
         if timestamp__lte:
             timestamp_range['lte'] = timestamp__lte
         return 'timestamp', timestamp_range
+
+    def count_by_sessions(self, session_ids):
+        """
+        terms 聚合一次统计多个会话的命令数量
+        出错时抛出异常, 不能当作 0 条命令保存到会话中
+        """
+        session_ids = [str(i) for i in session_ids]
+        if not session_ids:
+            return {}
+        field = self.get_agg_field(self.get_properties(), 'session')
+        body = {
+            'size': 0,
+            'query': {'bool': {'filter': [{'terms': {field: session_ids}}]}},
+            'aggs': {'sessions': {'terms': {'field': field, 'size': len(session_ids)}}},
+        }
+        data = self.es.search(index=self.query_index, body=body)
+        buckets = data['aggregations']['sessions']['buckets']
+        return {bucket['key']: bucket['doc_count'] for bucket in buckets}
@@ -0,0 +1,169 @@
+import json
+import os
+import socket
+import time
+
+from django.conf import settings
+
+from common.utils import get_logger
+from common.utils.connection import get_redis_client
+
+logger = get_logger(__name__)
+
+__all__ = ['CommandIngestPipeline', 'IngestBackpressure']
+
+
+class IngestBackpressure(Exception):
+    pass
+
+
+class CommandIngestPipeline:
+    """
+    组件上传的命令先写入 Redis stream, 后台任务批量写入命令存储
+
+    - 积压超过 COMMAND_INGEST_MAX_LAG 时拒绝写入, 组件稍后重试 (背压)
+    - 写入失败的消息不 ack, 按指数退避的时间重新认领, 超过最大次数后转到死信 stream
+    - 每分钟写入的数量记录在 Redis 中, 用于统计吞吐
+    """
+    stream_key = 'terminal:command_ingest'
+    dead_letter_key = 'terminal:command_ingest:dead'
+    throughput_key_tmpl = 'terminal:command_ingest:throughput:{}'
+    group = 'command_ingest'
+    retry_base_seconds = 5
+    max_retries = 5
+
+    def __init__(self):
+        self.redis = get_redis_client()
+        self.consumer = f'{socket.gethostname()}-{os.getpid()}'
+
+    @staticmethod
+    def is_enabled():
+        return settings.COMMAND_INGEST_ASYNC_ENABLED
+
+    def ensure_group(self):
+        try:
+            self.redis.xgroup_create(self.stream_key, self.group, id='0', mkstream=True)
+        except Exception as e:
+            # 已经存在
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def push(self, commands):
+        if self.get_stream_length() > settings.COMMAND_INGEST_MAX_LAG:
+            raise IngestBackpressure()
+        data = json.dumps(list(commands), default=str)
+        self.redis.xadd(self.stream_key, {'data': data})
+
+    def get_stream_length(self):
+        return self.redis.xlen(self.stream_key)
+
+    def read_new(self, count):
+        resp = self.redis.xreadgroup(
+            self.group, self.consumer, {self.stream_key: '>'}, count=count
+        )
+        if not resp:
+            return []
+        return resp[0][1]
+
+    def get_retry_delay(self, times_delivered):
+        return self.retry_base_seconds * 2 ** max(times_delivered - 1, 0)
+
+    def claim_retries(self, count):
+        """ 认领已经过了退避时间的失败消息, 超过重试次数的转到死信 """
+        pending = self.redis.xpending_range(self.stream_key, self.group, '-', '+', count)
+        retry_ids, dead_ids = [], []
+        for item in pending:
+            times = item['times_delivered']
+            if times > self.max_retries:
+                dead_ids.append(item['message_id'])
+            elif item['time_since_delivered'] >= self.get_retry_delay(times) * 1000:
+                retry_ids.append(item['message_id'])
+
+        if dead_ids:
+            messages = self.redis.xclaim(self.stream_key, self.group, self.consumer, 0, dead_ids)
+            self.dead_letter(messages)
+        if not retry_ids:
+            return []
+        return self.redis.xclaim(self.stream_key, self.group, self.consumer, 0, retry_ids)
+
+    def dead_letter(self, messages):
+        if not messages:
+            return
+        with self.redis.pipeline() as p:
+            for msg_id, fields in messages:
+                p.xadd(self.dead_letter_key, fields, maxlen=100000, approximate=True)
+            p.xack(self.stream_key, self.group, *[msg_id for msg_id, __ in messages])
+            p.xdel(self.stream_key, *[msg_id for msg_id, __ in messages])
+            p.execute()
+        logger.error(f'Command ingest dead letter: {len(messages)} messages')
+
+    def flush(self, storage, messages):
+        commands = []
+        for __, fields in messages:
+            data = fields.get(b'data') or fields.get('data')
+            commands.extend(json.loads(data))
+        if not commands:
+            ok = True
+        else:
+            try:
+                ok = storage.bulk_save(commands)
+            except Exception as e:
+                logger.error(f'Command ingest bulk save error: {e}')
+                ok = False
+        if not ok:
+            return 0
+
+        msg_ids = [msg_id for msg_id, __ in messages]
+        minute = int(time.time() // 60)
+        throughput_key = self.throughput_key_tmpl.format(minute)
+        with self.redis.pipeline() as p:
+            p.xack(self.stream_key, self.group, *msg_ids)
+            p.xdel(self.stream_key, *msg_ids)
+            p.incrby(throughput_key, len(commands))
+            p.expire(throughput_key, 3600)
+            p.execute()
+        return len(commands)
+
+    def run(self, storage, max_batches=None):
+        """
+        每次最多读取 COMMAND_INGEST_BATCH_SIZE 条消息写入, 读完或者写入
+        max_batches 批后返回, 不长时间占用 celery worker, 剩下的下次再写入
+        """
+        self.ensure_group()
+        batch_size = settings.COMMAND_INGEST_BATCH_SIZE
+        max_batches = max_batches or settings.COMMAND_INGEST_MAX_BATCHES
+        total = 0
+        for __ in range(max_batches):
+            messages = self.claim_retries(batch_size)
+            if len(messages) < batch_size:
+                messages += self.read_new(batch_size - len(messages))
+            if not messages:
+                break
+            total += self.flush(storage, messages)
+        return total
+
+    def get_metrics(self):
+        self.ensure_group()
+        now_minute = int(time.time() // 60)
+        throughput_keys = [self.throughput_key_tmpl.format(now_minute - i) for i in range(1, 6)]
+        with self.redis.pipeline() as p:
+            p.xlen(self.stream_key)
+            p.xpending(self.stream_key, self.group)
+            p.xlen(self.dead_letter_key)
+            p.mget(throughput_keys)
+            length, pending, dead, throughputs = p.execute()
+
+        oldest_age = 0
+        first = self.redis.xrange(self.stream_key, count=1)
+        if first:
+            msg_id = first[0][0]
+            msg_id = msg_id.decode() if isinstance(msg_id, bytes) else msg_id
+            oldest_age = max(time.time() - int(msg_id.split('-')[0]) / 1000, 0)
+        throughputs = [int(i or 0) for i in throughputs]
+        return {
+            'lag': length,
+            'pending': pending['pending'],
+            'dead_letter': dead,
+            'oldest_age_seconds': round(oldest_age, 1),
+            'throughput_per_minute': sum(throughputs) / len(throughputs),
+        }
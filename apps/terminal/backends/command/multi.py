@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 #
 
+from collections import defaultdict
+
 from .base import CommandBase
 
 
@@ -25,6 +27,13 @@ class CommandStore(CommandBase):
             amount += storage.count(**kwargs)
         return amount
 
+    def count_by_sessions(self, session_ids):
+        amounts = defaultdict(int)
+        for storage in self.storage_list:
+            for session_id, amount in storage.count_by_sessions(session_ids).items():
+                amounts[session_id] += amount
+        return dict(amounts)
+
     def save(self, command):
         pass
 
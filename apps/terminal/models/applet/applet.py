@@ -1,7 +1,6 @@
 import os.path
 import random
 import shutil
-from collections import defaultdict
 
 import yaml
 from django.conf import settings
@@ -12,10 +11,12 @@ from django.utils.translation import gettext_lazy as _
 from rest_framework.serializers import ValidationError
 
 from assets.models import Platform
+from common.cache import CacheNamespace
 from common.db.models import JMSBaseModel
 from common.utils import lazyproperty, get_logger
 from common.utils.yml import yaml_load_with_i18n
 from terminal.const import PublishStatus
+from .lease import AppletHostLease
 
 logger = get_logger(__name__)
 
@@ -150,20 +151,16 @@ class Applet(JMSBaseModel):
         shutil.copytree(path, pkg_path)
         return instance, serializer
 
-    host_prefer_key_tpl = 'applet_host_prefer_{}'
+    host_prefer_cache = CacheNamespace('applet_host_prefer', timeout=60 * 60 * 24 * 7)
 
     @classmethod
     def clear_host_prefer(cls):
-        cache.delete_pattern(cls.host_prefer_key_tpl.format('*'))
+        cls.host_prefer_cache.expire()
 
-    def _select_by_load(self, hosts):
-        using_keys = cache.keys(self.host_prefer_key_tpl.format('*'))
-        using_host_ids = cache.get_many(using_keys)
-        counts = defaultdict(int)
-        for host_id in using_host_ids.values():
-            counts[host_id] += 1
-
-        hosts = list(sorted(hosts, key=lambda h: counts[str(h.id)]))
+    @staticmethod
+    def _select_by_load(hosts):
+        loads = AppletHostLease.get_hosts_load([h.id for h in hosts])
+        hosts = list(sorted(hosts, key=lambda h: loads.get(str(h.id), 0)))
         return hosts[0] if hosts else None
 
     def _filter_published_hosts(self, hosts):
@@ -220,8 +217,7 @@ class Applet(JMSBaseModel):
         if host_matched:
             return random.choice(host_matched)
 
-        prefer_key = self.host_prefer_key_tpl.format(user.id)
-        prefer_host_id = cache.get(prefer_key, None)
+        prefer_host_id = self.host_prefer_cache.get(user.id)
         pref_host = [host for host in hosts if host.id == prefer_host_id]
 
         if pref_host:
@@ -230,7 +226,7 @@ class Applet(JMSBaseModel):
             host = self._select_by_load(hosts)
             if host is None:
                 return
-            cache.set(prefer_key, str(host.id), timeout=None)
+            self.host_prefer_cache.set(user.id, str(host.id))
         return host
 
     def get_related_platform(self):
@@ -239,37 +235,47 @@ class Applet(JMSBaseModel):
         return platform
 
     @staticmethod
-    def random_select_prefer_account(user, host, accounts):
-        msg = 'Applet host remain public accounts: {}: {}'.format(host.name, len(accounts))
-        if len(accounts) == 0:
-            logger.error(msg)
-            return None
+    def sort_by_prefer_account(user, host, accounts):
+        """
+        用户上次使用的账号排在最前面，其余的随机排序
+        """
+        accounts = list(accounts)
+        random.shuffle(accounts)
         prefer_host_account_key = 'applet_host_prefer_account_{}_{}'.format(user.id, host.id)
         prefer_account_id = cache.get(prefer_host_account_key, None)
-        prefer_account = None
         if prefer_account_id:
-            prefer_account = accounts.filter(id=prefer_account_id).first()
-        if prefer_account:
-            account = prefer_account
-        else:
-            account = random.choice(accounts)
-            cache.set(prefer_host_account_key, account.id, timeout=None)
-        return account
+            accounts.sort(key=lambda a: str(a.id) != str(prefer_account_id))
+        return accounts
 
-    accounts_using_key_tmpl = 'applet_host_accounts_{}_{}_{}'
-
-    def select_a_public_account(self, user, host, valid_accounts):
-        using_keys = cache.keys(self.accounts_using_key_tmpl.format(host.id, '*', '*')) or []
-        accounts_username_used = list(cache.get_many(using_keys).values())
-        logger.debug('Applet host account using: {}: {}'.format(host.name, accounts_username_used))
-        accounts = valid_accounts.exclude(username__in=accounts_username_used)
-        public_accounts = accounts.filter(username__startswith='jms_')
-        if not public_accounts:
-            public_accounts = accounts \
-                .exclude(username__in=['Administrator', 'root']) \
-                .exclude(username__startswith='js_')
-        account = self.random_select_prefer_account(user, host, public_accounts)
-        return account
+    @staticmethod
+    def set_prefer_account(user, host, account):
+        prefer_host_account_key = 'applet_host_prefer_account_{}_{}'.format(user.id, host.id)
+        cache.set(prefer_host_account_key, account.id, timeout=None)
+
+    def select_a_public_account(self, user, host, valid_accounts, lease):
+        accounts = valid_accounts.exclude(username__startswith='js_')
+        public_accounts = self.sort_by_prefer_account(
+            user, host, accounts.filter(username__startswith='jms_')
+        )
+        other_accounts = self.sort_by_prefer_account(
+            user, host, accounts.exclude(username__startswith='jms_')
+            .exclude(username__in=['Administrator', 'root'])
+        )
+        # jms_ 开头的账号都被占用时，才使用其他账号
+        candidates = public_accounts + other_accounts
+        if not candidates:
+            logger.error('Applet host has no public accounts: {}'.format(host.name))
+            return None, None
+
+        username, lease_id = lease.allocate(
+            [a.username for a in candidates], self.name, mode='free'
+        )
+        if not username:
+            logger.error('Applet host remain public accounts: {}: 0'.format(host.name))
+            return None, None
+        account = [a for a in candidates if a.username == username][0]
+        self.set_prefer_account(user, host, account)
+        return account, lease_id
 
     @staticmethod
     def _try_virtual_private_account(user, host):
@@ -309,35 +315,29 @@ class Applet(JMSBaseModel):
             return None
         return private_account
 
-    def try_to_use_private_account(self, user, host, valid_accounts):
+    def try_to_use_private_account(self, user, host, valid_accounts, lease):
         host_can_concurrent = str(host.deploy_options.get('RDS_fSingleSessionPerUser', 0)) == '0'
         app_can_concurrent = self.can_concurrent or self.type == 'web'
         all_can_concurrent = host_can_concurrent and app_can_concurrent
 
         private_account = self._select_a_private_account(user, host, valid_accounts)
         if not private_account:
-            return None
+            return None, None
         # 优先使用 private account，支持并发或者不支持并发时，如果私有没有被占用，则使用私有
-        account = None
         # 如果都支持，不管私有是否被占用，都使用私有
         if all_can_concurrent:
-            logger.debug('All can concurrent, use private account')
-            account = private_account
-        # 如果主机都不支持并发，则查询一下私有账号有没有任何应用使用，如果没有被使用，则使用私有
+            mode = 'any'
+        # 如果主机都不支持并发，则私有账号没有任何应用使用时，才使用私有
         elif not host_can_concurrent:
-            private_using_key = self.accounts_using_key_tmpl.format(host.id, private_account.username, '*')
-            private_is_using = len(cache.keys(private_using_key))
-            logger.debug("Private account is using: {}".format(private_is_using))
-            if not private_is_using:
-                account = private_account
-        # 如果主机支持，但是应用不支持并发，则查询一下私有账号有没有被这个应用使用, 如果没有被使用，则使用私有
-        elif host_can_concurrent and not app_can_concurrent:
-            private_app_using_key = self.accounts_using_key_tmpl.format(host.id, private_account.username, self.name)
-            private_is_using_by_this_app = cache.get(private_app_using_key, False)
-            logger.debug("Private account is using {} by {}".format(private_is_using_by_this_app, self.name))
-            if not private_is_using_by_this_app:
-                account = private_account
-        return account
+            mode = 'free'
+        # 如果主机支持，但是应用不支持并发，则私有账号没有被这个应用使用时，才使用私有
+        else:
+            mode = 'app_free'
+        username, lease_id = lease.allocate([private_account.username], self.name, mode=mode)
+        logger.debug('Try to use private account: mode={} allocated={}'.format(mode, bool(username)))
+        if not username:
+            return None, None
+        return private_account, lease_id
 
     def select_host_account(self, user, asset):
         # 选择激活的发布机
@@ -346,19 +346,16 @@ class Applet(JMSBaseModel):
             return None
         logger.info('Select applet host: {}'.format(host.name))
         valid_accounts = host.accounts.all().filter(privileged=False)
-        account = self.try_to_use_private_account(user, host, valid_accounts)
+        lease = AppletHostLease(host.id)
+        account, lock_key = self.try_to_use_private_account(user, host, valid_accounts, lease)
         if not account:
             logger.debug('No private account, try to use public account')
-            account = self.select_a_public_account(user, host, valid_accounts)
+            account, lock_key = self.select_a_public_account(user, host, valid_accounts, lease)
 
         if not account:
             logger.debug('No available account for applet host: {}'.format(host.name))
             return None
 
-        ttl = 60 * 60 * 24
-        lock_key = self.accounts_using_key_tmpl.format(host.id, account.username, self.name)
-        cache.set(lock_key, account.username, ttl)
-
         res = {
             'host': host,
             'account': account,
@@ -367,6 +364,10 @@ class Applet(JMSBaseModel):
         logger.debug('Select host and account: {}-{}'.format(host.name, account.username))
         return res
 
+    @staticmethod
+    def release_host_account(lock_key):
+        return AppletHostLease.release(lock_key)
+
     def delete(self, using=None, keep_parents=False):
         platform = self.get_related_platform()
         if platform and platform.assets.count() == 0:
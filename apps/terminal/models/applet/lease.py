@@ -0,0 +1,133 @@
+import time
+import uuid
+
+from common.utils import get_logger
+from common.utils.connection import get_redis_client
+
+logger = get_logger(__name__)
+
+__all__ = ['AppletHostLease']
+
+# KEYS[1]: 发布机的租约 zset, member 为 `{username}|{applet}|{random}`, score 为过期时间
+# ARGV: now, expired_at, applet, random, mode, candidate usernames...
+# mode:
+#   any: 不检查占用, 直接使用第一个候选账号
+#   free: 账号没有被任何应用使用
+#   app_free: 账号没有被当前应用使用
+ALLOCATE_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local expired_at = tonumber(ARGV[2])
+local applet = ARGV[3]
+local random = ARGV[4]
+local mode = ARGV[5]
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+
+local used = {}
+local used_by_app = {}
+local members = redis.call('ZRANGE', key, 0, -1)
+for _, member in ipairs(members) do
+    local username, app = string.match(member, '^(.*)|(.*)|[^|]*$')
+    if username then
+        used[username] = true
+        used_by_app[username .. '|' .. app] = true
+    end
+end
+
+for i = 6, #ARGV do
+    local username = ARGV[i]
+    local ok = true
+    if mode == 'free' then
+        ok = not used[username]
+    elseif mode == 'app_free' then
+        ok = not used_by_app[username .. '|' .. applet]
+    end
+    if ok then
+        local member = username .. '|' .. applet .. '|' .. random
+        redis.call('ZADD', key, expired_at, member)
+        redis.call('EXPIRE', key, math.ceil(expired_at - now))
+        return member
+    end
+end
+return false
+"""
+
+
+class AppletHostLease:
+    """
+    发布机账号的租约, 每台发布机一个 sorted set, member 是正在使用的账号, score 是过期时间
+
+    分配和释放都是原子的 Lua 脚本, 不需要 keys 扫描, 发布机的负载就是 zset 的大小
+    """
+    key_tmpl = 'applet_host_leases_{}'
+    sep = '|'
+    ttl = 60 * 60 * 24
+    _allocate_script = None
+
+    def __init__(self, host_id):
+        self.host_id = str(host_id)
+        self.key = self.key_tmpl.format(self.host_id)
+        self.redis = get_redis_client()
+
+    @classmethod
+    def get_allocate_script(cls, redis):
+        if cls._allocate_script is None:
+            cls._allocate_script = redis.register_script(ALLOCATE_SCRIPT)
+        return cls._allocate_script
+
+    def allocate(self, usernames, applet, mode='any'):
+        """
+        按顺序从 usernames 中原子的选出一个满足 mode 的账号并占用
+        :return: (username, lease_id), 没有可用的账号时返回 (None, None)
+        """
+        usernames = [u for u in usernames if u]
+        if not usernames:
+            return None, None
+        now = time.time()
+        script = self.get_allocate_script(self.redis)
+        args = [now, now + self.ttl, applet, uuid.uuid4().hex[:8], mode, *usernames]
+        member = script(keys=[self.key], args=args)
+        if not member:
+            return None, None
+        member = member.decode() if isinstance(member, bytes) else member
+        username = member.rsplit(self.sep, 2)[0]
+        lease_id = self.host_id + self.sep + member
+        return username, lease_id
+
+    def get_using(self):
+        """
+        :return: {username: set(applets)}
+        """
+        self.redis.zremrangebyscore(self.key, '-inf', time.time())
+        using = {}
+        for member in self.redis.zrange(self.key, 0, -1):
+            member = member.decode()
+            username, applet, __ = member.rsplit(self.sep, 2)
+            using.setdefault(username, set()).add(applet)
+        return using
+
+    @classmethod
+    def get_hosts_load(cls, host_ids):
+        """
+        一次 pipeline 清理过期的租约并获取发布机的负载
+        """
+        host_ids = [str(i) for i in host_ids]
+        now = time.time()
+        pipe = get_redis_client().pipeline(transaction=False)
+        for host_id in host_ids:
+            key = cls.key_tmpl.format(host_id)
+            pipe.zremrangebyscore(key, '-inf', now)
+            pipe.zcard(key)
+        results = pipe.execute()
+        return dict(zip(host_ids, results[1::2]))
+
+    @classmethod
+    def release(cls, lease_id):
+        if not lease_id or cls.sep not in lease_id:
+            return False
+        host_id, member = lease_id.split(cls.sep, 1)
+        key = cls.key_tmpl.format(host_id)
+        removed = get_redis_client().zrem(key, member)
+        logger.debug('Release applet host lease: {} {}'.format(lease_id, removed))
+        return bool(removed)
@@ -33,6 +33,10 @@ class Status(models.Model):
     def get_terminal_latest_stat(cls, terminal):
         key = cls.CACHE_KEY.format(terminal.id)
         data = cache.get(key)
+        return cls.from_cache_data(terminal, data)
+
+    @classmethod
+    def from_cache_data(cls, terminal, data):
         if not data:
             return None
         data.pop('terminal', None)
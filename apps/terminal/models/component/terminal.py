@@ -33,11 +33,26 @@ class TerminalStatusMixin:
         from ...utils import ComputeLoadUtil
         return ComputeLoadUtil.compute_load(self.last_stat, self.type)
 
+    _alive = None
+
     @property
     def is_alive(self):
+        if self._alive is not None:
+            return self._alive
         key = self.ALIVE_KEY.format(self.id)
         return cache.get(key, False)
 
+    @classmethod
+    def prefetch_status(cls, components):
+        """ 一次 get_many 读取所有组件的存活和最新状态 """
+        alive_keys = {c.id: cls.ALIVE_KEY.format(c.id) for c in components}
+        stat_keys = {c.id: Status.CACHE_KEY.format(c.id) for c in components}
+        values = cache.get_many([*alive_keys.values(), *stat_keys.values()])
+        for component in components:
+            component._alive = values.get(alive_keys[component.id], False)
+            data = values.get(stat_keys[component.id])
+            component.last_stat = Status.from_cache_data(component, data)
+
     def set_alive(self, ttl=60 * 3):
         key = self.ALIVE_KEY.format(self.id)
         cache.set(key, True, ttl)
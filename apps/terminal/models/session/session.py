@@ -14,13 +14,14 @@ from django.utils.translation import gettext_lazy as _
 
 from accounts.models import Account
 from assets.models import Asset
-from common.const.signals import OP_LOG_SKIP_SIGNAL
-from common.utils import get_object_or_none, lazyproperty
+from common.utils import get_object_or_none, lazyproperty, get_logger
 from orgs.mixins.models import OrgModelMixin
 from terminal.backends import get_multi_command_storage
 from terminal.const import SessionType, TerminalType, LoginFrom
 from users.models import User
 
+logger = get_logger(__name__)
+
 
 class Session(OrgModelMixin):
     id = models.UUIDField(default=uuid.uuid4, primary_key=True)
@@ -51,6 +52,8 @@ class Session(OrgModelMixin):
     LOCK_CACHE_KEY_PREFIX = 'TOGGLE_LOCKED_SESSION_{}'
     SUFFIX_MAP = {2: '.replay.gz', 3: '.cast.gz', 4: '.replay.mp4', 5: '.replay.json'}
     DEFAULT_SUFFIXES = ['.replay.gz', '.cast.gz', '.gz', '.replay.mp4']
+    # 未保存 cmd_amount 时, 批量统计或计算出的命令数量
+    _command_amount = None
 
     # Todo: 将来干掉 local_path, 使用 default storage 实现
     def get_all_possible_local_path(self):
@@ -227,16 +230,51 @@ class Session(OrgModelMixin):
 
     @property
     def command_amount(self) -> int:
-        if self.need_update_cmd_amount:
-            cmd_amount = self.compute_command_amount()
-            self.cmd_amount = cmd_amount
-            setattr(self, OP_LOG_SKIP_SIGNAL, True)
-            self.save()
-        elif self.need_compute_cmd_amount:
-            cmd_amount = self.compute_command_amount()
-        else:
-            cmd_amount = self.cmd_amount
-        return cmd_amount
+        if not self.need_compute_cmd_amount:
+            return self.cmd_amount
+        # 列表中通过 prefetch_command_amount 批量统计, 已结束的会话由后台任务保存
+        if self._command_amount is None:
+            self._command_amount = self.compute_command_amount()
+        return self._command_amount
+
+    @classmethod
+    def prefetch_command_amount(cls, sessions):
+        """ 一次统计一页会话的命令数量, 不用每个会话都查询一次命令存储 """
+        sessions = [s for s in sessions if s.need_compute_cmd_amount]
+        if not sessions:
+            return
+        command_store = get_multi_command_storage()
+        try:
+            amounts = command_store.count_by_sessions([s.id for s in sessions])
+        except Exception as e:
+            # 和单个会话 count 出错时一样显示 0, 不再逐个查询
+            logger.error(f'Count session commands error: {e}')
+            amounts = {}
+        for session in sessions:
+            session._command_amount = amounts.get(str(session.id), 0)
+
+    @classmethod
+    def finalize_command_amount(cls, session_ids, batch_size=500):
+        """
+        批量统计已结束会话的命令数量并保存, 之后不再查询命令存储
+        统计出错的批次保持 -1, 由定时任务下次重试, 不保存为 0
+        """
+        queryset = cls.objects.filter(id__in=session_ids, is_finished=True, cmd_amount=-1)
+        sessions = list(queryset.only('id', 'cmd_amount'))
+        command_store = get_multi_command_storage()
+        finalized = 0
+        for i in range(0, len(sessions), batch_size):
+            batch = sessions[i:i + batch_size]
+            try:
+                amounts = command_store.count_by_sessions([s.id for s in batch])
+            except Exception as e:
+                logger.error(f'Finalize session command amount error: {e}')
+                continue
+            for session in batch:
+                session.cmd_amount = amounts.get(str(session.id), 0)
+            cls.objects.bulk_update(batch, ['cmd_amount'])
+            finalized += len(batch)
+        return finalized
 
     @property
     def need_update_cmd_amount(self):
@@ -1,13 +1,20 @@
 from django.db.models.signals import pre_save, post_save
 from django.dispatch import receiver
 
+from common.decorators import merge_delay_run
+from orgs.utils import tmp_to_root_org
 from terminal.models import Session
 
 
+@merge_delay_run(ttl=30)
+def finalize_sessions_command_amount(session_ids=()):
+    # 延迟一会儿, 组件批量上传的命令可能晚于会话结束
+    with tmp_to_root_org():
+        Session.finalize_command_amount(session_ids)
+
+
 @receiver(pre_save, sender=Session)
 def on_session_pre_save(sender, instance, **kwargs):
-    if instance.need_update_cmd_amount:
-        instance.cmd_amount = instance.compute_command_amount()
     if instance.account_obj:
         instance.account_obj.update_last_login_date()
 
@@ -18,3 +25,5 @@ def on_session_finished(sender, instance: Session, created, **kwargs):
         return
     # 清理一次可能因 task 未执行的缓存数据
     Session.unlock_session(instance.id)
+    if instance.need_compute_cmd_amount:
+        finalize_sessions_command_amount.delay(session_ids=(instance.id,))
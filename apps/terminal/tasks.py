@@ -6,6 +6,7 @@ from itertools import chain
 
 from celery import shared_task
 from celery.utils.log import get_task_logger
+from django.conf import settings
 from django.core.files.storage import default_storage
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
@@ -15,7 +16,8 @@ from ops.celery.decorator import (
     register_as_period_task, after_app_ready_start)
 from orgs.utils import tmp_to_builtin_org
 from orgs.utils import tmp_to_root_org
-from .backends import server_replay_storage
+from .backends import server_replay_storage, get_command_storage
+from .backends.command.ingest import CommandIngestPipeline
 from .const import ReplayStorageType, CommandStorageType
 from .models import (
     Status, Session, Task, AppletHostDeployment,
@@ -64,6 +66,39 @@ def clean_orphan_session():
         session.save()
 
 
+@shared_task(
+    verbose_name=_('Finalize session command amount'),
+    description=_(
+        """Every hour, count and save the command amount of finished sessions which not 
+        saved yet, so the session list does not need to count commands"""
+    )
+)
+@register_as_period_task(interval=3600)
+@tmp_to_root_org()
+def finalize_session_command_amount_period(limit=5000):
+    session_ids = Session.objects.filter(is_finished=True, cmd_amount=-1) \
+        .order_by('-date_start').values_list('id', flat=True)[:limit]
+    amount = Session.finalize_command_amount(list(session_ids))
+    logger.info(f'Finalize session command amount: {amount}')
+
+
+@shared_task(
+    verbose_name=_('Ingest session commands'),
+    description=_(
+        """If COMMAND_INGEST_ASYNC_ENABLED is configured, commands uploaded by components are 
+        buffered in Redis, and this task writes them to the command storage in batches 
+        every COMMAND_INGEST_FLUSH_INTERVAL seconds"""
+    )
+)
+@register_as_period_task(interval=settings.COMMAND_INGEST_FLUSH_INTERVAL)
+def ingest_session_commands_period():
+    if not CommandIngestPipeline.is_enabled():
+        return
+    pipeline = CommandIngestPipeline()
+    amount = pipeline.run(get_command_storage())
+    logger.info(f'Ingest session commands: {amount}, metrics: {pipeline.get_metrics()}')
+
+
 @shared_task(
     verbose_name=_('Upload session replay to external storage'),
     description=_(
@@ -1,3 +1,312 @@
-from django.test import TestCase
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from terminal.backends.command.ingest import CommandIngestPipeline, IngestBackpressure
+from terminal.const import RiskLevelChoices
+from terminal.models import Session
+from terminal.models.applet.lease import AppletHostLease
+
+
+class AppletHostLeaseTests(TestCase):
+    """
+    模拟早高峰几百个并发的 connection token 请求分配发布机账号
+    """
+    concurrency = 300
+    accounts_amount = 200
+
+    def setUp(self):
+        self.host_id = uuid.uuid4()
+        self.usernames = ['jms_{}'.format(i) for i in range(self.accounts_amount)]
+
+    def tearDown(self):
+        lease = AppletHostLease(self.host_id)
+        lease.redis.delete(lease.key)
+
+    def allocate(self, i):
+        lease = AppletHostLease(self.host_id)
+        return lease.allocate(self.usernames, 'chrome', mode='free')
+
+    def test_concurrent_allocate(self):
+        with ThreadPoolExecutor(max_workers=50) as executor:
+            results = list(executor.map(self.allocate, range(self.concurrency)))
+
+        allocated = [username for username, __ in results if username]
+        # 每个账号只能被分配一次, 多余的请求拿不到账号
+        self.assertEqual(len(allocated), self.accounts_amount)
+        self.assertEqual(len(set(allocated)), self.accounts_amount)
+
+        loads = AppletHostLease.get_hosts_load([self.host_id])
+        self.assertEqual(loads[str(self.host_id)], self.accounts_amount)
+
+        lease_ids = [lease_id for __, lease_id in results if lease_id]
+        with ThreadPoolExecutor(max_workers=50) as executor:
+            released = list(executor.map(AppletHostLease.release, lease_ids))
+        self.assertTrue(all(released))
+        loads = AppletHostLease.get_hosts_load([self.host_id])
+        self.assertEqual(loads[str(self.host_id)], 0)
+
+
+class ESCommandSortTests(SimpleTestCase):
+    """
+    search_after 的游标需要唯一的排序兜底, _doc 在多个分片间会重复
+    """
+
+    def setUp(self):
+        from terminal.backends.command.es import CommandStore
+
+        with mock.patch('common.plugins.es.get_es_client_version', return_value=7), \
+                mock.patch.object(CommandStore, 'ping', return_value=False):
+            self.store = CommandStore({'HOSTS': ['http://127.0.0.1:9200'], 'INDEX': 'jumpserver'})
+        self.store.es = mock.Mock()
+        self.set_properties({'id': {'type': 'keyword'}, 'session': {'type': 'keyword'}})
+
+    def set_properties(self, properties):
+        self.store.es.indices.get_mapping.return_value = {
+            'jumpserver': {'mappings': {'properties': properties}}
+        }
+
+    def get_queryset(self):
+        from common.plugins.es import QuerySet
+        from terminal.models import Command
+
+        qs = QuerySet(self.store)
+        qs.model = Command
+        return qs.order_by('-timestamp')
+
+    @staticmethod
+    def make_hits(*ids):
+        hits = [
+            {'_id': i, '_source': {'id': i}, 'sort': [1.0, 100, i]}
+            for i in ids
+        ]
+        return {'hits': {'total': {'value': len(hits)}, 'hits': hits}}
+
+    def test_search_after_sort_unique_field(self):
+        self.store.es.search.return_value = self.make_hits('b')
+        list(self.get_queryset().search_after([1.0, 100, 'a'])[:10])
+
+        kwargs = self.store.es.search.call_args.kwargs
+        self.assertEqual(kwargs['sort'], '_score:desc,timestamp:desc,id:asc')
+        self.assertEqual(kwargs['body']['search_after'], [1.0, 100, 'a'])
+        self.assertNotIn('_doc', kwargs['sort'])
+
+    def test_sort_legacy_mapping(self):
+        # 动态映射的 id 是 text 类型, 用 keyword 子字段排序
+        self.set_properties({'id': {'type': 'text'}})
+        self.assertEqual(self.store.get_sorts([]), 'id.keyword:asc')
+
+        # 旧的索引还没有 id 字段
+        del self.store.unique_sort_key
+        self.set_properties({'session': {'type': 'keyword'}})
+        self.assertEqual(self.store.get_sorts([]), '_id:asc')
+
+    def test_iter_all_with_pit(self):
+        self.store.client.open_point_in_time = mock.Mock(return_value='pit-1')
+        self.store.client.close_point_in_time = mock.Mock()
+        self.store.es.search.side_effect = [self.make_hits('a', 'b'), self.make_hits('c')]
+
+        rows = list(self.get_queryset().iterator(chunk_size=2))
+        self.assertEqual([row.id for row in rows], ['a', 'b', 'c'])
+
+        first, second = self.store.es.search.call_args_list
+        self.assertEqual(first.kwargs['sort'], '_score:desc,timestamp:desc,_shard_doc:asc')
+        self.assertEqual(first.kwargs['body']['pit'], {'id': 'pit-1', 'keep_alive': '5m'})
+        self.assertNotIn('index', first.kwargs)
+        self.assertEqual(second.kwargs['body']['search_after'], [1.0, 100, 'b'])
+        self.store.client.close_point_in_time.assert_called_once_with('pit-1')
+
+    def test_iter_all_without_pit(self):
+        # 6.x 不支持 point in time, 用唯一字段兜底
+        self.store.client.open_point_in_time = mock.Mock(return_value=None)
+        self.store.es.search.return_value = self.make_hits('a')
+
+        rows = list(self.get_queryset().iterator(chunk_size=2))
+        self.assertEqual(len(rows), 1)
+        kwargs = self.store.es.search.call_args.kwargs
+        self.assertEqual(kwargs['sort'], '_score:desc,timestamp:desc,id:asc')
+        self.assertNotIn('pit', kwargs['body'])
+
+    def test_make_data_id(self):
+        command = {
+            'user': 'admin', 'asset': 'web', 'account': 'root', 'input': 'ls',
+            'output': '', 'risk_level': RiskLevelChoices.accept,
+            'session': str(uuid.uuid4()), 'timestamp': int(time.time()), 'org_id': '',
+        }
+        self.assertTrue(self.store.make_data(command)['id'])
+        command['id'] = uuid.uuid4()
+        self.assertEqual(self.store.make_data(command)['id'], str(command['id']))
+
+
+class SessionCommandAmountTests(APITestCase):
+    """
+    没有保存命令数量的会话, 列表一页只统计一次, 已结束的会话分批保存
+    """
+
+    def setUp(self):
+        from orgs.models import Organization
+        from orgs.utils import set_current_org
+        from users.models import User
+
+        org = Organization.default()
+        set_current_org(org)
+        self.user = User.objects.create(username='session-admin', name='admin', email='session-admin@example.com')
+        self.user.is_superuser = True
+        self.client.force_authenticate(user=self.user)
+        self.client.credentials(HTTP_X_JMS_ORG=org.id)
+
+        self.store = mock.Mock()
+        patcher = mock.patch(
+            'terminal.models.session.session.get_multi_command_storage', return_value=self.store
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def create_sessions(amount, **kwargs):
+        return [
+            Session.objects.create(user='admin', asset='web', account='root', account_id='', **kwargs)
+            for __ in range(amount)
+        ]
+
+    def test_list_count_once(self):
+        sessions = self.create_sessions(3)
+        saved = self.create_sessions(1, is_finished=True, cmd_amount=5)[0]
+        self.store.count_by_sessions.return_value = {str(s.id): i for i, s in enumerate(sessions)}
+
+        response = self.client.get(reverse('api-terminal:session-list'), {'limit': 10})
+        self.assertEqual(response.status_code, 200)
+        self.store.count_by_sessions.assert_called_once()
+        self.store.count.assert_not_called()
+        counted = {str(i) for i in self.store.count_by_sessions.call_args.args[0]}
+        self.assertEqual(counted, {str(s.id) for s in sessions})
+
+        amounts = {item['id']: item['command_amount'] for item in response.data['results']}
+        expected = {str(s.id): i for i, s in enumerate(sessions)}
+        expected[str(saved.id)] = 5
+        self.assertEqual(amounts, expected)
+
+    def test_finalize_in_batches(self):
+        sessions = self.create_sessions(3, is_finished=True)
+        self.store.count_by_sessions.side_effect = lambda ids: {str(i): 2 for i in ids}
+
+        amount = Session.finalize_command_amount([s.id for s in sessions], batch_size=2)
+        self.assertEqual(amount, 3)
+        self.assertEqual(self.store.count_by_sessions.call_count, 2)
+        self.assertEqual(
+            set(Session.objects.filter(id__in=[s.id for s in sessions]).values_list('cmd_amount', flat=True)),
+            {2}
+        )
+
+    def test_finalize_keep_unsaved_when_count_error(self):
+        sessions = self.create_sessions(2, is_finished=True)
+        self.store.count_by_sessions.side_effect = ConnectionError
+
+        self.assertEqual(Session.finalize_command_amount([s.id for s in sessions]), 0)
+        # 保持 -1, 下次定时任务重试
+        self.assertEqual(
+            set(Session.objects.filter(id__in=[s.id for s in sessions]).values_list('cmd_amount', flat=True)),
+            {-1}
+        )
+
+
+class CommandCountBySessionsTests(SimpleTestCase):
+    def test_es_terms_aggregation(self):
+        from terminal.backends.command.es import CommandStore
+
+        with mock.patch('common.plugins.es.get_es_client_version', return_value=7), \
+                mock.patch.object(CommandStore, 'ping', return_value=False):
+            store = CommandStore({'HOSTS': ['http://127.0.0.1:9200'], 'INDEX': 'jumpserver'})
+        store.es = mock.Mock()
+        store.es.indices.get_mapping.return_value = {
+            'jumpserver': {'mappings': {'properties': {'session': {'type': 'keyword'}}}}
+        }
+        store.es.search.return_value = {'aggregations': {'sessions': {'buckets': [
+            {'key': 'a', 'doc_count': 3}, {'key': 'b', 'doc_count': 1},
+        ]}}}
+
+        self.assertEqual(store.count_by_sessions(['a', 'b', 'c']), {'a': 3, 'b': 1})
+        store.es.search.assert_called_once()
+        body = store.es.search.call_args.kwargs['body']
+        self.assertEqual(body['query']['bool']['filter'], [{'terms': {'session': ['a', 'b', 'c']}}])
+        self.assertEqual(body['aggs']['sessions']['terms']['size'], 3)
+
+        store.es.search.side_effect = ConnectionError
+        with self.assertRaises(ConnectionError):
+            store.count_by_sessions(['a'])
+
+    def test_multi_sum_storages(self):
+        from terminal.backends.command.multi import CommandStore
+
+        first, second = mock.Mock(), mock.Mock()
+        first.count_by_sessions.return_value = {'a': 3, 'b': 1}
+        second.count_by_sessions.return_value = {'a': 2}
+        store = CommandStore([first, second])
+        self.assertEqual(store.count_by_sessions(['a', 'b']), {'a': 5, 'b': 1})
+
+
+class SavedCommandStorage:
+    def __init__(self, ok=True):
+        self.ok = ok
+        self.commands = []
+
+    def bulk_save(self, commands):
+        if self.ok:
+            self.commands.extend(commands)
+        return self.ok
+
+
+@override_settings(COMMAND_INGEST_BATCH_SIZE=2, COMMAND_INGEST_MAX_BATCHES=50, COMMAND_INGEST_MAX_LAG=10)
+class CommandIngestPipelineTests(SimpleTestCase):
+    def setUp(self):
+        self.pipeline = CommandIngestPipeline()
+        key = 'test:command_ingest:{}'.format(uuid.uuid4().hex)
+        self.pipeline.stream_key = key
+        self.pipeline.dead_letter_key = key + ':dead'
+        self.pipeline.retry_base_seconds = 0
+
+    def tearDown(self):
+        self.pipeline.redis.delete(self.pipeline.stream_key, self.pipeline.dead_letter_key)
+
+    def push(self, amount):
+        for i in range(amount):
+            self.pipeline.push([{'input': 'ls {}'.format(i)}])
+
+    def test_run_drain_and_return(self):
+        self.push(5)
+        storage = SavedCommandStorage()
+        self.assertEqual(self.pipeline.run(storage), 5)
+        self.assertEqual(len(storage.commands), 5)
+        self.assertEqual(self.pipeline.get_stream_length(), 0)
+        # 没有消息时不阻塞, 直接返回
+        self.assertEqual(self.pipeline.run(storage), 0)
+
+    def test_run_bounded_batches(self):
+        self.push(5)
+        storage = SavedCommandStorage()
+        self.assertEqual(self.pipeline.run(storage, max_batches=1), 2)
+        self.assertEqual(self.pipeline.get_stream_length(), 3)
+        self.assertEqual(self.pipeline.run(storage), 3)
+
+    def test_backpressure(self):
+        self.push(11)
+        with self.assertRaises(IngestBackpressure):
+            self.push(1)
+
+    def test_failed_retry_then_dead_letter(self):
+        self.push(1)
+        failed = SavedCommandStorage(ok=False)
+        self.assertEqual(self.pipeline.run(failed, max_batches=1), 0)
+        # 写入失败的消息保留, 下次重新认领
+        self.assertEqual(self.pipeline.get_metrics()['pending'], 1)
+
+        for __ in range(self.pipeline.max_retries):
+            self.pipeline.run(failed, max_batches=1)
+        self.assertEqual(self.pipeline.run(SavedCommandStorage(), max_batches=1), 0)
+        metrics = self.pipeline.get_metrics()
+        self.assertEqual((metrics['pending'], metrics['dead_letter']), (0, 1))
@@ -2,7 +2,10 @@
 #
 from itertools import groupby
 
+from django.db.models import Count
+
 from common.utils import get_logger
+from orgs.utils import tmp_to_root_org
 from terminal.const import ComponentLoad, TerminalType
 
 logger = get_logger(__name__)
@@ -58,16 +61,28 @@ class TypedComponentsStatusMetricsUtil(object):
     def __init__(self):
         self.components = []
         self.grouped_components = []
+        self.online_session_counts = {}
         self.get_components()
 
     def get_components(self):
         from ..models import Terminal
-        components = Terminal.objects.filter(is_deleted=False).order_by('type')
+        components = list(Terminal.objects.filter(is_deleted=False).order_by('type'))
+        Terminal.prefetch_status(components)
+        self.online_session_counts = self.get_online_session_counts(components)
         grouped_components = groupby(components, lambda c: c.type)
         grouped_components = [(i[0], list(i[1])) for i in grouped_components]
         self.grouped_components = grouped_components
         self.components = components
 
+    @staticmethod
+    def get_online_session_counts(components):
+        from ..models import Session
+        with tmp_to_root_org():
+            counts = Session.objects.filter(
+                terminal__in=components, is_finished=False
+            ).order_by().values_list('terminal').annotate(count=Count('id'))
+            return {terminal_id: count for terminal_id, count in counts}
+
     def get_metrics(self):
         metrics = []
         for _tp, components in self.grouped_components:
@@ -83,7 +98,7 @@ class TypedComponentsStatusMetricsUtil(object):
             for component in components:
                 metric[component.load].append(component.name)
                 metric['total'] += 1
-                metric['session_active'] += component.get_online_session_count()
+                metric['session_active'] += self.online_session_counts.get(component.id, 0)
             metrics.append(metric)
         return metrics
 
@@ -14,12 +14,13 @@ from orgs.utils import tmp_to_root_org, tmp_to_org
 from rbac.permissions import RBACPermission
 from tickets import filters
 from tickets import serializers
+from tickets.handlers.bulk import BulkTicketHandler
 from tickets.models import (
     Ticket, ApplyAssetTicket, ApplyLoginTicket,
     ApplyLoginAssetTicket, ApplyCommandTicket
 )
 from tickets.permissions.ticket import IsAssignee, IsApplicant
-from ..const import TicketAction
+from ..const import TicketAction, StepState
 
 __all__ = [
     'TicketViewSet', 'ApplyAssetTicketViewSet',
@@ -134,13 +135,14 @@ class TicketViewSet(CommonApiMixin, viewsets.ModelViewSet):
 
         ticket_ids = request.data.get('tickets', [])
         queryset = self.get_queryset().filter(state='pending').filter(id__in=ticket_ids)
-        for obj in queryset:
-            if not obj.has_current_assignee(request.user):
-                return Response(
-                    {'error': f"{_('User does not have permission')}: {obj}"}, status=400
-                )
-            handler = getattr(obj, action_)
-            handler(processor=request.user)
+        handler = BulkTicketHandler(self.model, queryset, request.user)
+        unassigned = handler.get_unassigned_tickets()
+        if unassigned:
+            return Response(
+                {'error': f"{_('User does not have permission')}: {unassigned[0]}"}, status=400
+            )
+        state = StepState.approved if action_ == 'approve' else StepState.rejected
+        handler.process(state)
         return Response('ok')
 
 
@@ -39,6 +39,11 @@ class StepStatus(TextChoices):
     pending = 'pending', _('Pending')
 
 
+class TicketInboxRole(TextChoices):
+    applicant = 'applicant', _('Applicant')
+    assignee = 'assignee', _('Assignee')
+
+
 class TicketAction(TextChoices):
     open = 'open', _("Open")
     close = 'close', _("Close")
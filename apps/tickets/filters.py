@@ -4,8 +4,9 @@ from django_filters import rest_framework as filters
 
 from common.drf.filters import BaseFilterSet
 from orgs.models import Organization
+from tickets.const import TicketInboxRole
 from tickets.models import (
-    Ticket, ApplyAssetTicket,
+    Ticket, TicketInbox, ApplyAssetTicket,
     ApplyLoginTicket, ApplyLoginAssetTicket, ApplyCommandTicket
 )
 
@@ -39,10 +40,10 @@ class TicketFilter(BaseFilterSet):
 
     @staticmethod
     def filter_assignees_id(queryset, name, value):
-        return queryset.filter(
-            ticket_steps__level=F('approval_step'),
-            ticket_steps__ticket_assignees__assignee_id=value
+        ticket_ids = TicketInbox.get_ticket_ids(
+            value, role=TicketInboxRole.assignee, current_step=True
         )
+        return queryset.filter(pk__in=ticket_ids)
 
     @staticmethod
     def filter_relevant_asset(queryset, name, value):
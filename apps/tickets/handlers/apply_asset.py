@@ -1,9 +1,15 @@
+from collections import defaultdict
+
+from django.db import transaction
 from django.utils.translation import gettext as _
 
+from common.signals import post_bulk_create
 from common.utils import get_logger
-from orgs.utils import tmp_to_org
+from orgs.utils import tmp_to_org, tmp_to_root_org
 from perms.models import AssetPermission
-from tickets.models import ApplyAssetTicket
+from perms.utils import UserPermTreeExpireUtil
+from tickets.const import TicketState, StepState
+from tickets.models import ApplyAssetTicket, TicketAssignee
 from .base import BaseHandler
 
 logger = get_logger(__file__)
@@ -17,6 +23,111 @@ class Handler(BaseHandler):
         if is_finished:
             self._create_asset_permission()
 
+    @classmethod
+    def on_bulk_steps_finished(cls, tickets, state):
+        if state != TicketState.approved:
+            return
+        cls.bulk_create_asset_permissions(tickets)
+
+    @staticmethod
+    def get_permission_comment(ticket, processors):
+        return _(
+            'Created by the ticket '
+            'ticket title: {} '
+            'ticket applicant: {} '
+            'ticket processor: {} '
+            'ticket ID: {}'
+        ).format(ticket.title, ticket.applicant, ','.join(processors), str(ticket.id))
+
+    @staticmethod
+    def get_permission_data(ticket, comment):
+        return {
+            'from_ticket': True,
+            'id': ticket.id,
+            'actions': ticket.apply_actions,
+            'accounts': ticket.apply_accounts,
+            'name': ticket.apply_permission_name,
+            'date_start': ticket.apply_date_start,
+            'date_expired': ticket.apply_date_expired,
+            'comment': str(comment),
+            'created_by': '{}:{}'.format(ticket.__class__.__name__, str(ticket.id)),
+        }
+
+    @staticmethod
+    def bulk_add_m2m(descriptor, pairs):
+        through = descriptor.through
+        source = descriptor.field.m2m_field_name()
+        target = descriptor.field.m2m_reverse_field_name()
+        objs = [
+            through(**{f'{source}_id': source_id, f'{target}_id': target_id})
+            for source_id, target_id in pairs
+        ]
+        through.objects.bulk_create(objs, ignore_conflicts=True)
+
+    @classmethod
+    def bulk_create_asset_permissions(cls, tickets):
+        """
+        批量审批通过的工单一次创建授权, 节点、资产、用户的关系直接写中间表,
+        不逐条触发 m2m_changed, 最后统一过期这些授权的用户授权树
+        """
+        with tmp_to_root_org():
+            existed = set(AssetPermission.objects.filter(
+                id__in=[t.id for t in tickets]
+            ).values_list('id', flat=True))
+        tickets = [t for t in tickets if t.id not in existed]
+        if not tickets:
+            return []
+
+        ticket_ids = [t.id for t in tickets]
+        processors = defaultdict(list)
+        ticket_assignees = TicketAssignee.objects \
+            .filter(step__ticket_id__in=ticket_ids) \
+            .exclude(state=StepState.pending) \
+            .select_related('assignee', 'step') \
+            .order_by('step__level')
+        for i in ticket_assignees:
+            if i.state == i.step.state:
+                processors[i.step.ticket_id].append(str(i.assignee))
+
+        perms = []
+        for ticket in tickets:
+            comment = cls.get_permission_comment(ticket, processors[ticket.id])
+            data = cls.get_permission_data(ticket, comment)
+            perms.append(AssetPermission(org_id=ticket.org_id, **data))
+
+        nodes = ApplyAssetTicket.apply_nodes.through.objects \
+            .filter(applyassetticket_id__in=ticket_ids) \
+            .values_list('applyassetticket_id', 'node_id')
+        assets = ApplyAssetTicket.apply_assets.through.objects \
+            .filter(applyassetticket_id__in=ticket_ids) \
+            .values_list('applyassetticket_id', 'asset_id')
+        users = [(t.id, t.applicant_id) for t in tickets if t.applicant_id]
+        # 非 root 组织下 OrgManager.bulk_create 会把 org_id 改成当前组织,
+        # 授权要保留工单的组织, 在 root 组织下创建
+        with tmp_to_root_org():
+            AssetPermission.objects.bulk_create(perms)
+            cls.bulk_add_m2m(AssetPermission.nodes, nodes)
+            cls.bulk_add_m2m(AssetPermission.assets, assets)
+            cls.bulk_add_m2m(AssetPermission.users, users)
+
+        # bulk_create 不触发 post_save, 按组织补发信号记录操作日志
+        org_perms = defaultdict(list)
+        for perm in perms:
+            org_perms[perm.org_id].append(perm)
+        for org_id, instances in org_perms.items():
+            with tmp_to_org(org_id):
+                post_bulk_create.send(sender=AssetPermission, instances=instances)
+
+        perm_ids = [p.id for p in perms]
+
+        def expire_caches():
+            # 审批人所在组织不一定是工单的组织, 在 root 组织下按授权的组织分别过期
+            with tmp_to_root_org():
+                UserPermTreeExpireUtil().expire_perm_tree_for_perms(perm_ids)
+
+        transaction.on_commit(expire_caches)
+        return perms
+
     def _create_asset_permission(self):
         org_id = self.ticket.org_id
         with tmp_to_org(org_id):
@@ -27,38 +138,9 @@ class Handler(BaseHandler):
             apply_nodes = self.ticket.apply_nodes.all()
             apply_assets = self.ticket.apply_assets.all()
 
-        apply_permission_name = self.ticket.apply_permission_name
-        apply_actions = self.ticket.apply_actions
-        apply_accounts = self.ticket.apply_accounts
-        apply_date_start = self.ticket.apply_date_start
-        apply_date_expired = self.ticket.apply_date_expired
-        permission_created_by = '{}:{}'.format(
-            str(self.ticket.__class__.__name__), str(self.ticket.id)
-        )
-        permission_comment = _(
-            'Created by the ticket '
-            'ticket title: {} '
-            'ticket applicant: {} '
-            'ticket processor: {} '
-            'ticket ID: {}'
-        ).format(
-            self.ticket.title,
-            self.ticket.applicant,
-            ','.join([i['processor_display'] for i in self.ticket.process_map]),
-            str(self.ticket.id)
-        )
-
-        permission_data = {
-            'from_ticket': True,
-            'id': self.ticket.id,
-            'actions': apply_actions,
-            'accounts': apply_accounts,
-            'name': apply_permission_name,
-            'date_start': apply_date_start,
-            'date_expired': apply_date_expired,
-            'comment': str(permission_comment),
-            'created_by': permission_created_by,
-        }
+        processors = [i['processor_display'] for i in self.ticket.process_map]
+        permission_comment = self.get_permission_comment(self.ticket, processors)
+        permission_data = self.get_permission_data(self.ticket, permission_comment)
         with tmp_to_org(self.ticket.org_id):
             asset_permission = AssetPermission.objects.create(**permission_data)
             asset_permission.nodes.set(apply_nodes)
@@ -42,6 +42,11 @@ class BaseHandler:
     def _on_step_rejected(self, step):
         self._send_processed_mail_to_applicant(step)
 
+    @classmethod
+    def on_bulk_steps_finished(cls, tickets, state):
+        """ 批量审批时, 已经结束的工单 (state 都相同) 的后续处理, 通知由任务发送 """
+        pass
+
     def _on_step_closed(self, step):
         self._send_processed_mail_to_applicant()
 
@@ -91,13 +96,8 @@ class BaseHandler:
         else:
             user = self.ticket.processor
 
-        user_display = str(user)
-        state_display = getattr(TicketState, state).label
-        approve_info = _('{} {} the ticket').format(user_display, state_display)
         context = self._diff_prev_approve_context(state)
-        context.update({'approve_info': approve_info})
-        html_str = render_to_string('tickets/ticket_approve_diff.html', context)
-        body = convert_html_to_markdown(html_str)
+        body = self.get_state_change_comment_body(user, state, context)
         data = {
             'body': body,
             'user': user,
@@ -106,3 +106,11 @@ class BaseHandler:
             'state': state
         }
         return self.ticket.comments.create(**data)
+
+    @staticmethod
+    def get_state_change_comment_body(user, state, context=None):
+        state_display = getattr(TicketState, state).label
+        approve_info = _('{} {} the ticket').format(str(user), state_display)
+        context = dict(context or {}, approve_info=approve_info)
+        html_str = render_to_string('tickets/ticket_approve_diff.html', context)
+        return convert_html_to_markdown(html_str)
@@ -0,0 +1,119 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from common.utils import get_logger
+from tickets.const import TicketStatus, StepState, StepStatus, TicketInboxRole
+from tickets.models import Ticket, TicketStep, TicketAssignee, TicketInbox, Comment
+
+logger = get_logger(__name__)
+
+__all__ = ['BulkTicketHandler']
+
+
+class BulkTicketHandler:
+    """
+    批量审批同一类型的工单, 按集合处理, 查询次数和工单数量无关
+
+    - 一次查询校验处理人是否是所有工单当前步骤的审批人
+    - 审批人、步骤、工单、收件箱的状态都用 update 批量修改
+    - 结束的工单交给对应类型 Handler 的 on_bulk_steps_finished 批量处理
+    - 通知在事务提交后由后台任务发送
+    """
+
+    def __init__(self, model, tickets, processor):
+        self.model = model
+        self.tickets = list(tickets)
+        self.processor = processor
+
+    def get_unassigned_tickets(self):
+        ticket_ids = TicketInbox.objects.filter(
+            ticket_id__in=[t.pk for t in self.tickets], user=self.processor,
+            role=TicketInboxRole.assignee, is_current_step=True
+        ).values_list('ticket_id', flat=True)
+        ticket_ids = set(ticket_ids)
+        return [t for t in self.tickets if t.pk not in ticket_ids]
+
+    @property
+    def handler_class(self):
+        ticket_type = self.model.TICKET_TYPE
+        return import_string('tickets.handlers.{}.Handler'.format(ticket_type))
+
+    def get_steps(self, offset=0):
+        steps = TicketStep.objects.filter(
+            ticket_id__in=[t.pk for t in self.tickets],
+            level=F('ticket__approval_step') + offset
+        )
+        if offset:
+            steps = steps.filter(status=StepStatus.pending)
+        return {step.ticket_id: step for step in steps}
+
+    def create_comments(self, state):
+        body = self.handler_class.get_state_change_comment_body(self.processor, state)
+        comments = [
+            Comment(
+                ticket_id=ticket.pk, user=self.processor, user_display=str(self.processor),
+                body=body, type='state', state=state
+            )
+            for ticket in self.tickets
+        ]
+        Comment.objects.bulk_create(comments)
+
+    def process(self, state):
+        if state not in (StepState.approved, StepState.rejected):
+            raise ValueError("Not supported state: {}".format(state))
+        if not self.tickets:
+            return
+
+        current_steps = self.get_steps()
+        next_steps = {} if state == StepState.rejected else self.get_steps(offset=1)
+        finished = [t for t in self.tickets if t.pk not in next_steps]
+        advanced = [t for t in self.tickets if t.pk in next_steps]
+        finished_ids = [t.pk for t in finished]
+        advanced_ids = [t.pk for t in advanced]
+        now = timezone.now()
+
+        with transaction.atomic():
+            TicketAssignee.objects.filter(
+                step_id__in=[s.pk for s in current_steps.values()], assignee=self.processor
+            ).update(state=state, date_updated=now)
+            TicketStep.objects.filter(pk__in=[s.pk for s in current_steps.values()]) \
+                .update(state=state, status=StepStatus.closed, date_updated=now)
+
+            if finished_ids:
+                Ticket.objects.filter(pk__in=finished_ids) \
+                    .update(state=state, status=TicketStatus.closed, date_updated=now)
+                TicketInbox.objects.filter(ticket_id__in=finished_ids).update(state=state)
+            if advanced_ids:
+                steps = [next_steps[pk] for pk in advanced_ids]
+                TicketStep.objects.filter(pk__in=[s.pk for s in steps]) \
+                    .update(status=StepStatus.active, date_updated=now)
+                Ticket.objects.filter(pk__in=advanced_ids) \
+                    .update(approval_step=F('approval_step') + 1, date_updated=now)
+                TicketInbox.set_current_steps(steps)
+
+            for ticket in finished:
+                ticket.state = state
+                ticket.status = TicketStatus.closed
+            for ticket in advanced:
+                ticket.approval_step += 1
+
+            self.create_comments(state)
+            if finished:
+                self.handler_class.on_bulk_steps_finished(finished, state)
+
+        logger.debug('Bulk {} tickets: finished {}, advanced {}'.format(
+            state, len(finished_ids), len(advanced_ids)
+        ))
+        self.send_messages_on_commit()
+
+    def send_messages_on_commit(self):
+        from tickets.tasks import send_bulk_processed_ticket_messages
+
+        model_label = self.model._meta.label
+        ticket_ids = [str(t.pk) for t in self.tickets]
+        processor_id = str(self.processor.pk)
+        transaction.on_commit(
+            lambda: send_bulk_processed_ticket_messages.delay(model_label, ticket_ids, processor_id)
+        )
@@ -1,3 +1,4 @@
+from tickets.const import TicketState
 from tickets.models import ApplyLoginAssetTicket
 from .base import BaseHandler
 
@@ -10,3 +11,10 @@ class Handler(BaseHandler):
         if is_finished:
             self.ticket.activate_connection_token_if_need()
         return is_finished
+
+    @classmethod
+    def on_bulk_steps_finished(cls, tickets, state):
+        if state != TicketState.approved:
+            return
+        for ticket in tickets:
+            ticket.activate_connection_token_if_need()
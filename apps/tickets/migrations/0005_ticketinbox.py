@@ -0,0 +1,72 @@
+# Generated by Django 4.1.13 on 2026-10-18 10:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def migrate_ticket_inbox(apps, schema_editor):
+    ticket_model = apps.get_model('tickets', 'Ticket')
+    assignee_model = apps.get_model('tickets', 'TicketAssignee')
+    inbox_model = apps.get_model('tickets', 'TicketInbox')
+    batch_size = 2000
+
+    objs = []
+    tickets = ticket_model.objects.exclude(applicant_id=None) \
+        .values_list('id', 'applicant_id', 'state')
+    for ticket_id, user_id, state in tickets.iterator(chunk_size=batch_size):
+        objs.append(inbox_model(
+            user_id=user_id, ticket_id=ticket_id, role='applicant', state=state
+        ))
+        if len(objs) >= batch_size:
+            inbox_model.objects.bulk_create(objs, ignore_conflicts=True)
+            objs = []
+
+    # 同一个工单的审批人连续处理, 一个用户在多个步骤中时, 只要有一个是当前步骤
+    assignees = assignee_model.objects.order_by('step__ticket_id').values_list(
+        'assignee_id', 'step__ticket_id', 'step__level',
+        'step__ticket__approval_step', 'step__ticket__state'
+    )
+    current_ticket_id, ticket_objs = None, {}
+    for user_id, ticket_id, level, approval_step, state in assignees.iterator(chunk_size=batch_size):
+        if ticket_id != current_ticket_id:
+            objs.extend(ticket_objs.values())
+            current_ticket_id, ticket_objs = ticket_id, {}
+            if len(objs) >= batch_size:
+                inbox_model.objects.bulk_create(objs, ignore_conflicts=True)
+                objs = []
+        obj = ticket_objs.get(user_id)
+        if obj is None:
+            obj = ticket_objs[user_id] = inbox_model(
+                user_id=user_id, ticket_id=ticket_id, role='assignee', state=state
+            )
+        obj.is_current_step = obj.is_current_step or level == approval_step
+    objs.extend(ticket_objs.values())
+    inbox_model.objects.bulk_create(objs, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tickets', '0004_replace_assignees_to_users'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketInbox',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('role', models.CharField(choices=[('applicant', 'Applicant'), ('assignee', 'Assignee')], max_length=16, verbose_name='Role')),
+                ('is_current_step', models.BooleanField(default=False, verbose_name='Current step')),
+                ('state', models.CharField(choices=[('all', 'All'), ('pending', 'Open'), ('closed', 'Cancel'), ('approved', 'Approved'), ('rejected', 'Rejected')], default='pending', max_length=16, verbose_name='State')),
+                ('ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox', to='tickets.ticket', verbose_name='Ticket')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ticket_inbox', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Ticket inbox',
+                'unique_together': {('user', 'ticket', 'role')},
+                'indexes': [models.Index(fields=['user', 'role', 'is_current_step', 'state'], name='tickets_inbox_user_state_idx')],
+            },
+        ),
+        migrations.RunPython(migrate_ticket_inbox, migrations.RunPython.noop),
+    ]
@@ -3,8 +3,8 @@
 import json
 from typing import Callable
 
-from django.db import models
-from django.db.models import Prefetch, Q
+from django.db import models, transaction
+from django.db.models import Prefetch, Exists, OuterRef
 from django.db.models.fields import related
 from django.db.utils import IntegrityError
 from django.forms import model_to_dict
@@ -21,7 +21,7 @@ from orgs.models import Organization
 from orgs.utils import tmp_to_org
 from tickets.const import (
     TicketType, TicketStatus, TicketState,
-    TicketLevel, StepState, StepStatus
+    TicketLevel, StepState, StepStatus, TicketInboxRole
 )
 from tickets.errors import AlreadyClosed
 from tickets.handlers import get_ticket_handler
@@ -30,7 +30,7 @@ from ..flow import TicketFlow
 logger = get_logger(__file__)
 
 __all__ = [
-    'Ticket', 'TicketStep', 'TicketAssignee',
+    'Ticket', 'TicketStep', 'TicketAssignee', 'TicketInbox',
     'SuperTicket', 'SubTicketManager'
 ]
 
@@ -65,7 +65,9 @@ class TicketStep(JMSBaseModel):
 
     def set_active(self):
         self.status = StepStatus.active
-        self.save(update_fields=['status'])
+        with transaction.atomic():
+            self.save(update_fields=['status'])
+            TicketInbox.set_current_step(self)
 
     def next(self):
         kwargs = dict(ticket=self.ticket, level=self.level + 1, status=StepStatus.pending)
@@ -101,6 +103,95 @@ class TicketAssignee(JMSBaseModel):
         return '{0.assignee.name}({0.assignee.username})_{0.step}'.format(self)
 
 
+class TicketInbox(models.Model):
+    """
+    用户相关的工单, 工单流转时维护, 工单列表, 待审批数量等只查这一张表
+    state 同步工单的 state, is_current_step 表示用户是不是当前步骤的审批人
+    """
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(
+        'users.User', related_name='ticket_inbox',
+        on_delete=models.CASCADE, verbose_name=_('User')
+    )
+    ticket = models.ForeignKey(
+        'tickets.Ticket', related_name='inbox',
+        on_delete=models.CASCADE, verbose_name=_('Ticket')
+    )
+    role = models.CharField(max_length=16, choices=TicketInboxRole.choices, verbose_name=_('Role'))
+    is_current_step = models.BooleanField(default=False, verbose_name=_('Current step'))
+    state = models.CharField(
+        max_length=16, choices=TicketState.choices,
+        default=TicketState.pending, verbose_name=_('State')
+    )
+
+    class Meta:
+        verbose_name = _('Ticket inbox')
+        unique_together = ('user', 'ticket', 'role')
+        indexes = [
+            models.Index(
+                fields=['user', 'role', 'is_current_step', 'state'],
+                name='tickets_inbox_user_state_idx'
+            ),
+        ]
+
+    @classmethod
+    def add_applicant(cls, ticket):
+        if not ticket.applicant_id:
+            return
+        obj = cls(
+            user_id=ticket.applicant_id, ticket=ticket,
+            role=TicketInboxRole.applicant, state=ticket.state
+        )
+        cls.objects.bulk_create([obj], ignore_conflicts=True)
+
+    @classmethod
+    def add_assignees(cls, ticket, users, is_current_step):
+        """ 同一个用户在多个步骤中只有一条, 以先加入的步骤为准 """
+        objs = [
+            cls(
+                user_id=getattr(user, 'pk', user), ticket=ticket,
+                role=TicketInboxRole.assignee,
+                is_current_step=is_current_step, state=ticket.state
+            )
+            for user in users
+        ]
+        cls.objects.bulk_create(objs, ignore_conflicts=True)
+
+    @classmethod
+    def set_current_step(cls, step):
+        cls.set_current_steps([step])
+
+    @classmethod
+    def set_current_steps(cls, steps):
+        """ 多个工单同时进入下一步, 每个工单只更新它自己步骤的审批人 """
+        step_ids = [step.pk for step in steps]
+        in_step = Exists(TicketAssignee.objects.filter(
+            step_id__in=step_ids, step__ticket_id=OuterRef('ticket_id'),
+            assignee_id=OuterRef('user_id')
+        ))
+        queryset = cls.objects.filter(
+            ticket_id__in=[step.ticket_id for step in steps],
+            role=TicketInboxRole.assignee
+        )
+        queryset.filter(~in_step).update(is_current_step=False)
+        queryset.filter(in_step).update(is_current_step=True)
+
+    @classmethod
+    def sync_state(cls, ticket):
+        cls.objects.filter(ticket_id=ticket.pk).update(state=ticket.state)
+
+    @classmethod
+    def get_ticket_ids(cls, user, role=None, current_step=None, state=None):
+        queryset = cls.objects.filter(user=user)
+        if role:
+            queryset = queryset.filter(role=role)
+        if current_step is not None:
+            queryset = queryset.filter(is_current_step=current_step)
+        if state:
+            queryset = queryset.filter(state=state)
+        return queryset.values('ticket_id')
+
+
 class StatusMixin:
     State = TicketState
     Status = TicketStatus
@@ -130,6 +221,7 @@ class StatusMixin:
     def _open(self):
         self.set_serial_num()
         self.set_rel_snapshot()
+        TicketInbox.add_applicant(self)
         self._change_state_by_applicant(TicketState.pending)
 
     def open(self):
@@ -159,7 +251,9 @@ class StatusMixin:
             raise ValueError("Not supported state: {}".format(state))
 
         self.state = state
-        self.save(update_fields=['state', 'status'])
+        with transaction.atomic():
+            self.save(update_fields=['state', 'status'])
+            TicketInbox.sync_state(self)
         self.handler.on_change_state(state)
 
     def _change_state(self, state, processor):
@@ -176,13 +270,16 @@ class StatusMixin:
         if state in [TicketState.rejected, TicketState.closed] or not next_step:
             self.state = state
             self.status = Ticket.Status.closed
-            self.save(update_fields=['state', 'status'])
+            with transaction.atomic():
+                self.save(update_fields=['state', 'status'])
+                TicketInbox.sync_state(self)
             self.handler.on_step_state_change(current_step, state)
         else:
             self.handler.on_step_state_change(current_step, state)
-            next_step.set_active()
-            self.approval_step += 1
-            self.save(update_fields=['approval_step'])
+            with transaction.atomic():
+                next_step.set_active()
+                self.approval_step += 1
+                self.save(update_fields=['approval_step'])
 
     @property
     def process_map(self):
@@ -231,15 +328,19 @@ class StatusMixin:
         for rule in flow_rules:
             assignees = rule.get_assignees(org_id=org_id)
             assignees = self.exclude_applicant(assignees, self.applicant)
-            step = TicketStep.objects.create(ticket=self, level=rule.level)
-            step_assignees = [TicketAssignee(step=step, assignee=user) for user in assignees]
-            TicketAssignee.objects.bulk_create(step_assignees)
+            with transaction.atomic():
+                step = TicketStep.objects.create(ticket=self, level=rule.level)
+                step_assignees = [TicketAssignee(step=step, assignee=user) for user in assignees]
+                TicketAssignee.objects.bulk_create(step_assignees)
+                TicketInbox.add_assignees(self, assignees, rule.level == self.approval_step)
 
     def create_process_steps_by_assignees(self, assignees):
-        step = TicketStep.objects.create(ticket=self, level=1)
         assignees = self.exclude_applicant(assignees, self.applicant)
-        ticket_assignees = [TicketAssignee(step=step, assignee=user) for user in assignees]
-        TicketAssignee.objects.bulk_create(ticket_assignees)
+        with transaction.atomic():
+            step = TicketStep.objects.create(ticket=self, level=1)
+            ticket_assignees = [TicketAssignee(step=step, assignee=user) for user in assignees]
+            TicketAssignee.objects.bulk_create(ticket_assignees)
+            TicketInbox.add_assignees(self, assignees, step.level == self.approval_step)
 
     @property
     def current_step(self):
@@ -256,13 +357,15 @@ class StatusMixin:
         return self.current_step.processor
 
     def has_current_assignee(self, assignee):
-        return self.ticket_steps.filter(
-            level=self.approval_step,
-            ticket_assignees__assignee=assignee,
+        return TicketInbox.objects.filter(
+            ticket_id=self.pk, user=assignee,
+            role=TicketInboxRole.assignee, is_current_step=True
         ).exists()
 
     def has_all_assignee(self, assignee):
-        return self.ticket_steps.filter(ticket_assignees__assignee=assignee).exists()
+        return TicketInbox.objects.filter(
+            ticket_id=self.pk, user=assignee, role=TicketInboxRole.assignee
+        ).exists()
 
     @property
     def handler(self):
@@ -343,14 +446,12 @@ class Ticket(StatusMixin, JMSBaseModel):
 
     @classmethod
     def get_user_related_tickets(cls, user):
-        queries = Q(applicant=user) | Q(ticket_steps__ticket_assignees__assignee=user)
         # TODO: 与 StatusMixin.process_map 内连表查询有部分重叠 有优化空间 待验证排除是否不影响其它调用
         prefetch_ticket_assignee = Prefetch('ticket_steps__ticket_assignees',
                                             queryset=TicketAssignee.objects.select_related('assignee'), )
         tickets = cls.objects.prefetch_related(prefetch_ticket_assignee) \
             .select_related('applicant') \
-            .filter(queries) \
-            .distinct()
+            .filter(pk__in=TicketInbox.get_ticket_ids(user))
         return tickets
 
     def get_current_ticket_flow_approve(self):
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+#
+from celery import shared_task
+from django.apps import apps
+from django.utils.translation import gettext_lazy as _
+
+from common.utils import get_logger
+from orgs.utils import tmp_to_root_org
+from users.models import User
+from .const import TicketStatus
+from .utils import send_ticket_processed_mail_to_applicant, send_ticket_applied_mail_to_assignees
+
+logger = get_logger(__file__)
+
+
+@shared_task(
+    verbose_name=_('Send bulk processed ticket messages'),
+    description=_(
+        "After tickets are approved or rejected in bulk, notify the applicants, "
+        "and notify the assignees of the next step if the ticket is not finished"
+    )
+)
+def send_bulk_processed_ticket_messages(model_label, ticket_ids, processor_id):
+    model = apps.get_model(model_label)
+    processor = User.objects.filter(id=processor_id).first()
+    with tmp_to_root_org():
+        tickets = model.objects.filter(id__in=ticket_ids).select_related('applicant')
+        for ticket in tickets:
+            try:
+                send_ticket_processed_mail_to_applicant(ticket, processor)
+                if ticket.status == TicketStatus.open:
+                    send_ticket_applied_mail_to_assignees(ticket, ticket.current_assignees)
+            except Exception as e:
+                logger.error('Send ticket {} messages error: {}'.format(ticket.id, e))
@@ -0,0 +1,143 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from common.utils import random_string
+from orgs.models import Organization
+from orgs.utils import tmp_to_org, tmp_to_root_org
+from perms.models import AssetPermission
+from tickets.const import TicketState, TicketStatus, StepState, StepStatus, TicketInboxRole
+from tickets.handlers.bulk import BulkTicketHandler
+from tickets.models import (
+    Ticket, ApplyAssetTicket, TicketStep, TicketAssignee, TicketInbox, Comment
+)
+from users.models import User
+
+
+class BulkTicketHandlerTests(TestCase):
+    def setUp(self):
+        self.applicant = self.create_user('applicant')
+        self.first = self.create_user('first')
+        self.second = self.create_user('second')
+
+    @staticmethod
+    def create_user(name):
+        name = '{}-{}'.format(name, random_string(6).lower())
+        return User.objects.create(username=name, name=name, email=name + '@example.com')
+
+    def create_ticket(self, model=Ticket, levels=None, **kwargs):
+        levels = levels or [[self.first]]
+        kwargs.setdefault('org_id', Organization.DEFAULT_ID)
+        ticket = model.objects.create(
+            title='ticket-' + random_string(6), applicant=self.applicant, **kwargs
+        )
+        TicketInbox.add_applicant(ticket)
+        for level, assignees in enumerate(levels, start=1):
+            status = StepStatus.active if level == 1 else StepStatus.pending
+            step = TicketStep.objects.create(ticket=ticket, level=level, status=status)
+            TicketAssignee.objects.bulk_create([
+                TicketAssignee(step=step, assignee=user) for user in assignees
+            ])
+            TicketInbox.add_assignees(ticket, assignees, level == 1)
+        return ticket
+
+    def current_assignee_ids(self, ticket):
+        return set(TicketInbox.objects.filter(
+            ticket=ticket, role=TicketInboxRole.assignee, is_current_step=True
+        ).values_list('user_id', flat=True))
+
+    def test_unassigned_tickets(self):
+        assigned = self.create_ticket()
+        other = self.create_ticket(levels=[[self.second]])
+        handler = BulkTicketHandler(Ticket, [assigned, other], self.first)
+        self.assertEqual(handler.get_unassigned_tickets(), [other])
+
+    def test_approve_finish_and_advance(self):
+        single = self.create_ticket()
+        multi = self.create_ticket(levels=[[self.first], [self.second]])
+        BulkTicketHandler(Ticket, [single, multi], self.first).process(StepState.approved)
+
+        single.refresh_from_db()
+        self.assertEqual(single.state, TicketState.approved)
+        self.assertEqual(single.status, TicketStatus.closed)
+        self.assertEqual(
+            set(single.inbox.values_list('state', flat=True)), {TicketState.approved}
+        )
+
+        multi.refresh_from_db()
+        self.assertEqual(multi.state, TicketState.pending)
+        self.assertEqual(multi.status, TicketStatus.open)
+        self.assertEqual(multi.approval_step, 2)
+        steps = {s.level: s for s in multi.ticket_steps.all()}
+        self.assertEqual((steps[1].state, steps[1].status), (StepState.approved, StepStatus.closed))
+        self.assertEqual(steps[2].status, StepStatus.active)
+        self.assertEqual(self.current_assignee_ids(multi), {self.second.id})
+        self.assertEqual(
+            TicketAssignee.objects.get(step=steps[1], assignee=self.first).state, StepState.approved
+        )
+
+        comments = Comment.objects.filter(ticket_id__in=[single.id, multi.id], type='state')
+        self.assertEqual(comments.count(), 2)
+
+    def test_queries_independent_of_tickets_count(self):
+        def process(amount):
+            tickets = [self.create_ticket(levels=[[self.first], [self.second]]) for __ in range(amount)]
+            with CaptureQueriesContext(connection) as ctx:
+                BulkTicketHandler(Ticket, tickets, self.first).process(StepState.approved)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(process(1), process(5))
+
+    def test_reject_close(self):
+        ticket = self.create_ticket(levels=[[self.first], [self.second]])
+        BulkTicketHandler(Ticket, [ticket], self.first).process(StepState.rejected)
+
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.state, TicketState.rejected)
+        self.assertEqual(ticket.status, TicketStatus.closed)
+        self.assertEqual(ticket.approval_step, 1)
+        step = ticket.ticket_steps.get(level=2)
+        self.assertEqual(step.status, StepStatus.pending)
+
+    def test_unsupported_state(self):
+        ticket = self.create_ticket()
+        with self.assertRaises(ValueError):
+            BulkTicketHandler(Ticket, [ticket], self.first).process(TicketState.closed)
+
+    def test_apply_asset_permissions_in_ticket_orgs(self):
+        org = Organization.objects.create(name='org-' + random_string(6))
+        tickets = [
+            self.create_ticket(
+                ApplyAssetTicket, org_id=org_id,
+                apply_permission_name='perm-' + random_string(6)
+            )
+            for org_id in (Organization.DEFAULT_ID, str(org.id))
+        ]
+        # 审批人当前在默认组织, 创建的授权仍然属于工单的组织
+        with tmp_to_org(Organization.DEFAULT_ID):
+            BulkTicketHandler(ApplyAssetTicket, tickets, self.first).process(StepState.approved)
+
+        with tmp_to_root_org():
+            perms = {str(p.id): p for p in AssetPermission.objects.all()}
+        for ticket in tickets:
+            perm = perms[str(ticket.id)]
+            self.assertEqual(str(perm.org_id), str(ticket.org_id))
+            self.assertTrue(perm.from_ticket)
+            self.assertEqual(list(perm.users.values_list('id', flat=True)), [self.applicant.id])
+            self.assertIn(str(self.first), perm.comment)
+
+    def test_apply_asset_permission_approved_from_other_org(self):
+        other = Organization.objects.create(name='org-' + random_string(6))
+        ticket = self.create_ticket(
+            ApplyAssetTicket, org_id=Organization.DEFAULT_ID,
+            apply_permission_name='perm-' + random_string(6)
+        )
+        # 当前组织不是工单的组织, 授权不能创建到当前组织
+        with tmp_to_org(other):
+            BulkTicketHandler(ApplyAssetTicket, [ticket], self.first).process(StepState.approved)
+
+        with tmp_to_root_org():
+            perm = AssetPermission.objects.get(id=ticket.id)
+        self.assertEqual(str(perm.org_id), Organization.DEFAULT_ID)
+        with tmp_to_org(other):
+            self.assertFalse(AssetPermission.objects.filter(id=ticket.id).exists())
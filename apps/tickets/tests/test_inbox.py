@@ -0,0 +1,101 @@
+from importlib import import_module
+from unittest import mock
+
+from django.apps import apps
+from django.test import TestCase
+
+from common.utils import random_string
+from orgs.models import Organization
+from tickets.const import TicketState, StepStatus, TicketInboxRole
+from tickets.models import Ticket, TicketStep, TicketAssignee, TicketInbox
+from users.models import User
+
+
+class TicketInboxTests(TestCase):
+    def setUp(self):
+        self.applicant = self.create_user('applicant')
+        self.first = self.create_user('first')
+        self.second = self.create_user('second')
+        # 不发送通知
+        patcher = mock.patch.object(Ticket, 'handler', new_callable=mock.PropertyMock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def create_user(name):
+        name = '{}-{}'.format(name, random_string(6).lower())
+        return User.objects.create(username=name, name=name, email=name + '@example.com')
+
+    def create_ticket(self):
+        return Ticket.objects.create(
+            title='ticket-' + random_string(6), applicant=self.applicant,
+            org_id=Organization.DEFAULT_ID
+        )
+
+    def create_steps(self, ticket, levels):
+        for level, assignees in enumerate(levels, start=1):
+            status = StepStatus.active if level == 1 else StepStatus.pending
+            step = TicketStep.objects.create(ticket=ticket, level=level, status=status)
+            TicketAssignee.objects.bulk_create([
+                TicketAssignee(step=step, assignee=user) for user in assignees
+            ])
+
+    def get_inbox(self, ticket):
+        return {
+            (row.user_id, row.role): (row.is_current_step, row.state)
+            for row in TicketInbox.objects.filter(ticket=ticket)
+        }
+
+    def test_maintain_on_open_and_approve(self):
+        ticket = self.create_ticket()
+        ticket.open_by_system([self.first])
+        self.assertEqual(self.get_inbox(ticket), {
+            (self.applicant.id, TicketInboxRole.applicant): (False, TicketState.pending),
+            (self.first.id, TicketInboxRole.assignee): (True, TicketState.pending),
+        })
+        self.assertTrue(ticket.has_current_assignee(self.first))
+        for user in (self.applicant, self.first):
+            self.assertEqual(list(Ticket.get_user_related_tickets(user)), [ticket])
+        self.assertFalse(Ticket.get_user_related_tickets(self.second).exists())
+
+        ticket.approve(self.first)
+        self.assertEqual(
+            {state for __, state in self.get_inbox(ticket).values()}, {TicketState.approved}
+        )
+
+    def test_move_current_step(self):
+        ticket = self.create_ticket()
+        self.create_steps(ticket, [[self.first], [self.second]])
+        TicketInbox.add_assignees(ticket, [self.first], True)
+        TicketInbox.add_assignees(ticket, [self.second], False)
+
+        ticket.approve(self.first)
+        self.assertFalse(ticket.has_current_assignee(self.first))
+        self.assertTrue(ticket.has_current_assignee(self.second))
+        self.assertTrue(ticket.has_all_assignee(self.first))
+
+    def test_backfill(self):
+        migration = import_module('tickets.migrations.0005_ticketinbox')
+        ticket = self.create_ticket()
+        Ticket.objects.filter(pk=ticket.pk).update(approval_step=2)
+        # first 同时在两个步骤中, 只要有一个是当前步骤
+        self.create_steps(ticket, [[self.first], [self.first, self.second]])
+        closed = self.create_ticket()
+        Ticket.objects.filter(pk=closed.pk).update(state=TicketState.rejected)
+        self.create_steps(closed, [[self.second]])
+        TicketInbox.objects.all().delete()
+
+        migration.migrate_ticket_inbox(apps, None)
+        self.assertEqual(self.get_inbox(ticket), {
+            (self.applicant.id, TicketInboxRole.applicant): (False, TicketState.pending),
+            (self.first.id, TicketInboxRole.assignee): (True, TicketState.pending),
+            (self.second.id, TicketInboxRole.assignee): (True, TicketState.pending),
+        })
+        self.assertEqual(self.get_inbox(closed), {
+            (self.applicant.id, TicketInboxRole.applicant): (False, TicketState.rejected),
+            (self.second.id, TicketInboxRole.assignee): (True, TicketState.rejected),
+        })
+
+        # 重复执行不会产生重复的数据
+        migration.migrate_ticket_inbox(apps, None)
+        self.assertEqual(TicketInbox.objects.filter(ticket__in=[ticket, closed]).count(), 5)
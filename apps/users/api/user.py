@@ -1,6 +1,4 @@
 # ~*~ coding: utf-8 ~*~
-from collections import defaultdict
-
 from django.utils.translation import gettext as _
 from rest_framework import generics
 from rest_framework.decorators import action
@@ -12,7 +10,6 @@ from common.api import CommonApiMixin, SuggestionMixin
 from common.drf.filters import AttrRulesFilterBackend
 from common.utils import get_logger, is_uuid
 from orgs.utils import current_org, tmp_to_root_org
-from rbac.models import Role, RoleBinding
 from rbac.permissions import RBACPermission
 from users.utils import LoginBlockUtil, MFABlockUtils
 from .mixins import UserQuerysetMixin
@@ -74,56 +71,9 @@ class UserViewSet(CommonApiMixin, UserQuerysetMixin, SuggestionMixin, BulkModelV
         放到 paginate_queryset 里面会导致 导出有问题, 因为导出的时候，没有 pager
         """
         if len(args) == 1 and kwargs.get('many'):
-            queryset = self.set_users_roles_for_cache(args[0])
-            queryset = self.set_users_orgs_roles(args[0])
-            args = (queryset,)
+            User.set_users_roles_cache(args[0])
         return super().get_serializer(*args, **kwargs)
 
-    @staticmethod
-    def set_users_roles_for_cache(queryset):
-        # Todo: 未来有机会用 SQL 实现
-        queryset_list = queryset
-        user_ids = [u.id for u in queryset_list]
-        role_bindings = RoleBinding.objects.filter(user__in=user_ids) \
-            .values('user_id', 'role_id', 'scope')
-
-        role_mapper = {r.id: r for r in Role.objects.all()}
-        user_org_role_mapper = defaultdict(set)
-        user_system_role_mapper = defaultdict(set)
-
-        for binding in role_bindings:
-            role_id = binding['role_id']
-            user_id = binding['user_id']
-            if binding['scope'] == RoleBinding.Scope.system:
-                user_system_role_mapper[user_id].add(role_mapper[role_id])
-            else:
-                user_org_role_mapper[user_id].add(role_mapper[role_id])
-
-        for u in queryset_list:
-            system_roles = user_system_role_mapper[u.id]
-            org_roles = user_org_role_mapper[u.id]
-            u.org_roles.cache_set(org_roles)
-            u.system_roles.cache_set(system_roles)
-        return queryset_list
-
-    @staticmethod
-    def set_users_orgs_roles(queryset):
-        user_ids = [u.id for u in queryset]
-        rbs = RoleBinding.objects_raw.filter(
-            user__in=user_ids, scope='org'
-        ).prefetch_related('user', 'role', 'org')
-        user_rbs_mapper = defaultdict(set)
-        for rb in rbs:
-            user_rbs_mapper[rb.user_id].add(rb)
-
-        for u in queryset:
-            user_rbs = user_rbs_mapper[u.id]
-            orgs_roles = defaultdict(set)
-            for rb in user_rbs:
-                orgs_roles[rb.org_name].add(rb.role.display_name)
-            setattr(u, 'orgs_roles', orgs_roles)
-        return queryset
-
     def perform_create(self, serializer):
         users = serializer.save()
         if isinstance(users, User):
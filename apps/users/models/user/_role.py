@@ -1,16 +1,16 @@
 from collections import defaultdict
 
 from django.conf import settings
-from django.core.cache import cache
 from django.db import models
 
+from common.cache import CacheNamespace
 from common.utils import (
     get_logger,
     lazyproperty,
     bulk_create_with_signal,
 )
 from orgs.utils import current_org
-from rbac.const import Scope
+from rbac.const import Scope, org_access_perms
 from rbac.models import RoleBinding
 from users.signals import post_user_leave_org, pre_user_leave_org
 
@@ -186,8 +186,10 @@ class RoleMixin:
     source: str
     _org_roles = None
     _system_roles = None
-    PERM_CACHE_KEY = "USER_PERMS_ROLES_{}_{}"
-    PERM_ORG_KEY = "USER_PERMS_ORG_{}"
+    PERM_CACHE_KEY = "USER_PERMS_ROLES_{}"
+    PERM_ORG_KEY = "USER_PERMS_ORG"
+    # 以用户为 scope, 角色变化时增加版本号即可, 不用扫描 Redis
+    rbac_perms_cache = CacheNamespace("rbac_perms", timeout=60 * 60)
     _is_superuser = None
     _update_superuser = False
 
@@ -229,43 +231,18 @@ class RoleMixin:
     def cached_orgs(self):
         from rbac.models import RoleBinding
 
-        key = self.PERM_ORG_KEY.format(self.id)
-        data = cache.get(key)
-        if data:
+        def compute():
+            perms_orgs = RoleBinding.get_user_perms_orgs(self, org_access_perms.values())
+            data = {name: perms_orgs[perm] for name, perm in org_access_perms.items()}
+            if settings.LIMIT_SUPER_PRIV:
+                data["audit_orgs"] = list(set(data["audit_orgs"]) - set(data["console_orgs"]))
             return data
-        pam_orgs = RoleBinding.get_user_has_the_perm_orgs("rbac.view_pam", self)
-        console_orgs = RoleBinding.get_user_has_the_perm_orgs("rbac.view_console", self)
-        audit_orgs = RoleBinding.get_user_has_the_perm_orgs("rbac.view_audit", self)
-        workbench_orgs = RoleBinding.get_user_has_the_perm_orgs(
-            "rbac.view_workbench", self
-        )
-
-        if settings.LIMIT_SUPER_PRIV:
-            audit_orgs = list(set(audit_orgs) - set(console_orgs))
 
-        data = {
-            "pam_orgs": pam_orgs,
-            "console_orgs": console_orgs,
-            "audit_orgs": audit_orgs,
-            "workbench_orgs": workbench_orgs,
-        }
-        cache.set(key, data, 60 * 60)
-        return data
-
-    @lazyproperty
-    def cached_role_and_perms(self):
-        key = self.PERM_CACHE_KEY.format(self.id, current_org.id)
-        data = cache.get(key)
-        if data:
-            return data
+        return self.rbac_perms_cache.get_or_set(self.PERM_ORG_KEY, compute, scope=self.id)
 
-        data = {
-            "org_roles": self.org_roles.all(),
-            "system_roles": self.system_roles.all(),
-            "perms": self.get_all_permissions(),
-        }
-        cache.set(key, data, 60 * 60)
-        return data
+    def load_perms(self):
+        key = self.PERM_CACHE_KEY.format(current_org.id)
+        return self.rbac_perms_cache.get_or_set(key, self.get_all_permissions, scope=self.id)
 
     @lazyproperty
     def orgs_roles(self):
@@ -277,22 +254,65 @@ class RoleMixin:
             orgs_roles[rb.org_name].add(str(rb.role.display_name))
         return orgs_roles
 
+    @classmethod
+    def set_users_roles_cache(cls, users):
+        """
+        一次聚合查询, 设置一批用户的 system_roles, org_roles (当前组织) 缓存和
+        orgs_roles ({组织名称: 角色名称}), 列表和导出时避免逐个用户查询
+        """
+        from orgs.models import Organization
+        from rbac.models import Role
+
+        users = list(users)
+        mapper = RoleBinding.get_users_role_ids([u.id for u in users])
+        role_ids = set()
+        for item in mapper.values():
+            role_ids.update(item['system'])
+            role_ids.update(role_id for __, role_id in item['orgs'])
+        roles = {str(k): v for k, v in Role.objects.in_bulk(role_ids).items()}
+
+        org_id = None if current_org.is_root() else str(current_org.id)
+        empty = {'system': [], 'orgs': []}
+        for user in users:
+            item = mapper.get(str(user.id), empty)
+            system_roles = {roles[i] for i in item['system'] if i in roles}
+            org_roles = set()
+            orgs_roles = defaultdict(set)
+            for role_org_id, role_id in item['orgs']:
+                role = roles.get(role_id)
+                if not role:
+                    continue
+                if role_org_id == org_id:
+                    org_roles.add(role)
+                org = Organization.get_instance_from_memory(role_org_id)
+                if org:
+                    orgs_roles[org.name].add(str(role.display_name))
+            user.system_roles.cache_set(system_roles)
+            user.org_roles.cache_set(org_roles)
+            user.orgs_roles = orgs_roles
+        return users
+
     def expire_rbac_perms_cache(self):
-        key = self.PERM_CACHE_KEY.format(self.id, "*")
-        cache.delete_pattern(key)
-        key = self.PERM_ORG_KEY.format(self.id)
-        cache.delete(key)
+        from rbac.utils import UserPermsLocalCache
+
+        self.rbac_perms_cache.expire(scope=self.id)
+        UserPermsLocalCache.expire(self.id)
 
     @classmethod
     def expire_users_rbac_perms_cache(cls):
-        key = cls.PERM_CACHE_KEY.format("*", "*")
-        cache.delete_pattern(key)
-        key = cls.PERM_ORG_KEY.format("*")
-        cache.delete_pattern(key)
+        from rbac.utils import UserPermsLocalCache
+
+        cls.rbac_perms_cache.expire()
+        UserPermsLocalCache.expire()
 
     @lazyproperty
     def perms(self):
-        return self.cached_role_and_perms["perms"]
+        """
+        frozenset, 判断权限是常数时间; 进程内缓存, 版本号变化时才重新加载
+        """
+        from rbac.utils import UserPermsLocalCache
+
+        return UserPermsLocalCache.get_perms(self, current_org.id, self.load_perms)
 
     @property
     def is_superuser(self):
@@ -220,7 +220,12 @@ class UserPermsSerializer(serializers.Serializer):
     console_orgs = UserOrgSerializer(many=True, read_only=True)
     audit_orgs = UserOrgSerializer(many=True, read_only=True)
     workbench_orgs = UserOrgSerializer(many=True, read_only=True)
-    perms = serializers.ListField(label=_("Perms"), read_only=True)
+    perms = serializers.SerializerMethodField(label=_("Perms"))
+
+    @staticmethod
+    def get_perms(obj) -> list:
+        # User.perms 是 frozenset, 排序后返回稳定的结果
+        return sorted(obj.perms)
 
     def create(self, validated_data):
         pass
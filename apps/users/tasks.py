@@ -149,6 +149,8 @@ def check_unused_users():
         print('  - {}'.format(user.name))
 
     users.update(is_active=False)
+    from authentication.backends.drf import CredentialCache
+    CredentialCache.expire_users(resource_ids)
     from audits.signal_handlers import create_activities
     if current_task:
         task_id = current_task.request.id
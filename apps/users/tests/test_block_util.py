@@ -0,0 +1,93 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import SimpleTestCase, override_settings
+
+from common.utils import random_string
+from common.utils.rate_limit import SlidingWindowCounter
+from users.utils import LoginBlockUtil, LoginIpBlockUtil
+
+
+class SlidingWindowCounterTests(SimpleTestCase):
+    """
+    并发计数压测, 计数不丢失, 每次返回的计数都不相同
+    """
+    workers = 32
+    times = 500
+
+    def setUp(self):
+        self.key = 'test_rate_limit_' + random_string(8)
+        self.counter = SlidingWindowCounter()
+
+    def tearDown(self):
+        self.counter.reset(self.key)
+
+    def test_concurrent_incr(self):
+        def incr(__):
+            return SlidingWindowCounter().incr({self.key: 60})[self.key]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            counts = list(executor.map(incr, range(self.times)))
+        self.assertEqual(sorted(counts), list(range(1, self.times + 1)))
+        self.assertEqual(self.counter.count(self.key, 60), self.times)
+
+
+@override_settings(
+    SECURITY_LOGIN_LIMIT_COUNT=10, SECURITY_LOGIN_LIMIT_TIME=30,
+    SECURITY_LOGIN_USER_LIMIT_COUNT=0,
+    SECURITY_LOGIN_IP_LIMIT_COUNT=100, SECURITY_LOGIN_IP_LIMIT_TIME=30,
+    SECURITY_LOGIN_IP_WHITE_LIST=[], SECURITY_LOGIN_IP_BLACK_LIST=[],
+)
+class LoginBlockUtilTests(SimpleTestCase):
+    workers = 32
+
+    def setUp(self):
+        self.username = 'test_' + random_string(8).lower()
+        self.ip = '10.0.{}.{}'.format(random.randint(0, 255), random.randint(1, 254))
+
+    def tearDown(self):
+        LoginBlockUtil.unblock_user(self.username)
+        LoginIpBlockUtil(self.ip).clean_block_if_need()
+
+    def concurrent(self, func, times):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(lambda __: func(), range(times)))
+
+    def test_concurrent_failed_count(self):
+        self.concurrent(lambda: LoginBlockUtil(self.username, self.ip).incr_failed_count(), 9)
+        util = LoginBlockUtil(self.username, self.ip)
+        self.assertEqual(util.get_failed_count(), 9)
+        self.assertFalse(util.is_block())
+
+        util.incr_failed_count()
+        self.assertTrue(util.is_block())
+        self.assertIn(self.username, LoginBlockUtil.get_blocked_usernames())
+
+        LoginBlockUtil.unblock_user(self.username)
+        self.assertFalse(util.is_block())
+        self.assertEqual(LoginBlockUtil(self.username, self.ip).get_failed_count(), 0)
+        self.assertNotIn(self.username, LoginBlockUtil.get_blocked_usernames())
+
+    @override_settings(SECURITY_LOGIN_USER_LIMIT_COUNT=20)
+    def test_user_limit_across_ips(self):
+        ips = ['10.1.0.{}'.format(i) for i in range(5)]
+        for ip in ips:
+            for __ in range(3):
+                LoginBlockUtil(self.username, ip).incr_failed_count()
+        self.assertFalse(LoginBlockUtil.is_user_block(self.username))
+
+        self.concurrent(lambda: LoginBlockUtil(self.username, ips[0]).incr_failed_count(), 5)
+        self.assertTrue(LoginBlockUtil.is_user_block(self.username))
+
+    def test_concurrent_ip_block(self):
+        self.concurrent(lambda: LoginIpBlockUtil(self.ip).set_block_if_need(), 99)
+        util = LoginIpBlockUtil(self.ip)
+        self.assertFalse(util.is_block())
+
+        util.set_block_if_need()
+        self.assertTrue(util.is_block())
+        self.assertIn(self.ip, LoginIpBlockUtil.get_blocked_ips())
+
+        util.clean_block_if_need()
+        self.assertFalse(util.is_block())
+        self.assertNotIn(self.ip, LoginIpBlockUtil.get_blocked_ips())
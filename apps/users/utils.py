@@ -12,8 +12,11 @@ from django.conf import settings
 from django.core.cache import cache
 from django.utils import translation
 
+from common.cache import CacheNamespace
 from common.tasks import send_mail_async
 from common.utils import reverse, get_object_or_none, ip, safe_next_url
+from common.utils.connection import get_redis_client
+from common.utils.rate_limit import SlidingWindowCounter
 from .models import User
 
 logger = logging.getLogger('jumpserver.users')
@@ -128,18 +131,55 @@ class BlockUtil:
         return bool(cache.get(self.block_key))
 
 
-class BlockUtilBase:
+class BlockedIndexMixin:
+    # 被锁定的用户名或 ip 的索引 (sorted set, score 为过期时间), 避免 keys 扫描
+    BLOCKED_INDEX_KEY: str
+
+    @classmethod
+    def add_to_blocked_index(cls, member, ttl):
+        get_redis_client().zadd(cls.BLOCKED_INDEX_KEY, {member: time.time() + ttl})
+
+    @classmethod
+    def remove_from_blocked_index(cls, member):
+        get_redis_client().zrem(cls.BLOCKED_INDEX_KEY, member)
+
+    @classmethod
+    def get_blocked_members(cls):
+        client = get_redis_client()
+        client.zremrangebyscore(cls.BLOCKED_INDEX_KEY, '-inf', time.time())
+        members = client.zrange(cls.BLOCKED_INDEX_KEY, 0, -1)
+        return [m.decode() for m in members]
+
+
+class BlockUtilBase(BlockedIndexMixin):
+    """
+    登录失败计数, 使用 Redis 滑动窗口原子计数
+
+    - 用户名 + ip: 达到 SECURITY_LOGIN_LIMIT_COUNT 锁定用户
+    - 用户名 (所有 ip): 达到 SECURITY_LOGIN_USER_LIMIT_COUNT 锁定用户, 为 0 时不限制
+    - ip 维度由 BlockGlobalIpUtilBase 计数
+    """
     LIMIT_KEY_TMPL: str
+    USER_LIMIT_KEY_TMPL: str
     BLOCK_KEY_TMPL: str
 
     def __init__(self, username, ip):
         username = username.lower() if username else ''
         self.username = username
         self.ip = ip
-        self.limit_key = self.LIMIT_KEY_TMPL.format(username, ip)
+        self.limit_key = self.get_limit_cache().make_key(
+            self.LIMIT_KEY_TMPL.format(username, ip), scope=username
+        )
+        self.user_limit_key = self.USER_LIMIT_KEY_TMPL.format(username)
         self.block_key = self.BLOCK_KEY_TMPL.format(username)
         self.key_ttl = int(settings.SECURITY_LOGIN_LIMIT_TIME) * 60
 
+    @classmethod
+    def get_limit_cache(cls):
+        # 以用户名为 scope, 解锁时增加版本号即可让该用户所有 ip 的计数失效
+        timeout = int(settings.SECURITY_LOGIN_LIMIT_TIME) * 60
+        return CacheNamespace(cls.__name__, timeout=timeout)
+
     def get_remainder_times(self):
         times_up = settings.SECURITY_LOGIN_LIMIT_COUNT
         times_failed = self.get_failed_count()
@@ -147,32 +187,38 @@ class BlockUtilBase:
         return times_remainder
 
     def incr_failed_count(self) -> int:
-        limit_key = self.limit_key
-        count = cache.get(limit_key, 0)
-        count += 1
-        cache.set(limit_key, count, self.key_ttl)
-
+        counts = SlidingWindowCounter().incr({
+            self.limit_key: self.key_ttl,
+            self.user_limit_key: self.key_ttl,
+        })
+        count = counts[self.limit_key]
         limit_count = settings.SECURITY_LOGIN_LIMIT_COUNT
-        if count >= limit_count:
-            cache.set(self.block_key, True, self.key_ttl)
+        user_limit_count = settings.SECURITY_LOGIN_USER_LIMIT_COUNT
+        if count >= limit_count or \
+                (user_limit_count and counts[self.user_limit_key] >= user_limit_count):
+            self.block()
         return limit_count - count
 
+    def block(self):
+        cache.set(self.block_key, True, self.key_ttl)
+        self.add_to_blocked_index(self.username, self.key_ttl)
+
     def get_failed_count(self):
-        count = cache.get(self.limit_key, 0)
-        return count
+        return SlidingWindowCounter().count(self.limit_key, self.key_ttl)
 
     def clean_failed_count(self):
-        cache.delete(self.limit_key)
+        SlidingWindowCounter().reset(self.limit_key, self.user_limit_key)
         cache.delete(self.block_key)
+        self.remove_from_blocked_index(self.username)
 
     @classmethod
     def unblock_user(cls, username):
         username = username.lower()
-        key_limit = cls.LIMIT_KEY_TMPL.format(username, '*')
         key_block = cls.BLOCK_KEY_TMPL.format(username)
-        # Redis 尽量不要用通配
-        cache.delete_pattern(key_limit)
+        cls.get_limit_cache().expire(scope=username)
+        SlidingWindowCounter().reset(cls.USER_LIMIT_KEY_TMPL.format(username))
         cache.delete(key_block)
+        cls.remove_from_blocked_index(username)
 
     @classmethod
     def is_user_block(cls, username):
@@ -185,12 +231,10 @@ class BlockUtilBase:
 
     @classmethod
     def get_blocked_usernames(cls):
-        key = cls.BLOCK_KEY_TMPL.format('*')
-        keys = cache.keys(key)
-        return [k.split('_')[-1] for k in keys]
+        return cls.get_blocked_members()
 
 
-class BlockGlobalIpUtilBase:
+class BlockGlobalIpUtilBase(BlockedIndexMixin):
     LIMIT_KEY_TMPL: str
     BLOCK_KEY_TMPL: str
 
@@ -211,18 +255,17 @@ class BlockGlobalIpUtilBase:
     def set_block_if_need(self):
         if self.ip_in_white_list or self.ip_in_black_list:
             return
-        count = cache.get(self.limit_key, 0)
-        count += 1
-        cache.set(self.limit_key, count, self.key_ttl)
-
+        counts = SlidingWindowCounter().incr({self.limit_key: self.key_ttl})
         limit_count = settings.SECURITY_LOGIN_IP_LIMIT_COUNT
-        if count < limit_count:
+        if counts[self.limit_key] < limit_count:
             return
         cache.set(self.block_key, True, self.key_ttl)
+        self.add_to_blocked_index(self.ip, self.key_ttl)
 
     def clean_block_if_need(self):
-        cache.delete(self.limit_key)
+        SlidingWindowCounter().reset(self.limit_key)
         cache.delete(self.block_key)
+        self.remove_from_blocked_index(self.ip)
 
     def is_block(self):
         if self.ip_in_white_list:
@@ -231,20 +274,29 @@ class BlockGlobalIpUtilBase:
             return True
         return bool(cache.get(self.block_key))
 
+    @classmethod
+    def get_blocked_ips(cls):
+        return cls.get_blocked_members()
+
 
 class LoginBlockUtil(BlockUtilBase):
     LIMIT_KEY_TMPL = "_LOGIN_LIMIT_{}_{}"
+    USER_LIMIT_KEY_TMPL = "_LOGIN_LIMIT_USER_{}"
     BLOCK_KEY_TMPL = "_LOGIN_BLOCK_{}"
+    BLOCKED_INDEX_KEY = "_LOGIN_BLOCKED_USERNAMES"
 
 
 class MFABlockUtils(BlockUtilBase):
     LIMIT_KEY_TMPL = "_MFA_LIMIT_{}_{}"
+    USER_LIMIT_KEY_TMPL = "_MFA_LIMIT_USER_{}"
     BLOCK_KEY_TMPL = "_MFA_BLOCK_{}"
+    BLOCKED_INDEX_KEY = "_MFA_BLOCKED_USERNAMES"
 
 
 class LoginIpBlockUtil(BlockGlobalIpUtilBase):
     LIMIT_KEY_TMPL = "_LOGIN_LIMIT_{}"
     BLOCK_KEY_TMPL = "_LOGIN_BLOCK_IP_{}"
+    BLOCKED_INDEX_KEY = "_LOGIN_BLOCKED_IPS"
 
 
 def validate_emails(emails):